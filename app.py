@@ -9,12 +9,17 @@ from flask import Flask
 from flask_migrate import Migrate
 from core.db import db, initialize_db
 from core.authen import bp as auth
+from core.compression import init_compression
 from routes import api
 from waitress import serve
 
-def create_app(environment: str = "prod") -> Flask:
+# waitress worker threads, logins hashing or waiting for a hash slot hold at most
+# KDF_CONCURRENCY + KDF_MAX_WAITING (4 by default) of them, the rest keep serving the api
+WAITRESS_THREADS = 8
+
+def create_app(environment: str = "prod", config: dict = None) -> Flask:
     """
-    Factory used to create an App
+    Factory used to create an App, config overrides the environment's settings
     """
     app = Flask(__name__)
     if environment == "test":
@@ -25,12 +30,15 @@ def create_app(environment: str = "prod") -> Flask:
     if environment == "prod":
         app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///ipam_restx.db"
         app.config["MASTER_APIKEY"] = os.getenv("MASTER_APIKEY")
+        app.config["TOKEN_SECRET_KEY"] = os.getenv("TOKEN_SECRET_KEY")
 
+    app.config.update(config or {})
     db.init_app(app)
-    Migrate(app, db)
+    Migrate(app, db, render_as_batch=True)
     initialize_db(app, admin_pw=app.config["MASTER_APIKEY"])
     app.register_blueprint(auth)
     api.init_app(app)
+    init_compression(app)
 
     @app.route("/health_check")
     def health_check():
@@ -41,4 +49,4 @@ def create_app(environment: str = "prod") -> Flask:
 
 if __name__ == "__main__":
     app = create_app(environment="prod")
-    serve(app, host="0.0.0.0", port=8080)
+    serve(app, host="0.0.0.0", port=8080, threads=WAITRESS_THREADS)
@@ -9,7 +9,7 @@ import click
 import logging
 import requests
 import yaml
-from ipaddress import IPv4Network, IPv4Address, AddressValueError
+from ipaddress import ip_address, ip_network
 from pprint import pprint
 
 # These three env variables must be set
@@ -36,6 +36,20 @@ def print_yaml(data):
     yaml_data = yaml.dump(data, default_flow_style=False, sort_keys=False)
     print(yaml_data)
 
+def get_all_pages(url: str):
+    """
+    GETs a CRUD listing, following the X-Next-Cursor header until every page is read
+    returns the last response and the data of every page
+    """
+    response = requests.get(url, headers=BASE_HEADERS)
+    data = response.json().get("data") if response.status_code == 200 else None
+    while response.status_code == 200 and response.headers.get("X-Next-Cursor"):
+        response = requests.get(url, headers=BASE_HEADERS,
+                                params={"after": response.headers["X-Next-Cursor"]})
+        if response.status_code == 200:
+            data += response.json().get("data")
+    return response, data
+
 def default_failed_response(added_response:str=""):
     response = f"Something went wrong, please validate your inputs and try again. {added_response}"
     print(response)
@@ -89,6 +103,43 @@ def address():
     Access the menu for CRUD operations for addresses
     """
 
+@ipam_crud.command(name="import")
+@click.option("--type", "type_", help="Kind of rows in the file", type=click.Choice(["supernet", "subnet", "address"]), required=True)
+@click.option("--file", "file_", help="JSON lines file, or a .csv file with a header line", type=click.Path(exists=True, dir_okay=False), required=True)
+def import_rows(type_: str, file_: str) -> None:
+    """
+    /api/v1/import/<type> POST
+    Bulk import supernets, subnets or addresses from a file
+    """
+    headers = dict(BASE_HEADERS)
+    headers["Content-type"] = "text/csv" if file_.endswith(".csv") else "application/x-ndjson"
+    with open(file_, "rb") as body:
+        response = requests.post(f"{BASE_URL}/api/v1/import/{type_}", headers=headers, data=body).json()
+    if response.get("data"):
+        print(f'{response["data"]["imported"]} rows imported, {response["data"]["failed"]} failed')
+    if response.get("errors"):
+        print("The following error(s) occured:")
+        for error in response.get("errors"):
+            print(error)
+
+@ipam_crud.command(name="export")
+@click.option("--file", "file_", help="File to write the NDJSON export to", type=click.Path(dir_okay=False), required=True)
+@click.option("--gzip", "gzip_", help="If true, write the export gzip compressed", type=click.BOOL, default=False, is_flag=True, show_default=True)
+def export_rows(file_: str, gzip_: bool) -> None:
+    """
+    /api/v1/export GET
+    Write every vrf, supernet, subnet and address to a file
+    """
+    params = {"compress": "gzip"} if gzip_ else {}
+    with requests.get(f"{BASE_URL}/api/v1/export", headers=BASE_HEADERS, params=params, stream=True) as response:
+        if response.status_code != 200:
+            default_failed_response()
+            exit()
+        with open(file_, "wb") as out:
+            for chunk in response.raw.stream(65536, decode_content=False):
+                out.write(chunk)
+    print(f"export written to {file_}")
+
 @rpc.command("get_usable_subnet")
 @click.option("--vrf", help="Target VRF of the supernet you want an subnet from, must also include network", default="Global", show_default=True)
 @click.option("--network", help="Target supernet CIDR prefix you want an address from, must also include VRF")
@@ -96,7 +147,8 @@ def address():
 @click.option("--name", help="name of the supernet you want an subnet from, can be only arg")
 @click.option("--cidr_length", help="CIDR prefix length of the subnet you want", type=click.INT)
 @click.option("--all", help="If true, recieve all available subnets within the supernet at the request cidr_length", type=click.BOOL, default=False, is_flag=True, show_default=True)
-def get_usable_subnet(vrf: str, network: str, id: int, name: str, cidr_length: int, all: bool) -> None:
+@click.option("--ranges", help="If true, recieve available subnets as [first, last] blocks", type=click.BOOL, default=False, is_flag=True, show_default=True)
+def get_usable_subnet(vrf: str, network: str, id: int, name: str, cidr_length: int, all: bool, ranges: bool) -> None:
     """
     /api/v1/rpc/getUsableSubnet
     Given a supernet, will return usable subnets at the requested cidr_length
@@ -105,9 +157,9 @@ def get_usable_subnet(vrf: str, network: str, id: int, name: str, cidr_length: i
     q_params = ""
     if vrf and network:
         try: 
-            IPv4Network(network)
-        except AddressValueError:
-            print("Provided network is not in correct format, example - 192.168.0.0/16")
+            ip_network(network)
+        except ValueError:
+            print("Provided network is not in correct format, example - 192.168.0.0/16 or 2001:db8::/48")
             exit()
         q_params = f"?network={network}&vrf={vrf}"
     elif id:
@@ -122,6 +174,8 @@ def get_usable_subnet(vrf: str, network: str, id: int, name: str, cidr_length: i
         exit()
     q_params += f"&cidr_length={cidr_length}"
     q_params += f"&all={all}"
+    if ranges:
+        q_params += "&format=ranges"
     print(q_params)
     response = requests.get(f"{BASE_URL}/api/v1/rpc/getUsableSubnet{q_params}", headers=BASE_HEADERS).json()
     if response.get("errors"):
@@ -136,7 +190,8 @@ def get_usable_subnet(vrf: str, network: str, id: int, name: str, cidr_length: i
 @click.option("--network", help="Target subnet CIDR prefix you want an address from, must also include VRF")
 @click.option("--id", help="ID of the subnet you want an address from, can be only arg")
 @click.option("--name", help="name of the subnet you want an address from, can be only arg")
-def get_usable_address(vrf: str, network: str, id: int, name: str) -> None:
+@click.option("--ranges", help="If true, recieve available addresses as [start, end] blocks", type=click.BOOL, default=False, is_flag=True, show_default=True)
+def get_usable_address(vrf: str, network: str, id: int, name: str, ranges: bool) -> None:
     """
     /api/v1/rpc/getUsableAddress
     Given a subnet will return first usable and all available subnets
@@ -145,9 +200,9 @@ def get_usable_address(vrf: str, network: str, id: int, name: str) -> None:
     q_params = ""
     if vrf and network:
         try: 
-            IPv4Network(network)
-        except AddressValueError:
-            print("Provided network is not in correct format, example - 192.168.0.0/16")
+            ip_network(network)
+        except ValueError:
+            print("Provided network is not in correct format, example - 192.168.0.0/16 or 2001:db8::/48")
             exit()
         q_params = f"?network={network}&vrf={vrf}"
     elif id:
@@ -157,7 +212,9 @@ def get_usable_address(vrf: str, network: str, id: int, name: str) -> None:
     else:
         print("Must provide name, id, or vrf+network")
         exit()
-    
+    if ranges:
+        q_params += "&format=ranges"
+
     response = requests.get(f"{BASE_URL}/api/v1/rpc/getUsableAddresses{q_params}", headers=BASE_HEADERS).json()
     if response.get("errors"):
         print("The following error(s) occured:")
@@ -166,6 +223,46 @@ def get_usable_address(vrf: str, network: str, id: int, name: str) -> None:
     else:
         print_yaml(response.get("data"))
 
+@rpc.command("allocate_address")
+@click.option("--vrf", help="Target VRF of the subnet you want an address from, must also include network")
+@click.option("--network", help="Target subnet CIDR prefix you want an address from, must also include VRF")
+@click.option("--id", help="ID of the subnet you want an address from, can be only arg")
+@click.option("--subnet-name", help="name of the subnet you want an address from, can be only arg")
+@click.option("--name", help="Name associated with the new address", required=True)
+@click.option("--mac-address", help="MAC address associated with the new address")
+def allocate_address(vrf: str, network: str, id: int, subnet_name: str, name: str, mac_address: str) -> None:
+    """
+    /api/v1/rpc/allocateAddress
+    Given a subnet will create the next free address in it
+    Must include vrf + network || id || subnet-name
+    """
+    q_params = ""
+    if vrf and network:
+        try: 
+            ip_network(network)
+        except ValueError:
+            print("Provided network is not in correct format, example - 192.168.0.0/16 or 2001:db8::/48")
+            exit()
+        q_params = f"?network={network}&vrf={vrf}"
+    elif id:
+        q_params = f"?id={id}"
+    elif subnet_name:
+        q_params = f"?name={subnet_name}"
+    else:
+        print("Must provide subnet-name, id, or vrf+network")
+        exit()
+    request_body = {"name": name}
+    if mac_address:
+        request_body["mac_address"] = mac_address
+
+    response = requests.post(f"{BASE_URL}/api/v1/rpc/allocateAddress{q_params}", headers=BASE_HEADERS, json=request_body).json()
+    if response.get("errors"):
+        print("The following error(s) occured:")
+        for error in response.get("errors"):
+            print(error)
+    else:
+        print_yaml(response.get("data"))
+
 
 @address.command("delete")
 @click.option("--name", help="Delete address with this name")
@@ -208,11 +305,11 @@ def get_address(vrf_name, name:str, id:int) -> None:
         q_params = f"?id={id}"
     elif vrf_name:
         q_params = f"?vrf={vrf_name}"
-    response = requests.get(f"{BASE_URL}/api/v1/address{q_params}", headers=BASE_HEADERS)
+    response, data = get_all_pages(f"{BASE_URL}/api/v1/address{q_params}")
     if response.status_code != 200:
         default_failed_response()
         exit()
-    print_yaml(response.json().get("data"))
+    print_yaml(data)
 
 @address.command(name="create")
 @click.option("--vrf-name", help="VRF this address is attached to", default="Global", show_default=True)
@@ -224,9 +321,9 @@ def create_address(vrf_name:str, address:str, name:str) -> None:
     Add a address
     """
     try:
-        IPv4Address(address)
-    except AddressValueError:
-        print("Provided address is not in correct format, example - 192.168.10.10")
+        ip_address(address)
+    except ValueError:
+        print("Provided address is not in correct format, example - 192.168.10.10 or 2001:db8::10")
         exit()
     request_body = {"address": address, "name": name, "vrf": vrf_name}
     response = requests.post(f"{BASE_URL}/api/v1/address", headers=BASE_HEADERS, json=request_body).json()
@@ -279,11 +376,11 @@ def get_subnet(vrf_name, name:str, id:int) -> None:
         q_params = f"?id={id}"
     elif vrf_name:
         q_params = f"?vrf={vrf_name}"
-    response = requests.get(f"{BASE_URL}/api/v1/subnet{q_params}", headers=BASE_HEADERS)
+    response, data = get_all_pages(f"{BASE_URL}/api/v1/subnet{q_params}")
     if response.status_code != 200:
         default_failed_response()
         exit()
-    print_yaml(response.json().get("data"))
+    print_yaml(data)
 
 @subnet.command(name="create")
 @click.option("--vrf-name", help="VRF this subnet is attached to", default="Global", show_default=True)
@@ -295,9 +392,9 @@ def create_subnet(vrf_name:str, network:str, name:str) -> None:
     Add a subnet
     """
     try:
-        IPv4Network(network)
-    except AddressValueError:
-        print("Provided network is not in correct format, example - 192.168.0.0/16")
+        ip_network(network)
+    except ValueError:
+        print("Provided network is not in correct format, example - 192.168.0.0/16 or 2001:db8::/48")
         exit()
     request_body = {"network": network, "name": name, "vrf": vrf_name}
     response = requests.post(f"{BASE_URL}/api/v1/subnet", headers=BASE_HEADERS, json=request_body).json()
@@ -350,11 +447,11 @@ def get_supernet(vrf_name, name:str, id:int) -> None:
         q_params = f"?id={id}"
     elif vrf_name:
         q_params = f"?vrf={vrf_name}"
-    response = requests.get(f"{BASE_URL}/api/v1/supernet{q_params}", headers=BASE_HEADERS)
+    response, data = get_all_pages(f"{BASE_URL}/api/v1/supernet{q_params}")
     if response.status_code != 200:
         default_failed_response()
         exit()
-    print_yaml(response.json().get("data"))
+    print_yaml(data)
 
 @supernet.command(name="create")
 @click.option("--vrf-name", help="VRF this supernet is attached to", default="Global", show_default=True)
@@ -366,9 +463,9 @@ def create_supernet(vrf_name:str, network:str, name:str) -> None:
     Add a supernet
     """
     try:
-        IPv4Network(network)
-    except AddressValueError:
-        print("Provided network is not in correct format, example - 192.168.0.0/16")
+        ip_network(network)
+    except ValueError:
+        print("Provided network is not in correct format, example - 192.168.0.0/16 or 2001:db8::/48")
         exit()
     request_body = {"network": network, "name": name, "vrf": vrf_name}
     response = requests.post(f"{BASE_URL}/api/v1/supernet", headers=BASE_HEADERS, json=request_body).json()
@@ -417,11 +514,11 @@ def get_vrf(vrf_name: str, id: int) -> None:
         q_params = f"?name={vrf_name}"
     elif id:
         q_params = f"?id={id}"
-    response = requests.get(f"{BASE_URL}/api/v1/vrf{q_params}", headers=BASE_HEADERS)
+    response, data = get_all_pages(f"{BASE_URL}/api/v1/vrf{q_params}")
     if response.status_code != 200:
         default_failed_response()
         exit()
-    print_yaml(response.json().get("data"))
+    print_yaml(data)
 
 @vrf.command(name="create")
 @click.option("--vrf-name", help="name of the vrf you'd like to create", required=True, type=click.STRING)
@@ -0,0 +1,88 @@
+"""
+Author: James Duvall
+Purpose: Process-local TTL cache of verified apikeys, so apikey_validate only
+    reaches the database the first time a key is seen within the TTL
+    Entries are keyed by the apikey's digest, the plaintext apikey is never kept
+    The /auth routes that change a user drop that user's keys, other processes
+    serving the same database catch up once their entries expire
+"""
+from threading import Lock
+from time import monotonic
+from typing import NamedTuple, Optional
+from flask import current_app
+
+# Seconds an apikey is trusted without a lookup, overridden by the APIKEY_CACHE_TTL config key
+APIKEY_CACHE_TTL = 60
+# Most apikeys kept at once, overridden by the APIKEY_CACHE_SIZE config key
+APIKEY_CACHE_SIZE = 10000
+
+_lock = Lock()
+
+
+class CachedKey(NamedTuple):
+    """
+    What apikey_validate needs to know about the owner of an apikey
+    """
+    user_id: int
+    username: str
+    permission_level: int
+    apikey_expiration: object
+    cached_until: float
+
+
+def _cache() -> dict:
+    with _lock:
+        return current_app.extensions.setdefault("ipam_apikey_cache", {
+            "keys": {}, "hits": 0, "misses": 0,
+        })
+
+
+def cached_apikey(digest: str) -> Optional[CachedKey]:
+    """
+    Returns the cached entry of an apikey digest, or None when it has to be looked up
+    counts the hit or miss
+    """
+    cache = _cache()
+    with _lock:
+        entry = cache["keys"].get(digest)
+        if entry is not None and entry.cached_until <= monotonic():
+            del cache["keys"][digest]
+            entry = None
+        cache["hits" if entry is not None else "misses"] += 1
+        return entry
+
+
+def cache_apikey(digest: str, user) -> CachedKey:
+    """
+    Caches what apikey_validate reads from the user owning the apikey digest
+    the oldest entry is dropped once the cache is full
+    """
+    cache = _cache()
+    entry = CachedKey(user.id, user.username, user.permission_level, user.apikey_expiration,
+                      monotonic() + current_app.config.get("APIKEY_CACHE_TTL", APIKEY_CACHE_TTL))
+    with _lock:
+        keys = cache["keys"]
+        keys.pop(digest, None)
+        while keys and len(keys) >= current_app.config.get("APIKEY_CACHE_SIZE", APIKEY_CACHE_SIZE):
+            del keys[next(iter(keys))]
+        keys[digest] = entry
+    return entry
+
+
+def invalidate_user(username: str) -> None:
+    """
+    Drops every cached apikey of a user, called after the user changes
+    """
+    cache = _cache()
+    with _lock:
+        for digest in [key for key, entry in cache["keys"].items() if entry.username == username]:
+            del cache["keys"][digest]
+
+
+def apikey_cache_stats() -> dict:
+    """
+    Returns the hit and miss counters and the number of cached apikeys
+    """
+    cache = _cache()
+    with _lock:
+        return {"hits": cache["hits"], "misses": cache["misses"], "size": len(cache["keys"])}
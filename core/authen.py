@@ -9,13 +9,16 @@ Caveat: This was created for learning purposes, authentication is rolled
 from datetime import datetime, timedelta, timezone
 from typing import Callable
 from functools import wraps
-from secrets import token_urlsafe
 from flask import Blueprint, Response, request, current_app, jsonify
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import UnmappedInstanceError
-from werkzeug.security import generate_password_hash, check_password_hash
-from models.user import User
+from models.user import User, apikey_digest
 from core.db import db
+from core.kdf import KDFBusy, check_password, hash_password, kdf_limiter, kdf_retry_after
+from core.ratelimit import rate_limiter
+from core.apikeycache import apikey_cache_stats, cache_apikey, cached_apikey, invalidate_user
+from core.signedtokens import (is_signed_token, issue_signed_token, revocation_count, revoke_signed_tokens,
+                               verify_signed_token)
 
 
 bp = Blueprint(name="auth", import_name=__name__, url_prefix="/auth")
@@ -53,11 +56,15 @@ def validate_user_json(keys_: list) -> Callable:
     return decorator
 
 
-def apikey_validate(permission_level: int) -> Callable:
+def apikey_validate(permission_level: int, cost=1) -> Callable:
     """
     Decorator that validates the user has a valid apikey, and the
     user has sufficent permissions to use the API.
     Will be used by all api calls, each requiring specific permission levels
+    Verified apikeys are cached, see core.apikeycache, signed tokens
+    are checked without the database, see core.signedtokens
+    Requests are then rate limited, taking cost tokens, an int or a function
+    of the request returning one, see core.ratelimit
     """
     def decorator(func):
         @wraps(func)
@@ -67,14 +74,26 @@ def apikey_validate(permission_level: int) -> Callable:
                     "status": "Failed",
                     "errors": ["No X-Ipam-Apikey header set"]
                 }, 400
-            target_user = db.session.query(User).filter_by(
-                apikey=request.headers.get("X-Ipam-Apikey")).first()
-            if not target_user:
-                return {
-                    "status": "Failed",
-                    "errors": ["No user found with provided X-Ipam-Apikey, auth failed"]
-                }, 401
-            
+            apikey = request.headers.get("X-Ipam-Apikey")
+            if is_signed_token(apikey):
+                target_user = verify_signed_token(apikey)
+                if target_user is None:
+                    return {
+                        "status": "Failed",
+                        "errors": ["Signed token is invalid or revoked, auth failed"]
+                    }, 401
+            else:
+                digest = apikey_digest(apikey)
+                target_user = cached_apikey(digest)
+                if target_user is None:
+                    user = User.by_apikey(db.session, apikey)
+                    if not user:
+                        return {
+                            "status": "Failed",
+                            "errors": ["No user found with provided X-Ipam-Apikey, auth failed"]
+                        }, 401
+                    target_user = cache_apikey(digest, user)
+
             if target_user.apikey_expiration <= datetime.now():
                 return {
                     "status": "Failed",
@@ -87,7 +106,26 @@ def apikey_validate(permission_level: int) -> Callable:
                     "status": "Failed",
                     "errors": ["User does not have sufficient permission"]
                 }, 403
-            return func(*args, **kwargs)
+
+            limiter = rate_limiter()
+            retry_after = limiter.acquire(target_user.user_id, target_user.permission_level,
+                                          cost(request) if callable(cost) else cost, current_app.config)
+            if retry_after is not None:
+                return {
+                    "status": "Failed",
+                    "errors": ["Rate limit exceeded, retry after the Retry-After header's seconds"]
+                }, 429, {"Retry-After": str(retry_after)}
+            try:
+                response = func(*args, **kwargs)
+            except BaseException:
+                limiter.release(target_user.user_id)
+                raise
+            if isinstance(response, Response) and response.is_streamed:
+                # Streams do their work after the view returns, they hold the slot until closed
+                response.call_on_close(lambda: limiter.release(target_user.user_id))
+            else:
+                limiter.release(target_user.user_id)
+            return response
 
         return validate_apikey
 
@@ -119,13 +157,28 @@ def users(username: str=None) -> Response:
         "errors": ["No username provided"]
     }), 400
 
+@bp.route("/stats", strict_slashes=False)
+@apikey_validate(permission_level=15)
+def stats() -> Response:
+    """
+    Returns the apikey cache, signed token, KDF queue and rate limit counters of this process
+    """
+    return jsonify({
+        "data": {
+            "apikey_cache": apikey_cache_stats(),
+            "signed_token_revocations": revocation_count(),
+            "kdf": kdf_limiter().stats(),
+            "rate_limit": rate_limiter().stats()
+        }
+    }), 200
+
 ##### POST Only Routes #####
 @bp.route("/login", methods=["POST"])
 @validate_user_json(keys_=["username", "password"])
 def login() -> Response:
     """
     Allows the user to login with their credentials and be returned their 
-    respective API token
+    respective API token, or a signed token when token_type is "signed"
     """
     user_data = request.get_json()
     user = db.session.query(User).filter_by(
@@ -140,16 +193,41 @@ def login() -> Response:
             "status": "Failed",
             "errors": ["User not yet activated, please reach out to your administrator"]
         }), 403
-    if user and check_password_hash(user.password_hash, user_data.get('password')):
-        user.apikey = token_urlsafe(16)
+    try:
+        password_matches = check_password(user.password_hash, user_data.get('password'))
+    except KDFBusy:
+        return jsonify({
+            "status": "Failed",
+            "errors": ["Unable to check the password, too many logins in progress, retry shortly"]
+        }), 503, kdf_retry_after()
+    if password_matches:
+        if user_data.get("token_type") == "signed":
+            try:
+                token, expiration = issue_signed_token(user)
+            except LookupError as error:
+                return jsonify({
+                    "status": "Failed",
+                    "errors": [str(error)]
+                }), 400
+            return jsonify({
+                "status": "Success",
+                "data": {
+                    "X-Ipam-Apikey": token,
+                    "expiration": expiration,
+                    "permission_level": user.permission_level
+                }
+            }), 200
+        apikey = user.issue_apikey()
         user.apikey_expiration = datetime.now(
             tz=timezone.utc) + timedelta(days=1)
         db.session.add(user)
         db.session.commit()
+        # The previous apikey stops working, here and once other processes' entries expire
+        invalidate_user(user.username)
         return jsonify({
             "status": "Success",
             "data": {
-                "X-Ipam-Apikey": user.apikey,
+                "X-Ipam-Apikey": apikey,
                 "expiration": user.apikey_expiration,
                 "permission_level": user.permission_level
             }
@@ -169,9 +247,15 @@ def register() -> Response:
     Requires that the requestor has the master key 
     """
     user_data = request.get_json()
+    try:
+        password_hash = hash_password(user_data['password'])
+    except KDFBusy:
+        return jsonify({
+            "status": "Failed",
+            "errors": ["Unable to hash the password, too many logins in progress, retry shortly"]
+        }), 503, kdf_retry_after()
     new_user = User(username=user_data['username'],
-                    password_hash=generate_password_hash(
-                        user_data['password'])
+                    password_hash=password_hash
                     )
     db.session.add(new_user)
     try:
@@ -206,6 +290,8 @@ def authorize() -> Response:
     user.permission_level = user_data.get("permission_level")
     db.session.add(user)
     db.session.commit()
+    invalidate_user(user.username)
+    revoke_signed_tokens(user.id)
     return jsonify({
         "status": "Success"
     })
@@ -228,6 +314,7 @@ def delete() -> Response:
             "status": "Failed",
             "errors": ["User deletion failed, user does not exist"]
         })
+    user_id = user.id
     try:
         db.session.delete(user)
         db.session.commit()
@@ -236,6 +323,8 @@ def delete() -> Response:
             "status": "Failed",
             "errors": ["User deletion failed, user does not exist"]
         })
+    invalidate_user(user_data.get("username"))
+    revoke_signed_tokens(user_id)
     return jsonify({
         "status": "Success"
     })
@@ -0,0 +1,65 @@
+"""
+Author: James Duvall
+Purpose: gzip compression of responses negotiated through Accept-Encoding,
+    built into the app so it works behind plain waitress. Buffered responses
+    are compressed when they pass a size threshold, streamed responses are
+    compressed chunk by chunk as they are written
+"""
+import gzip
+import zlib
+from flask import request
+
+# Smallest buffered body worth compressing, overridden by the COMPRESS_MIN_SIZE config key
+COMPRESS_MIN_SIZE = 1024
+# zlib level 1-9, overridden by the COMPRESS_LEVEL config key
+COMPRESS_LEVEL = 6
+# Compressed content types, overridden by the COMPRESS_MIMETYPES config key
+COMPRESS_MIMETYPES = ("application/json", "application/x-ndjson", "application/msgpack", "text/html",
+                      "text/plain", "text/csv")
+
+
+def gzip_stream(chunks, level: int = COMPRESS_LEVEL):
+    """
+    Compresses a stream of str or bytes chunks into a gzip stream as they arrive
+    each chunk is flushed, so a client can read it before the next one is ready
+    """
+    compressor = zlib.compressobj(level, wbits=31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if chunk:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def compress_response(response, config):
+    """
+    after_request hook, gzips response when the client accepts it
+    """
+    if response.mimetype not in config.get("COMPRESS_MIMETYPES", COMPRESS_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or not request.accept_encodings["gzip"]):
+        return response
+
+    level = config.get("COMPRESS_LEVEL", COMPRESS_LEVEL)
+    if response.is_streamed:
+        response.response = gzip_stream(response.iter_encoded(), level)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < config.get("COMPRESS_MIN_SIZE", COMPRESS_MIN_SIZE):
+            return response
+        response.set_data(gzip.compress(body, compresslevel=level))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def init_compression(app) -> None:
+    """
+    Registers response compression on a flask app
+    """
+    app.after_request(lambda response: compress_response(response, app.config))
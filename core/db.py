@@ -3,10 +3,14 @@ Author: James Duvall
 Purpose: Database interface
 """
 
+from sqlite3 import Connection as SQLiteConnection
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash
+from core.kdf import PASSWORD_HASH_METHOD
 
 
 class IPAMBaseModel(DeclarativeBase):
@@ -18,6 +22,20 @@ class IPAMBaseModel(DeclarativeBase):
 db = SQLAlchemy(model_class=IPAMBaseModel)
 
 
+@event.listens_for(Engine, "connect")
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """
+    SQLite ignores foreign keys, and so ON DELETE CASCADE, unless each connection turns them on
+    WAL journaling lets writes go on while a reader, like a streamed export, holds its snapshot
+    in-memory databases ignore it
+    """
+    if isinstance(dbapi_connection, SQLiteConnection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+
 def create_default_admin(app, admin_pw):
     """
     Create default admin user if it doesn't already exist
@@ -29,7 +47,7 @@ def create_default_admin(app, admin_pw):
         if not priv_15_users:
             new_user = User(username="admin",
                             password_hash=generate_password_hash(
-                                admin_pw),
+                                admin_pw, app.config.get("PASSWORD_HASH_METHOD", PASSWORD_HASH_METHOD)),
                             permission_level=15,
                             user_active=True
                             )
@@ -45,15 +63,35 @@ def create_global_vrf():
     return global_vrf
 
 
+def schema_is_current() -> bool:
+    """
+    Checks every existing table has all of its model's columns
+    a database that still needs flask db upgrade fails the check
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        if not columns.issuperset(table.columns.keys()):
+            return False
+    return True
+
+
 def initialize_db(app, admin_pw):
     """
     Creates db schema based on models
     TODO - Should add a flag or something so admin user isn't 
     always recreated on app launch, I can see that being undesired.
     Could do a check to see if any priv 15 account exist or something
+    Skips the default admin and vrf on a database that is not migrated yet,
+    so the app still loads for flask db upgrade
     """
     with app.app_context():
         db.create_all()
+        if not schema_is_current():
+            app.logger.warning("Database schema is out of date, run flask db upgrade")
+            return "Fail"
         new_admin = create_default_admin(app, admin_pw)
         if new_admin:
             db.session.add(new_admin)
@@ -0,0 +1,515 @@
+"""
+Author: James Duvall
+Purpose: In-memory free-space indexes used by the RPC routes to answer
+    "what is usable" questions without enumerating every host in a network
+"""
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from threading import Lock, RLock
+from typing import Iterator, Optional, Tuple
+from flask import current_app
+from core.db import db
+
+_lock = RLock()
+
+
+def host_bounds(network) -> Tuple[int, int]:
+    """
+    Returns the first and last host of a network as integers, matching the
+    addresses yielded by network.hosts() without enumerating them
+    """
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.prefixlen >= network.max_prefixlen - 1:
+        # /31, /32, /127 and /128 have no network or broadcast address to exclude
+        return first, last
+    if network.version == 6:
+        # IPv6 has no broadcast, only the Subnet-Router anycast address is excluded
+        return first + 1, last
+    return first + 1, last - 1
+
+
+class AddressIndex:
+    """
+    Free-space index for a single subnet
+
+    Used addresses are kept as a sorted list of integers, free space is kept
+    as two parallel sorted lists of range starts and range ends. Both only grow
+    with the number of used addresses, never with the size of the subnet, so a
+    /64 costs the same as a /24. Lookups are binary searches, so first_usable
+    and percent_utilized never touch hosts()
+    """
+
+    def __init__(self, network, used_addresses=()):
+        self.network = network
+        self.first_host, self.last_host = host_bounds(network)
+        self.used = sorted({
+            int(address) for address in used_addresses
+            if self.first_host <= int(address) <= self.last_host
+        })
+        self.free_starts = []
+        self.free_ends = []
+        cursor = self.first_host
+        for used in self.used:
+            if used > cursor:
+                self.free_starts.append(cursor)
+                self.free_ends.append(used - 1)
+            cursor = used + 1
+        if cursor <= self.last_host:
+            self.free_starts.append(cursor)
+            self.free_ends.append(self.last_host)
+
+    @property
+    def capacity(self) -> int:
+        """
+        Number of assignable hosts in the subnet
+        """
+        return self.last_host - self.first_host + 1
+
+    def to_address(self, value: int):
+        """
+        Converts an integer back into an address of the subnet's version
+        """
+        return type(self.network.network_address)(value)
+
+    def add(self, address) -> bool:
+        """
+        Marks an address as used, splitting the free range it falls in
+        returns False if the address is outside the host range or already used
+        """
+        value = int(address)
+        if not self.first_host <= value <= self.last_host:
+            return False
+        position = bisect_right(self.free_starts, value) - 1
+        if position < 0 or self.free_ends[position] < value:
+            return False
+        insort(self.used, value)
+        start, end = self.free_starts[position], self.free_ends[position]
+        if start == end:
+            del self.free_starts[position]
+            del self.free_ends[position]
+        elif value == start:
+            self.free_starts[position] = value + 1
+        elif value == end:
+            self.free_ends[position] = value - 1
+        else:
+            self.free_ends[position] = value - 1
+            self.free_starts.insert(position + 1, value + 1)
+            self.free_ends.insert(position + 1, end)
+        return True
+
+    def remove(self, address) -> bool:
+        """
+        Marks an address as free again, merging it with neighbouring free ranges
+        returns False if the address was not tracked as used
+        """
+        value = int(address)
+        position = bisect_left(self.used, value)
+        if position == len(self.used) or self.used[position] != value:
+            return False
+        del self.used[position]
+        position = bisect_left(self.free_starts, value)
+        joins_left = position > 0 and self.free_ends[position - 1] == value - 1
+        joins_right = position < len(self.free_starts) and self.free_starts[position] == value + 1
+        if joins_left and joins_right:
+            self.free_ends[position - 1] = self.free_ends[position]
+            del self.free_starts[position]
+            del self.free_ends[position]
+        elif joins_left:
+            self.free_ends[position - 1] = value
+        elif joins_right:
+            self.free_starts[position] = value
+        else:
+            self.free_starts.insert(position, value)
+            self.free_ends.insert(position, value)
+        return True
+
+    def first_usable(self) -> Optional[int]:
+        """
+        Lowest free host, or None when the subnet is depleted
+        """
+        return self.free_starts[0] if self.free_starts else None
+
+    def reserve(self, count: int, contiguous: bool = False) -> list:
+        """
+        Picks count free hosts without marking them used
+        contiguous picks them from the first free range long enough to hold all of them,
+        otherwise the lowest free hosts are picked. returns [] if they don't fit
+        """
+        if contiguous:
+            for start, end in zip(self.free_starts, self.free_ends):
+                if end - start + 1 >= count:
+                    return list(range(start, start + count))
+            return []
+        hosts = list(islice(self.iter_free(), count))
+        return hosts if len(hosts) == count else []
+
+    def percent_utilized(self) -> int:
+        """
+        Percentage of the host range that is in use
+        """
+        if not self.capacity:
+            return 0
+        return int((len(self.used) / self.capacity) * 100)
+
+    def free_ranges(self, after: int = None) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (start, end) integer pairs for each block of free hosts
+        when after is given, only free space above that value is yielded
+        """
+        starts, ends = list(self.free_starts), list(self.free_ends)
+        position = 0
+        if after is not None:
+            position = bisect_right(ends, after)
+        for start, end in zip(starts[position:], ends[position:]):
+            if after is not None and start <= after:
+                start = after + 1
+            yield start, end
+
+    def iter_free(self, after: int = None) -> Iterator[int]:
+        """
+        Lazily yields every free host as an integer, in order
+        """
+        for start, end in self.free_ranges(after=after):
+            yield from range(start, end + 1)
+
+
+FREE, USED, SPLIT = 0, 1, 2
+
+
+class _Block:
+    """
+    Node of a SubnetAllocator tree, one aligned block of the supernet
+
+    free_mask has bit n set when a maximal free block with prefix length n
+    exists somewhere below this node, which lets searches skip whole subtrees
+    """
+    __slots__ = ("start", "prefixlen", "state", "left", "right", "free_mask")
+
+    def __init__(self, start: int, prefixlen: int):
+        self.start = start
+        self.prefixlen = prefixlen
+        self.state = FREE
+        self.left = None
+        self.right = None
+        self.free_mask = 1 << prefixlen
+
+    def split(self, max_prefixlen: int) -> None:
+        half = 1 << (max_prefixlen - self.prefixlen - 1)
+        self.left = _Block(self.start, self.prefixlen + 1)
+        self.right = _Block(self.start + half, self.prefixlen + 1)
+        self.state = SPLIT
+
+    def refresh(self) -> None:
+        """
+        Recomputes free_mask from the children, merging them back into
+        a single free block when both halves are free
+        """
+        if self.state != SPLIT:
+            self.free_mask = (1 << self.prefixlen) if self.state == FREE else 0
+            return
+        if self.left.state == FREE and self.right.state == FREE:
+            self.state = FREE
+            self.left = self.right = None
+            self.free_mask = 1 << self.prefixlen
+            return
+        self.free_mask = self.left.free_mask | self.right.free_mask
+
+
+class SubnetAllocator:
+    """
+    Buddy-style free-block tree for a single supernet
+
+    Each allocated subnet marks one aligned block as used, splitting free
+    blocks on the way down and merging free buddies on the way back up.
+    first_fit and best_fit walk a single root to leaf path, so their cost
+    depends on prefix depth rather than the number of candidate subnets
+    """
+
+    def __init__(self, network, allocated=()):
+        self.network = network
+        self.max_prefixlen = network.max_prefixlen
+        self.root = _Block(int(network.network_address), network.prefixlen)
+        for subnet in allocated:
+            self.allocate(subnet)
+
+    def _path(self, network, split: bool) -> list:
+        """
+        Returns the nodes from the root down to the block matching network
+        stops early if the walk hits a leaf, splitting free leaves when asked to
+        """
+        if not network.subnet_of(self.network):
+            return []
+        target = int(network.network_address)
+        path = [self.root]
+        node = self.root
+        while node.prefixlen < network.prefixlen:
+            if node.state == FREE and split:
+                node.split(self.max_prefixlen)
+            elif node.state != SPLIT:
+                break
+            half = 1 << (self.max_prefixlen - node.prefixlen - 1)
+            node = node.right if target >= node.start + half else node.left
+            path.append(node)
+        return path
+
+    def _refresh(self, path: list) -> None:
+        for node in reversed(path):
+            node.refresh()
+
+    def to_network(self, start: int, prefixlen: int):
+        """
+        Converts an integer start and prefix length into a network of the supernet's version
+        """
+        return type(self.network)((start, prefixlen))
+
+    def allocate(self, network) -> bool:
+        """
+        Marks network as used
+        returns False if it is outside the supernet or overlaps a used block
+        """
+        path = self._path(network, split=True)
+        if not path or path[-1].prefixlen != network.prefixlen or path[-1].state != FREE:
+            self._refresh(path)
+            return False
+        path[-1].state = USED
+        self._refresh(path)
+        return True
+
+    def release(self, network) -> bool:
+        """
+        Marks a previously allocated network as free, merging free buddies
+        returns False if network was not allocated
+        """
+        path = self._path(network, split=False)
+        if not path or path[-1].prefixlen != network.prefixlen or path[-1].state != USED:
+            return False
+        path[-1].state = FREE
+        self._refresh(path)
+        return True
+
+    def _fits(self, prefixlen: int) -> int:
+        """
+        Mask of block sizes large enough to hold a subnet of prefixlen
+        """
+        return (1 << (prefixlen + 1)) - 1
+
+    def first_fit(self, prefixlen: int):
+        """
+        Lowest addressed free subnet of prefixlen, or None if nothing fits
+        """
+        fits = self._fits(prefixlen)
+        if not self.network.prefixlen <= prefixlen <= self.max_prefixlen or not self.root.free_mask & fits:
+            return None
+        node = self.root
+        while node.state == SPLIT:
+            node = node.left if node.left.free_mask & fits else node.right
+        return self.to_network(node.start, prefixlen)
+
+    def best_fit(self, prefixlen: int):
+        """
+        Free subnet of prefixlen carved from the smallest free block that can hold it
+        keeps large free blocks intact for later, larger requests
+        """
+        fitting = self.root.free_mask & self._fits(prefixlen)
+        if not self.network.prefixlen <= prefixlen <= self.max_prefixlen or not fitting:
+            return None
+        wanted = 1 << (fitting.bit_length() - 1)
+        node = self.root
+        while node.state == SPLIT:
+            node = node.left if node.left.free_mask & wanted else node.right
+        return self.to_network(node.start, prefixlen)
+
+    def reserve(self, prefixlen: int, count: int, contiguous: bool = False, fit: str = "first") -> list:
+        """
+        Allocates count subnets of prefixlen in the tree and returns them
+        contiguous carves them all out of one aligned block, otherwise each one
+        is placed by first or best fit. Nothing is allocated if they don't fit
+        """
+        subnets = []
+        if contiguous:
+            block_prefixlen = prefixlen - (count - 1).bit_length()
+            if block_prefixlen >= self.network.prefixlen:
+                block = self.first_fit(block_prefixlen) if fit == "first" else self.best_fit(block_prefixlen)
+                if block is not None:
+                    subnets = list(islice(block.subnets(new_prefix=prefixlen), count))
+            for subnet in subnets:
+                self.allocate(subnet)
+            return subnets
+        for _ in range(count):
+            subnet = self.first_fit(prefixlen) if fit == "first" else self.best_fit(prefixlen)
+            if subnet is None:
+                for allocated in subnets:
+                    self.release(allocated)
+                return []
+            self.allocate(subnet)
+            subnets.append(subnet)
+        return subnets
+
+    def free_blocks(self, prefixlen: int = None, after: int = None) -> Iterator[Tuple[int, int]]:
+        """
+        Lazily yields (start, prefixlen) for each maximal free block in address order
+        prefixlen limits the walk to blocks that can hold a subnet of that size
+        after skips blocks that end at or below that integer
+        """
+        fits = self._fits(prefixlen if prefixlen is not None else self.max_prefixlen)
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not node.free_mask & fits:
+                continue
+            if after is not None and node.start + (1 << (self.max_prefixlen - node.prefixlen)) - 1 <= after:
+                continue
+            if node.state == FREE:
+                yield node.start, node.prefixlen
+            else:
+                stack.append(node.right)
+                stack.append(node.left)
+
+    def _free_spans(self, prefixlen: int, after=None) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (first, last) subnet starts of prefixlen for each free block,
+        clipped so nothing at or below after is included
+        """
+        size = 1 << (self.max_prefixlen - prefixlen)
+        floor = int(after.broadcast_address) if after is not None else None
+        for start, block_prefixlen in self.free_blocks(prefixlen, after=floor):
+            end = start + (1 << (self.max_prefixlen - block_prefixlen))
+            if floor is not None and start <= floor:
+                start = floor + 1 + (-(floor + 1 - start) % size)
+            yield start, end - size
+
+    def iter_free(self, prefixlen: int, after=None) -> Iterator:
+        """
+        Lazily yields every free subnet of prefixlen in address order
+        when after is given, only subnets above it are yielded
+        """
+        size = 1 << (self.max_prefixlen - prefixlen)
+        for first, last in self._free_spans(prefixlen, after=after):
+            for subnet_start in range(first, last + 1, size):
+                yield self.to_network(subnet_start, prefixlen)
+
+    def free_ranges(self, prefixlen: int, after=None) -> Iterator[Tuple]:
+        """
+        Lazily yields (first, last) subnets of prefixlen for each run of
+        consecutive free space, without expanding the subnets in between
+        """
+        size = 1 << (self.max_prefixlen - prefixlen)
+        first = last = None
+        for span_first, span_last in self._free_spans(prefixlen, after=after):
+            if last is not None and span_first == last + size:
+                last = span_last
+                continue
+            if first is not None:
+                yield self.to_network(first, prefixlen), self.to_network(last, prefixlen)
+            first, last = span_first, span_last
+        if first is not None:
+            yield self.to_network(first, prefixlen), self.to_network(last, prefixlen)
+
+
+def _registry(name: str) -> dict:
+    return current_app.extensions.setdefault(name, {})
+
+
+def get_address_index(subnet) -> AddressIndex:
+    """
+    Returns the AddressIndex for a SubnetModel, building it from the db
+    the first time the subnet is looked at
+    """
+    from models.addressmodel import AddressModel
+    with _lock:
+        indexes = _registry("ipam_address_indexes")
+        index = indexes.get(subnet.id)
+        if index is None or index.network != subnet.network:
+            used = db.session.query(AddressModel.address).filter_by(
+                subnet_id=subnet.id)
+            index = AddressIndex(subnet.network, (row.address for row in used))
+            indexes[subnet.id] = index
+        return index
+
+
+def address_added(subnet_id: int, address) -> None:
+    """
+    Keeps an already built index current after an address is committed
+    """
+    with _lock:
+        index = _registry("ipam_address_indexes").get(subnet_id)
+        if index is not None:
+            index.add(address)
+
+
+def address_removed(subnet_id: int, address) -> None:
+    """
+    Keeps an already built index current after an address is deleted
+    """
+    with _lock:
+        index = _registry("ipam_address_indexes").get(subnet_id)
+        if index is not None:
+            index.remove(address)
+
+
+def drop_address_index(subnet_id: int = None) -> None:
+    """
+    Forgets the index of a subnet, or every index when no id is given
+    Used when subnets are deleted, the index is rebuilt lazily on next use
+    """
+    with _lock:
+        if subnet_id is None:
+            _registry("ipam_address_indexes").clear()
+        else:
+            _registry("ipam_address_indexes").pop(subnet_id, None)
+
+
+def allocation_lock(kind: str, parent_id: int) -> Lock:
+    """
+    Returns the lock that serializes allocations within a single
+    subnet or supernet, kind is "subnet" or "supernet"
+    """
+    with _lock:
+        return _registry("ipam_allocation_locks").setdefault((kind, parent_id), Lock())
+
+
+def get_subnet_allocator(supernet) -> SubnetAllocator:
+    """
+    Returns the SubnetAllocator for a SupernetModel, rebuilding it from
+    the supernet's subnets relationship the first time it is looked at
+    """
+    with _lock:
+        allocators = _registry("ipam_subnet_allocators")
+        allocator = allocators.get(supernet.id)
+        if allocator is None or allocator.network != supernet.network:
+            allocator = SubnetAllocator(
+                supernet.network, (subnet.network for subnet in supernet.subnets))
+            allocators[supernet.id] = allocator
+        return allocator
+
+
+def subnet_added(supernet_id: int, network) -> None:
+    """
+    Keeps an already built allocator current after a subnet is committed
+    """
+    with _lock:
+        allocator = _registry("ipam_subnet_allocators").get(supernet_id)
+        if allocator is not None:
+            allocator.allocate(network)
+
+
+def subnet_removed(supernet_id: int, network) -> None:
+    """
+    Keeps an already built allocator current after a subnet is deleted
+    """
+    with _lock:
+        allocator = _registry("ipam_subnet_allocators").get(supernet_id)
+        if allocator is not None:
+            allocator.release(network)
+
+
+def drop_subnet_allocator(supernet_id: int = None) -> None:
+    """
+    Forgets the allocator of a supernet, or every allocator when no id is given
+    """
+    with _lock:
+        if supernet_id is None:
+            _registry("ipam_subnet_allocators").clear()
+        else:
+            _registry("ipam_subnet_allocators").pop(supernet_id, None)
@@ -0,0 +1,132 @@
+"""
+Author: James Duvall
+Purpose: Concurrency limit for password hashing
+    Password KDFs are deliberately slow and CPU bound, a burst of logins hashing
+    at once would starve every other request of CPU. At most KDF_CONCURRENCY hashes
+    run at a time, up to KDF_MAX_WAITING further logins wait their turn, so a burst
+    slows logins down. A login finding the queue full, or still waiting after
+    KDF_WAIT_TIMEOUT seconds, is answered with a 503 and Retry-After
+    Hashes run on the request thread rather than a pool of their own, so running and waiting
+    logins hold waitress threads, app.py sizes WAITRESS_THREADS to leave the rest of the api some
+"""
+from threading import BoundedSemaphore, Lock
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Hashes run at once, overridden by the KDF_CONCURRENCY config key
+KDF_CONCURRENCY = 2
+# Logins waiting for a hash slot at once, further ones get the 503 straight away
+# overridden by the KDF_MAX_WAITING config key
+KDF_MAX_WAITING = 2
+# Seconds a login waits for its turn before the 503, overridden by the KDF_WAIT_TIMEOUT config key
+KDF_WAIT_TIMEOUT = 10
+# Seconds sent in Retry-After with that 503, overridden by the KDF_RETRY_AFTER config key
+KDF_RETRY_AFTER = 1
+# werkzeug hash method of new password hashes, overridden by the PASSWORD_HASH_METHOD config key
+# ex. "scrypt:32768:8:1" or "pbkdf2:sha256:600000", existing hashes keep their own parameters
+PASSWORD_HASH_METHOD = "scrypt"
+
+_lock = Lock()
+
+
+class KDFBusy(Exception):
+    """
+    Raised when a hash found the wait queue full, or waited KDF_WAIT_TIMEOUT seconds without getting its turn
+    """
+
+
+class KDFLimiter:
+    """
+    Bounded semaphore letting concurrency hashes run at once, with at most max_waiting
+    callers waiting for it, and queue depth counters
+    """
+
+    def __init__(self, concurrency: int, max_waiting: int, timeout: float):
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.slots = BoundedSemaphore(concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self._lock = Lock()
+
+    def run(self, func, *args):
+        """
+        Waits up to timeout seconds for a free slot, then runs func(*args) on the calling thread
+        raises KDFBusy when max_waiting callers are already waiting, or no slot freed up in time
+        """
+        if not self.slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_waiting:
+                    self.rejected += 1
+                    raise KDFBusy()
+                self.waiting += 1
+            acquired = self.slots.acquire(timeout=self.timeout)
+            with self._lock:
+                self.waiting -= 1
+                if not acquired:
+                    self.timed_out += 1
+                    raise KDFBusy()
+        with self._lock:
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+            self.slots.release()
+
+    def stats(self) -> dict:
+        """
+        Returns the limits, the current queue depth and the counters
+        """
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "max_waiting": self.max_waiting,
+                "running": self.running,
+                "waiting": self.waiting,
+                "completed": self.completed,
+                "timed_out": self.timed_out,
+                "rejected": self.rejected,
+            }
+
+
+def kdf_limiter() -> KDFLimiter:
+    """
+    Returns the app's KDFLimiter, created on first use
+    """
+    with _lock:
+        limiter = current_app.extensions.get("ipam_kdf_limiter")
+        if limiter is None:
+            limiter = current_app.extensions["ipam_kdf_limiter"] = KDFLimiter(
+                current_app.config.get("KDF_CONCURRENCY", KDF_CONCURRENCY),
+                current_app.config.get("KDF_MAX_WAITING", KDF_MAX_WAITING),
+                current_app.config.get("KDF_WAIT_TIMEOUT", KDF_WAIT_TIMEOUT))
+        return limiter
+
+
+def hash_password(password: str) -> str:
+    """
+    generate_password_hash with the configured method, once a KDF slot is free
+    """
+    return kdf_limiter().run(generate_password_hash, password,
+                             current_app.config.get("PASSWORD_HASH_METHOD", PASSWORD_HASH_METHOD))
+
+
+def check_password(password_hash: str, password: str) -> bool:
+    """
+    check_password_hash, once a KDF slot is free
+    """
+    return kdf_limiter().run(check_password_hash, password_hash, password)
+
+
+def kdf_retry_after() -> dict:
+    """
+    Headers of the 503 sent when a login could not get a KDF slot
+    """
+    return {"Retry-After": str(current_app.config.get("KDF_RETRY_AFTER", KDF_RETRY_AFTER))}
@@ -0,0 +1,106 @@
+"""
+Author: James Duvall
+Purpose: Keyset pagination for the CRUD list endpoints, pages are read with
+    WHERE (sort key) > (cursor) ... LIMIT n, so every page costs the same no
+    matter how deep into the table it is
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from flask import current_app
+from flask_restx import abort, inputs
+from sqlalchemy import LargeBinary, String, tuple_
+
+# Page size used when the request has no limit, overridden by the PAGE_SIZE config key
+DEFAULT_PAGE_SIZE = 1000
+# Largest limit a request may ask for, overridden by the MAX_PAGE_SIZE config key
+MAX_PAGE_SIZE = 10000
+
+
+def encode_cursor(order: str, key) -> str:
+    """
+    Packs the order and sort key of the last row of a page into an opaque token
+    """
+    return urlsafe_b64encode(json.dumps([order, list(key)]).encode()).decode()
+
+
+def decode_cursor(value: str) -> tuple:
+    """
+    reqparse type for the after argument, returns (order, key)
+    raising ValueError makes reqparse answer 400
+    """
+    try:
+        order, key = json.loads(urlsafe_b64decode(value.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("after is not a cursor returned by this api")
+    if not isinstance(order, str) or not isinstance(key, list) \
+            or not all(isinstance(value, (str, int)) and not isinstance(value, bool) for value in key):
+        raise ValueError("after is not a cursor returned by this api")
+    return order, key
+
+
+def key_value_fits(column, value) -> bool:
+    """
+    Checks a cursor key value can be bound to the column it is compared with
+    integers are stored as 64 bit, or as fixed width bytes for range keys
+    """
+    if isinstance(column.type, String):
+        return isinstance(value, str)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        return False
+    impl = getattr(column.type, "impl", None)
+    if isinstance(impl, LargeBinary) and impl.length:
+        return value < 256 ** impl.length
+    return value < 2 ** 63
+
+
+# Swagger descriptions of the pagination arguments, for api.doc(params=...)
+PAGINATION_PARAMS = {
+    "limit": "Rows per page, the next page is linked by the X-Next-Cursor response header",
+    "after": "X-Next-Cursor value of the previous page",
+    "order": "Sort order of the listing, a cursor keeps the order it was issued for",
+    "count": "Set to true to receive the total number of rows in the X-Total-Count header",
+}
+
+
+def add_pagination_arguments(parser, orders: tuple):
+    """
+    Adds limit, after, order and count query arguments to a RequestParser
+    orders are the sort orders the endpoint supports, the first one is the default
+    """
+    parser.add_argument("limit", location="args", type=inputs.positive)
+    parser.add_argument("after", location="args", type=decode_cursor)
+    parser.add_argument("order", location="args", choices=orders, default=orders[0])
+    parser.add_argument("count", location="args", type=inputs.boolean, default=False)
+    return parser
+
+
+def paginate(query, args: dict, orders: dict) -> tuple:
+    """
+    Runs one page of query
+    orders maps each order name to the columns it sorts by, ending with a unique column
+    returns the page's rows and the X-Next-Cursor / X-Total-Count headers to send with them
+    """
+    order = args.get("order")
+    key = None
+    if args.get("after"):
+        order, key = args.get("after")
+    columns = orders.get(order)
+    if columns is None or (key is not None and (
+            len(key) != len(columns) or not all(map(key_value_fits, columns, key)))):
+        abort(400, "after is not a cursor returned by this endpoint")
+
+    headers = {}
+    if args.get("count"):
+        headers["X-Total-Count"] = str(query.order_by(None).count())
+
+    limit = min(args.get("limit") or current_app.config.get("PAGE_SIZE", DEFAULT_PAGE_SIZE),
+                current_app.config.get("MAX_PAGE_SIZE", MAX_PAGE_SIZE))
+    if key is not None:
+        query = query.filter(tuple_(*columns) > tuple(key))
+    rows = query.order_by(*columns).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_cursor(
+            order, [getattr(last, column.key) for column in columns])
+    return rows, headers
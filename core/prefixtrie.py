@@ -0,0 +1,155 @@
+"""
+Author: James Duvall
+Purpose: Per-VRF binary prefix tries, used to find the subnet or supernet
+    covering an address or network without scanning every row in the VRF
+"""
+from threading import RLock
+from flask import current_app
+from core.db import db
+
+_lock = RLock()
+
+
+class _TrieNode:
+    __slots__ = ("children", "value")
+
+    def __init__(self):
+        self.children = [None, None]
+        self.value = None
+
+
+class PrefixTrie:
+    """
+    Binary trie keyed on network bits, with one root per IP version
+
+    Each stored network sits at depth prefixlen, so a longest-prefix-match
+    walks at most one node per bit of the address (32 for IPv4, 128 for IPv6)
+    """
+
+    def __init__(self):
+        self.roots = {4: _TrieNode(), 6: _TrieNode()}
+
+    @staticmethod
+    def _bits(value: int, prefixlen: int, max_prefixlen: int):
+        for depth in range(prefixlen):
+            yield (value >> (max_prefixlen - 1 - depth)) & 1
+
+    def _network_bits(self, network):
+        return self._bits(int(network.network_address), network.prefixlen, network.max_prefixlen)
+
+    def insert(self, network, value) -> None:
+        """
+        Stores value at network, replacing anything already stored there
+        """
+        node = self.roots[network.version]
+        for bit in self._network_bits(network):
+            if node.children[bit] is None:
+                node.children[bit] = _TrieNode()
+            node = node.children[bit]
+        node.value = value
+
+    def remove(self, network) -> None:
+        """
+        Removes the value stored at network, pruning branches left empty
+        """
+        path = [self.roots[network.version]]
+        for bit in self._network_bits(network):
+            child = path[-1].children[bit]
+            if child is None:
+                return
+            path.append(child)
+        path[-1].value = None
+        bits = list(self._network_bits(network))
+        for depth in range(len(bits), 0, -1):
+            node = path[depth]
+            if node.value is not None or node.children != [None, None]:
+                break
+            path[depth - 1].children[bits[depth - 1]] = None
+
+    def longest_match(self, target):
+        """
+        Returns the value of the most specific stored network that contains
+        target, an address or a network, or None if nothing covers it
+        """
+        if hasattr(target, "prefixlen"):
+            value, prefixlen = int(target.network_address), target.prefixlen
+        else:
+            value, prefixlen = int(target), target.max_prefixlen
+        node = self.roots[target.version]
+        match = node.value
+        for bit in self._bits(value, prefixlen, target.max_prefixlen):
+            node = node.children[bit]
+            if node is None:
+                break
+            if node.value is not None:
+                match = node.value
+        return match
+
+    def overlaps(self, network) -> bool:
+        """
+        Checks if any stored network overlaps network, either by containing
+        it or by sitting inside it
+        """
+        node = self.roots[network.version]
+        for bit in self._network_bits(network):
+            if node.value is not None:
+                return True
+            node = node.children[bit]
+            if node is None:
+                return False
+        return node.value is not None or node.children != [None, None]
+
+
+def _tries() -> dict:
+    return current_app.extensions.setdefault("ipam_prefix_tries", {})
+
+
+def get_prefix_trie(model, vrf_id: int) -> PrefixTrie:
+    """
+    Returns the trie of a model's networks (SubnetModel or SupernetModel)
+    within a vrf, building it from the db the first time it is used
+    values stored in the trie are the rows' ids
+    """
+    with _lock:
+        key = (model.__tablename__, vrf_id)
+        trie = _tries().get(key)
+        if trie is None:
+            trie = PrefixTrie()
+            for row in db.session.query(model.id, model.network).filter_by(vrf_id=vrf_id):
+                trie.insert(row.network, row.id)
+            _tries()[key] = trie
+        return trie
+
+
+def prefix_added(model, vrf_id: int, network, row_id: int) -> None:
+    """
+    Keeps an already built trie current after a network is committed
+    """
+    with _lock:
+        trie = _tries().get((model.__tablename__, vrf_id))
+        if trie is not None:
+            trie.insert(network, row_id)
+
+
+def prefix_removed(model, vrf_id: int, network) -> None:
+    """
+    Keeps an already built trie current after a network is deleted
+    """
+    with _lock:
+        trie = _tries().get((model.__tablename__, vrf_id))
+        if trie is not None:
+            trie.remove(network)
+
+
+def drop_prefix_trie(model=None, vrf_id: int = None) -> None:
+    """
+    Forgets tries so they are rebuilt on next use
+    limited to one model and/or one vrf when they are given
+    """
+    with _lock:
+        for key in list(_tries()):
+            if model is not None and key[0] != model.__tablename__:
+                continue
+            if vrf_id is not None and key[1] != vrf_id:
+                continue
+            del _tries()[key]
@@ -0,0 +1,105 @@
+"""
+Author: James Duvall
+Purpose: Per user token-bucket rate limits and concurrent request caps, enforced by apikey_validate
+    Limits are picked by permission level and are opt-in through config. Each request takes its
+    route's cost in tokens, so one client hammering an expensive RPC runs out long before it can
+    saturate the server
+"""
+from math import ceil
+from threading import Lock
+from time import monotonic
+from typing import Optional
+from flask import current_app
+
+# permission level -> (tokens refilled per second, bucket size), a user gets the entry of the
+# highest level at or below their own. Off by default, enabled through the RATE_LIMITS config key
+# ex. {0: (10, 50), 10: (50, 200), 15: (100, 400)}
+RATE_LIMITS = {}
+# permission level -> requests a user may have in progress at once, picked the same way
+# Off by default, enabled through the CONCURRENCY_LIMITS config key, ex. {0: 2, 10: 8}
+CONCURRENCY_LIMITS = {}
+
+_lock = Lock()
+
+
+def level_limit(limits: dict, permission_level: int):
+    """
+    Returns the limit of the highest level in limits at or below permission_level, or None
+    """
+    levels = [level for level in limits if level <= permission_level]
+    return limits[max(levels)] if levels else None
+
+
+class RateLimiter:
+    """
+    Token buckets and in progress counts of every user seen by this process
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.active = {}
+        self.rate_limited = 0
+        self.concurrency_limited = 0
+        self._lock = Lock()
+
+    def acquire(self, user_id: int, permission_level: int, cost: int, config) -> Optional[int]:
+        """
+        Takes cost tokens and a concurrency slot for a request from user_id
+        returns None when the request may run, release must then be called once it is done
+        (for a streamed response, once the stream is closed),
+        otherwise the seconds the client should wait before retrying
+        """
+        rate = level_limit(config.get("RATE_LIMITS", RATE_LIMITS), permission_level)
+        concurrency = level_limit(config.get("CONCURRENCY_LIMITS", CONCURRENCY_LIMITS), permission_level)
+        now = monotonic()
+        with self._lock:
+            active = self.active.get(user_id, 0)
+            if concurrency is not None and active >= concurrency:
+                self.concurrency_limited += 1
+                return 1
+            if rate is not None:
+                per_second, size = rate
+                # A cost larger than the bucket would never fit, it takes a full bucket instead
+                cost = min(cost, size)
+                tokens, updated = self.buckets.get(user_id, (size, now))
+                tokens = min(size, tokens + (now - updated) * per_second)
+                if tokens < cost:
+                    self.buckets[user_id] = (tokens, now)
+                    self.rate_limited += 1
+                    return max(1, ceil((cost - tokens) / per_second))
+                self.buckets[user_id] = (tokens - cost, now)
+            self.active[user_id] = active + 1
+            return None
+
+    def release(self, user_id: int) -> None:
+        """
+        Frees the concurrency slot taken by acquire
+        """
+        with self._lock:
+            active = self.active.get(user_id, 0) - 1
+            if active > 0:
+                self.active[user_id] = active
+            else:
+                self.active.pop(user_id, None)
+
+    def stats(self) -> dict:
+        """
+        Returns the requests in progress and the rejection counters
+        """
+        with self._lock:
+            return {
+                "active": sum(self.active.values()),
+                "rate_limited": self.rate_limited,
+                "concurrency_limited": self.concurrency_limited,
+            }
+
+
+def rate_limiter() -> RateLimiter:
+    """
+    Returns the app's RateLimiter, created on first use
+    """
+    with _lock:
+        limiter = current_app.extensions.get("ipam_rate_limiter")
+        if limiter is None:
+            limiter = current_app.extensions["ipam_rate_limiter"] = RateLimiter()
+        return limiter
@@ -0,0 +1,56 @@
+"""
+Author: James Duvall
+Purpose: Revision counters for conditional GETs, one per vrf plus a global one
+    Write handlers bump them after committing, the GET handlers send them as a
+    weak ETag and answer a matching If-None-Match with 304 before querying anything
+"""
+from threading import Lock
+from uuid import uuid4
+from flask import Response, current_app, request
+from werkzeug.http import quote_etag
+
+_lock = Lock()
+
+
+def _revisions() -> dict:
+    with _lock:
+        # The epoch keeps a restarted process from handing out the ETags of the last one
+        return current_app.extensions.setdefault("ipam_revisions", {
+            "epoch": uuid4().hex[:12], "global": 0, "vrfs": {},
+        })
+
+
+def bump_revision(*vrf_ids: int) -> None:
+    """
+    Records a committed write to the provided vrfs, always bumping the global revision
+    """
+    revisions = _revisions()
+    with _lock:
+        revisions["global"] += 1
+        for vrf_id in vrf_ids:
+            if vrf_id is not None:
+                revisions["vrfs"][vrf_id] = revisions["vrfs"].get(vrf_id, 0) + 1
+
+
+def current_etag(vrf_id: int = None) -> str:
+    """
+    Returns the unquoted ETag of one vrf's data, or of everything when vrf_id is None
+    """
+    revisions = _revisions()
+    with _lock:
+        if vrf_id is None:
+            return f"{revisions['epoch']}-g{revisions['global']}"
+        return f"{revisions['epoch']}-v{vrf_id}-{revisions['vrfs'].get(vrf_id, 0)}"
+
+
+def conditional_get(vrf_id: int = None) -> tuple:
+    """
+    Checks If-None-Match against the current revision
+    returns a 304 Response when the client's copy is current, otherwise None,
+    and the ETag header to send with the full response
+    """
+    etag = current_etag(vrf_id)
+    headers = {"ETag": quote_etag(etag, weak=True)}
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers), headers
+    return None, headers
@@ -0,0 +1,178 @@
+"""
+Author: James Duvall
+Purpose: Precompiled serializers for the flask_restx response models, and the
+    orjson / msgpack representations the api picks between through Accept
+    A model is turned into straight-line code once, instead of marshal walking
+    its fields for every object of every request
+"""
+import json
+from collections.abc import Mapping
+from functools import wraps
+from flask import Response, current_app, make_response
+from flask_restx import fields, marshal
+from flask_restx.representations import output_json as restx_output_json
+from flask_restx.utils import unpack
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MIMETYPE = "application/msgpack"
+
+# id of each compiled model -> (model, serializer), models live as long as the app
+_serializers = {}
+
+
+def compile_serializer(model):
+    """
+    Returns a function giving the same dict as marshal(obj, model) for one object
+    """
+    entry = _serializers.get(id(model))
+    if entry is None or entry[0] is not model:
+        entry = _serializers[id(model)] = (model, _compile(model))
+    return entry[1]
+
+
+def _converter(field):
+    """
+    Returns the function that formats a field's non-None value,
+    or None when the field has to go through its own output method
+    """
+    if isinstance(field, fields.Nested) and not (field.skip_none or field.mask):
+        nested = compile_serializer(field.nested)
+        # marshal maps a Nested field over list values, such as relationship collections
+        return lambda value: [nested(item) for item in value] if isinstance(value, (list, tuple)) else nested(value)
+    if isinstance(field, fields.List) and isinstance(field.container, fields.Nested) \
+            and not (field.container.skip_none or field.container.mask or field.container.as_list):
+        item = compile_serializer(field.container.nested)
+        return lambda values: [item(value) for value in values]
+    if field.mask:
+        return None
+    if type(field) is fields.String:
+        return str
+    if type(field) is fields.Integer:
+        return int
+    return None
+
+
+def _compile(model):
+    """
+    Generates the serializer source of a model
+    None values and fields without a converter fall back to the field's own output,
+    so defaults behave exactly like marshal
+    """
+    namespace = {"Mapping": Mapping, "marshal": marshal, "model": model}
+    reads, entries = [], []
+    for index, (key, field) in enumerate(model.items()):
+        if isinstance(field, type):
+            field = field()
+        attribute = key if field.attribute is None else field.attribute
+        convert = _converter(field)
+        namespace[f"field{index}"] = field
+        if convert is None or not isinstance(attribute, str) or "." in attribute:
+            entries.append(f"        {key!r}: field{index}.output({key!r}, obj),")
+            continue
+        namespace[f"convert{index}"] = convert
+        reads.append(f"    value{index} = getattr(obj, {attribute!r}, None)")
+        entries.append(f"        {key!r}: field{index}.output({key!r}, obj) if value{index} is None"
+                       f" else convert{index}(value{index}),")
+    source = "\n".join([
+        "def serialize(obj):",
+        "    if obj is None or isinstance(obj, Mapping):",
+        "        return marshal(obj, model)",
+        *reads,
+        "    return {",
+        *entries,
+        "    }",
+    ])
+    exec(compile(source, f"<serializer {getattr(model, 'name', 'model')}>", "exec"), namespace)
+    return namespace["serialize"]
+
+
+def marshal_with(api, model, envelope: str = None):
+    """
+    Stand-in for api.marshal_with that serializes with the model's compiled serializer
+    documents model as the 200 response. flask Response objects, like streams,
+    and error replies with a status of 400 or more are returned untouched
+    """
+    serialize = compile_serializer(model)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            resp = func(*args, **kwargs)
+            if isinstance(resp, Response):
+                return resp
+            data, code, headers = unpack(resp)
+            if code >= 400:
+                return resp
+            if isinstance(data, (list, tuple)):
+                data = [serialize(item) for item in data]
+            else:
+                data = serialize(data)
+            return ({envelope: data} if envelope else data), code, headers
+
+        return api.response(200, "Success", model)(wrapper)
+    return decorator
+
+
+def dumps(data) -> str:
+    """
+    JSON encodes data with orjson when it is installed
+    orjson stops at 64 bit integers, IPv6 capacities past that go through json
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode()
+        except TypeError:
+            pass
+    return json.dumps(data)
+
+
+def output_json(data, code, headers=None):
+    """
+    flask_restx representation for application/json, encoded by orjson when it is installed
+    RESTX_JSON settings are only understood by flask_restx's own json output
+    """
+    if orjson is None or current_app.config.get("RESTX_JSON"):
+        return restx_output_json(data, code, headers)
+    option = orjson.OPT_APPEND_NEWLINE | (orjson.OPT_INDENT_2 if current_app.debug else 0)
+    try:
+        dumped = orjson.dumps(data, option=option)
+    except TypeError:
+        return restx_output_json(data, code, headers)
+    resp = make_response(dumped, code)
+    resp.headers.extend(headers or {})
+    resp.mimetype = "application/json"
+    return resp
+
+
+def output_msgpack(data, code, headers=None):
+    """
+    flask_restx representation for application/msgpack
+    msgpack stops at 64 bit integers, replies holding larger ones fall back to JSON
+    """
+    try:
+        packed = msgpack.packb(data)
+    except (OverflowError, TypeError):
+        return output_json(data, code, headers)
+    resp = make_response(packed, code)
+    resp.headers.extend(headers or {})
+    resp.mimetype = MSGPACK_MIMETYPE
+    return resp
+
+
+def register_representations(api) -> None:
+    """
+    Installs the representations on a flask_restx Api, msgpack only when it is installed
+    Swagger lists every registered representation under produces
+    """
+    api.representation("application/json")(output_json)
+    if msgpack is not None:
+        api.representation(MSGPACK_MIMETYPE)(output_msgpack)
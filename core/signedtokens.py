@@ -0,0 +1,129 @@
+"""
+Author: James Duvall
+Purpose: Stateless HMAC signed tokens, an alternative to apikeys for high volume clients
+    A token carries its user's id, permission level and expiry, so apikey_validate
+    checks it without touching the database. Revocations are kept per process,
+    which is why signed tokens are short lived
+"""
+import hmac
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from datetime import datetime, timezone
+from hashlib import sha256
+from threading import Lock
+from time import time
+from typing import NamedTuple, Optional
+from flask import current_app
+
+SIGNED_TOKEN_PREFIX = "st1."
+# Seconds a signed token is valid for, overridden by the SIGNED_TOKEN_TTL config key
+SIGNED_TOKEN_TTL = 900
+
+_lock = Lock()
+
+
+class SignedToken(NamedTuple):
+    """
+    Claims of a verified signed token, read by apikey_validate like a cached apikey
+    """
+    user_id: int
+    permission_level: int
+    apikey_expiration: datetime
+    issued_at: float
+
+
+def _b64encode(data: bytes) -> str:
+    return urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def signing_key() -> Optional[bytes]:
+    """
+    Returns the key tokens are signed with, the TOKEN_SECRET_KEY config key
+    every process verifying tokens needs the same one. Unset disables signed tokens
+    It is never derived from a password, a token would let its password be brute forced offline
+    """
+    secret = current_app.config.get("TOKEN_SECRET_KEY")
+    if not secret:
+        return None
+    return secret.encode() if isinstance(secret, str) else secret
+
+
+def _signature(key: bytes, signed: str) -> str:
+    return _b64encode(hmac.new(key, signed.encode(), sha256).digest())
+
+
+def is_signed_token(token: str) -> bool:
+    """
+    Tells signed tokens apart from apikeys
+    """
+    return token.startswith(SIGNED_TOKEN_PREFIX)
+
+
+def issue_signed_token(user) -> tuple:
+    """
+    Returns a signed token for user and its expiration
+    raises LookupError when no signing key is configured
+    """
+    key = signing_key()
+    if key is None:
+        raise LookupError("Signed tokens are disabled, TOKEN_SECRET_KEY is not set")
+    issued_at = time()
+    expires = int(issued_at) + current_app.config.get("SIGNED_TOKEN_TTL", SIGNED_TOKEN_TTL)
+    claims = {"uid": user.id, "lvl": user.permission_level, "iat": issued_at, "exp": expires}
+    signed = SIGNED_TOKEN_PREFIX + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{signed}.{_signature(key, signed)}", datetime.fromtimestamp(expires, tz=timezone.utc)
+
+
+def verify_signed_token(token: str) -> Optional[SignedToken]:
+    """
+    Returns the claims of a token when its signature is valid and its user has not been
+    revoked since it was issued, otherwise None. Expiry is left to the caller
+    """
+    key = signing_key()
+    signed, _, signature = token.rpartition(".")
+    if key is None or not signed.startswith(SIGNED_TOKEN_PREFIX) \
+            or not hmac.compare_digest(_signature(key, signed), signature):
+        return None
+    try:
+        claims = json.loads(_b64decode(signed[len(SIGNED_TOKEN_PREFIX):]))
+        verified = SignedToken(int(claims["uid"]), int(claims["lvl"]),
+                               datetime.fromtimestamp(claims["exp"]), float(claims["iat"]))
+    except (Base64Error, ValueError, TypeError, KeyError, OverflowError, OSError):
+        return None
+    revoked_at = _revocations().get(verified.user_id)
+    if revoked_at is not None and verified.issued_at <= revoked_at:
+        return None
+    return verified
+
+
+def _revocations() -> dict:
+    with _lock:
+        return current_app.extensions.setdefault("ipam_token_revocations", {})
+
+
+def revoke_signed_tokens(user_id: int) -> None:
+    """
+    Rejects every signed token issued to a user so far, in this process
+    revocations are forgotten once every token they cover has expired
+    """
+    revocations = _revocations()
+    now = time()
+    ttl = current_app.config.get("SIGNED_TOKEN_TTL", SIGNED_TOKEN_TTL)
+    with _lock:
+        for expired in [key for key, revoked_at in revocations.items() if revoked_at + ttl < now]:
+            del revocations[expired]
+        revocations[user_id] = now
+
+
+def revocation_count() -> int:
+    """
+    Returns the number of users with revoked signed tokens
+    """
+    revocations = _revocations()
+    with _lock:
+        return len(revocations)
@@ -0,0 +1,60 @@
+"""
+Author: James Duvall
+Purpose: NDJSON streaming for full-table reads, rows are fetched in chunks
+    with yield_per and written out as they arrive, so memory stays flat and
+    the first line goes out before the query is done
+"""
+from flask import Response, current_app, stream_with_context
+from core.serializers import compile_serializer, dumps
+
+# Rows fetched from the db and written to the client per chunk, overridden by the STREAM_CHUNK_SIZE config key
+STREAM_CHUNK_SIZE = 1000
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Rate limit tokens taken by a full-table stream, see core.ratelimit
+STREAM_COST = 10
+
+# Swagger description of the format argument, for api.doc(params=...)
+STREAM_PARAMS = {
+    "format": "ndjson streams every row in the requested order, one JSON object per line, instead of a page",
+}
+
+
+def add_format_argument(parser):
+    """
+    Adds the format query argument, json for marshalled pages or ndjson for a stream
+    """
+    parser.add_argument("format", location="args", choices=("json", "ndjson"), default="json")
+    return parser
+
+
+def stream_cost(request) -> int:
+    """
+    Rate limit cost of a listing GET, for apikey_validate(cost=...)
+    """
+    return STREAM_COST if request.args.get("format") == "ndjson" else 1
+
+
+def stream_ndjson(query, fields, headers: dict = None) -> Response:
+    """
+    Streams every row of query as one marshalled JSON object per line
+    """
+    chunk_size = current_app.config.get("STREAM_CHUNK_SIZE", STREAM_CHUNK_SIZE)
+    serialize = compile_serializer(fields)
+    objects = (serialize(row) for row in query.yield_per(chunk_size))
+    return Response(stream_with_context(ndjson_chunks(objects, chunk_size)), mimetype=NDJSON_MIMETYPE,
+                    headers=headers)
+
+
+def ndjson_chunks(objects, chunk_size: int):
+    """
+    Yields objects as NDJSON text, chunk_size lines at a time
+    """
+    lines = []
+    for obj in objects:
+        lines.append(dumps(obj))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
@@ -0,0 +1,72 @@
+"""ipv6 range keys and address counts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 12:05:12.318401
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import models
+from ipaddress import ip_address, ip_network
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ("address", "subnet", "supernet"):
+        replace_range_columns(table, sa.LargeBinary(17))
+    for table in ("subnet", "supernet"):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in ("used_count", "capacity"):
+                batch_op.alter_column(column, existing_type=sa.BigInteger(), type_=sa.Numeric(39, 0),
+                                      existing_nullable=False, existing_server_default="0")
+    backfill(lambda address: ((address.version << 128) | int(address)).to_bytes(17, "big"))
+
+
+def downgrade():
+    for table in ("subnet", "supernet"):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in ("used_count", "capacity"):
+                batch_op.alter_column(column, existing_type=sa.Numeric(39, 0), type_=sa.BigInteger(),
+                                      existing_nullable=False, existing_server_default="0")
+    for table in ("address", "subnet", "supernet"):
+        replace_range_columns(table, sa.BigInteger())
+    # IPv6 rows have no BigInteger range and are left NULL
+    backfill(lambda address: int(address) if address.version == 4 else None)
+
+
+def replace_range_columns(table, type_):
+    """
+    Recreates the start/end columns and their index with a new type,
+    the values are refilled by backfill
+    """
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.drop_index(f'ix_{table}_vrf_start_end')
+        batch_op.drop_column('end')
+        batch_op.drop_column('start')
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.add_column(sa.Column('start', type_, nullable=True))
+        batch_op.add_column(sa.Column('end', type_, nullable=True))
+        batch_op.create_index(f'ix_{table}_vrf_start_end', ['vrf_id', 'start', 'end'], unique=False)
+
+
+def backfill(key):
+    """
+    Fills the start/end columns from each row's network or address using key
+    """
+    conn = op.get_bind()
+    for table in ("supernet", "subnet"):
+        for row_id, network in conn.execute(sa.text(f"SELECT id, network FROM {table}")).all():
+            net = ip_network(network)
+            conn.execute(sa.text(f'UPDATE {table} SET start = :start, "end" = :end WHERE id = :id'),
+                         {"start": key(net.network_address), "end": key(net.broadcast_address), "id": row_id})
+    for row_id, address in conn.execute(sa.text("SELECT id, address FROM address")).all():
+        value = key(ip_address(address))
+        conn.execute(sa.text('UPDATE address SET start = :value, "end" = :value WHERE id = :id'),
+                     {"value": value, "id": row_id})
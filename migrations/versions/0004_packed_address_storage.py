@@ -0,0 +1,65 @@
+"""packed address storage
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:41:27.905114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import models
+from ipaddress import ip_address, ip_network
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (("address", "address"), ("subnet", "network"), ("supernet", "network"))
+
+
+def pack(text):
+    if "/" in text:
+        network = ip_network(text)
+        return network.network_address.packed + bytes([network.prefixlen])
+    return ip_address(text).packed
+
+
+def unpack(value):
+    value = bytes(value)
+    if len(value) in (5, 17):
+        return str(ip_network((ip_address(value[:-1]), value[-1])))
+    return str(ip_address(value))
+
+
+def upgrade():
+    for table, column in COLUMNS:
+        replace_column(table, column, sa.LargeBinary(17 if column == "network" else 16), pack)
+
+
+def downgrade():
+    for table, column in COLUMNS:
+        replace_column(table, column, sa.Unicode(length=50) if column == "address" else sa.Unicode(), unpack)
+
+
+def replace_column(table, column, type_, convert):
+    """
+    Rewrites every value of table.column into a column of type_,
+    keeping the column's (column, vrf_id) unique constraint
+    """
+    conn = op.get_bind()
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.add_column(sa.Column(f'{column}_new', type_, nullable=True))
+    update = sa.text(f"UPDATE {table} SET {column}_new = :value WHERE id = :id").bindparams(
+        sa.bindparam("value", type_=type_))
+    for row_id, value in conn.execute(sa.text(f"SELECT id, {column} FROM {table}")).all():
+        conn.execute(update, {"value": convert(value), "id": row_id})
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.drop_constraint('_network_vrf_uc', type_='unique')
+        batch_op.drop_column(column)
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.alter_column(f'{column}_new', new_column_name=column, existing_type=type_, nullable=False)
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.create_unique_constraint('_network_vrf_uc', [column, 'vrf_id'])
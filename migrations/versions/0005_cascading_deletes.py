@@ -0,0 +1,43 @@
+"""cascading deletes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 14:02:51.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEYS = (("supernet", "vrf_id", "vrf"), ("subnet", "vrf_id", "vrf"), ("subnet", "supernet_id", "supernet"),
+                ("address", "vrf_id", "vrf"), ("address", "subnet_id", "subnet"))
+# SQLite foreign keys have no names, batch mode finds them through this convention instead
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+
+def upgrade():
+    for table, column, referred in FOREIGN_KEYS:
+        replace_foreign_key(table, column, referred, ondelete="CASCADE")
+
+
+def downgrade():
+    for table, column, referred in FOREIGN_KEYS:
+        replace_foreign_key(table, column, referred, ondelete=None)
+
+
+def replace_foreign_key(table, column, referred, ondelete):
+    """
+    Recreates the foreign key of table.column with the given ON DELETE action
+    """
+    name = NAMING_CONVENTION["fk"] % {"table_name": table, "column_0_name": column, "referred_table_name": referred}
+    existing = [fk["name"] for fk in sa.inspect(op.get_bind()).get_foreign_keys(table)
+                if fk["constrained_columns"] == [column] and fk["name"]]
+    with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(existing[0] if existing else name, type_='foreignkey')
+        batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
@@ -0,0 +1,58 @@
+"""hashed apikeys
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 16:20:43.118402
+
+"""
+from datetime import datetime
+from hashlib import sha256
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+# User.apikey's old default, the placeholder of users that never logged in
+PLACEHOLDER_APIKEY = "F" * 16
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('apikey_id', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('apikey_digest', sa.String(length=64), nullable=True))
+
+    # Live apikeys keep working, they are found by their digest alone until the user logs in again
+    conn = op.get_bind()
+    seen = set()
+    for row_id, apikey in conn.execute(sa.text("SELECT id, apikey FROM user")).all():
+        if not apikey or apikey == PLACEHOLDER_APIKEY or apikey in seen:
+            continue
+        seen.add(apikey)
+        conn.execute(sa.text("UPDATE user SET apikey_digest = :digest WHERE id = :id"),
+                     {"digest": sha256(apikey.encode()).hexdigest(), "id": row_id})
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('apikey')
+        batch_op.create_index(batch_op.f('ix_user_apikey_id'), ['apikey_id'], unique=True)
+        batch_op.create_index(batch_op.f('ix_user_apikey_digest'), ['apikey_digest'], unique=True)
+
+
+def downgrade():
+    # Digests can not be turned back into apikeys, every user has to log in again
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_apikey_digest'))
+        batch_op.drop_index(batch_op.f('ix_user_apikey_id'))
+        batch_op.add_column(sa.Column('apikey', sa.String(), nullable=False,
+                                      server_default=PLACEHOLDER_APIKEY))
+        batch_op.drop_column('apikey_digest')
+        batch_op.drop_column('apikey_id')
+
+    op.get_bind().execute(sa.text("UPDATE user SET apikey_expiration = :expired"),
+                          {"expired": datetime(1970, 1, 1)})
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('apikey', server_default=None)
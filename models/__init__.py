@@ -1,31 +1,198 @@
-from ipaddress import IPv4Network
-from sqlalchemy import types
+from collections import defaultdict
+from functools import lru_cache
+from ipaddress import ip_address, ip_network
+from sqlalchemy import Integer, event, types, update
+from sqlalchemy.orm import Mapped, Session, mapped_column, object_session
 
 
-class IPNetworkType(types.TypeDecorator):
+# Decoded addresses and networks are immutable, so rows sharing a value share one object
+DECODE_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def unpack_address(value: bytes):
+    """
+    Decodes a 4 byte IPv4 or 16 byte IPv6 packed address
+    """
+    return ip_address(value)
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def unpack_network(value: bytes):
+    """
+    Decodes a packed network address followed by a single prefix length byte
+    """
+    return ip_network((unpack_address(value[:-1]), value[-1]))
+
+
+class IPAddressType(types.TypeDecorator):
     """
-    Custom sqlalchemy type for ipv4 networks, allowing storage of ipaddress.IPv4Network objects
+    Custom sqlalchemy type storing ipaddress.IPv4Address and ipaddress.IPv6Address
+    objects packed, 4 or 16 bytes per row. Reading a row decodes the bytes
+    directly instead of parsing a string
     """
 
-    impl = types.Unicode
+    impl = types.LargeBinary(16)
 
     cache_ok = True
 
     def process_bind_param(self, value, dialect):
         if value is not None:
-            if not isinstance(value, IPv4Network):
-                try:
-                    value = IPv4Network(value)
-                except ValueError:
-                    raise ValueError(f"Invalid IPv4 network: {value}")
-            return str(value)
+            try:
+                return ip_address(value).packed
+            except ValueError:
+                raise ValueError(f"Invalid address: {value}")
         return None
 
     def process_result_value(self, value, dialect):
+        if value is not None:
+            return unpack_address(bytes(value))
+        return None
+
+
+class IPNetworkType(types.TypeDecorator):
+    """
+    Custom sqlalchemy type for networks, allowing storage of ipaddress.IPv4Network
+    and ipaddress.IPv6Network objects
+    Stored packed as the network address plus a prefix length byte, 5 or 17 bytes per row
+    """
+
+    impl = types.LargeBinary(17)
+
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
         if value is not None:
             try:
-                return IPv4Network(value)
+                value = ip_network(value)
             except ValueError:
-                raise ValueError(
-                    f"Invalid IPv4 network string in database: {value}")
+                raise ValueError(f"Invalid network: {value}")
+            return value.network_address.packed + bytes([value.prefixlen])
         return None
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            return unpack_network(bytes(value))
+        return None
+
+
+def range_key(address) -> int:
+    """
+    Orders addresses of both versions on one integer line
+    the version sits above the 128 address bits, so IPv4 and IPv6 ranges never overlap
+    """
+    return (address.version << 128) | int(address)
+
+
+class IPRangeKeyType(types.TypeDecorator):
+    """
+    Custom sqlalchemy type storing range_key integers as fixed width big-endian bytes
+    byte order comparisons in SQL then match integer order, which BigInteger
+    can't offer once IPv6 addresses need 128 bits
+    """
+
+    impl = types.LargeBinary(17)
+
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None:
+            return int(value).to_bytes(17, "big")
+        return None
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            return int.from_bytes(value, "big")
+        return None
+
+
+class AddressCountType(types.TypeDecorator):
+    """
+    Custom sqlalchemy type for address counts, which outgrow BigInteger in IPv6
+    Stored as a 39 digit Numeric and handed back as int
+    SQLite keeps counts past 2**53 as approximate floats, which is close enough
+    for utilization percentages
+    """
+
+    impl = types.Numeric(39, 0)
+
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            return int(value)
+        return None
+
+
+class NetworkRangeMixin:
+    """
+    range_key copies of a network's first address, last address and its prefix length
+    Kept in sync by the model's network validator, they let containment and
+    overlap questions run in SQL against the (vrf_id, start, end) index
+    """
+    start: Mapped[int] = mapped_column(IPRangeKeyType, nullable=True)
+    end: Mapped[int] = mapped_column(IPRangeKeyType, nullable=True)
+    prefixlen: Mapped[int] = mapped_column(Integer, nullable=True)
+
+    def set_range(self, network) -> None:
+        self.start = range_key(network.network_address)
+        self.end = range_key(network.broadcast_address)
+        self.prefixlen = network.prefixlen
+
+    @classmethod
+    def overlapping(cls, session, vrf_id: int, network):
+        """
+        Query of rows in the vrf whose network overlaps the provided network
+        """
+        network = ip_network(network)
+        return session.query(cls).filter(
+            cls.vrf_id == vrf_id,
+            cls.start <= range_key(network.broadcast_address),
+            cls.end >= range_key(network.network_address))
+
+    @classmethod
+    def containing(cls, session, vrf_id: int, address):
+        """
+        Query of rows in the vrf whose network contains the address,
+        most specific network first
+        """
+        value = range_key(address)
+        return session.query(cls).filter(
+            cls.vrf_id == vrf_id, cls.start <= value, cls.end >= value
+        ).order_by(cls.prefixlen.desc())
+
+
+def track_used_count(target, parent_model, parent_id: int, delta: int) -> None:
+    """
+    Queues a change to parent_model.used_count from a mapper event
+    the changes are applied once per parent at the end of the flush
+    """
+    session = object_session(target)
+    if session is None or parent_id is None:
+        return
+    session.info.setdefault("ipam_used_counts", defaultdict(int))[(parent_model, parent_id)] += delta
+
+
+@event.listens_for(Session, "after_flush")
+def apply_used_counts(session, flush_context):
+    """
+    Issues one UPDATE per parent whose used_count changed during the flush
+    """
+    used_counts = session.info.pop("ipam_used_counts", None)
+    for (parent_model, parent_id), delta in (used_counts or {}).items():
+        add_used_counts(session, parent_model, {parent_id: delta})
+
+
+def add_used_counts(session, parent_model, deltas: dict) -> None:
+    """
+    Adds {parent id: delta} to parent_model.used_count, one UPDATE per parent
+    used directly by inserts that bypass the mapper events
+    """
+    for parent_id, delta in deltas.items():
+        if delta:
+            session.execute(
+                update(parent_model)
+                .where(parent_model.id == parent_id)
+                .values(used_count=parent_model.used_count + delta)
+            )
+
@@ -1,7 +1,8 @@
+from ipaddress import ip_address
 from core.db import db
 from sqlalchemy import Integer, String
-from sqlalchemy_utils.types import IPAddressType
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm import Mapped, mapped_column, validates
+from models import IPAddressType, IPRangeKeyType, range_key
 
 class AddressModel(db.Model):
     """
@@ -14,10 +15,18 @@ class AddressModel(db.Model):
     __tablename__ = "address"
     __table_args__ = (
         db.UniqueConstraint('address', 'vrf_id', name='_network_vrf_uc'),
+        db.Index('ix_address_vrf_start_end', 'vrf_id', 'start', 'end'),
     )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    vrf_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('vrf.id'))
-    subnet_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('subnet.id'))
+    vrf_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('vrf.id', ondelete="CASCADE"))
+    subnet_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('subnet.id', ondelete="CASCADE"))
     address: Mapped[IPAddressType] = mapped_column(IPAddressType)
     mac_address: Mapped[str] = mapped_column(String, default="FFFFFFFFFFFF")
     name: Mapped[str] = mapped_column(String, unique=True)
+    start: Mapped[int] = mapped_column(IPRangeKeyType, nullable=True)
+    end: Mapped[int] = mapped_column(IPRangeKeyType, nullable=True)
+
+    @validates('address')
+    def validate_address(self, key, address):
+        self.start = self.end = range_key(ip_address(address))
+        return address
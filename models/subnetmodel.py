@@ -1,10 +1,12 @@
+from ipaddress import ip_network
 from core.db import db
-from sqlalchemy import Integer, String
-from sqlalchemy.orm import Mapped, mapped_column
-from models import IPNetworkType
+from core.freespace import host_bounds
+from sqlalchemy import Integer, String, event
+from sqlalchemy.orm import Mapped, mapped_column, validates
+from models import AddressCountType, IPNetworkType, NetworkRangeMixin, track_used_count
 from models.addressmodel import AddressModel
 
-class SubnetModel(db.Model):
+class SubnetModel(NetworkRangeMixin, db.Model):
     """
     SubnetModel - Used to handle networks within a supernet
 
@@ -15,10 +17,41 @@ class SubnetModel(db.Model):
     __tablename__ = "subnet"
     __table_args__ = (
         db.UniqueConstraint('network', 'vrf_id', name='_network_vrf_uc'),
+        db.Index('ix_subnet_vrf_start_end', 'vrf_id', 'start', 'end'),
     )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    vrf_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('vrf.id'))
-    supernet_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('supernet.id'))
+    vrf_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('vrf.id', ondelete="CASCADE"))
+    supernet_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('supernet.id', ondelete="CASCADE"))
     network: Mapped[IPNetworkType] = mapped_column(IPNetworkType)
     name: Mapped[str] = mapped_column(String, unique=True)
-    addresses = db.relationship("AddressModel", backref="subnet", cascade="all, delete-orphan")
+    used_count: Mapped[int] = mapped_column(AddressCountType, default=0, server_default="0")
+    capacity: Mapped[int] = mapped_column(AddressCountType, default=0, server_default="0")
+    addresses = db.relationship("AddressModel", backref="subnet", cascade="all, delete-orphan",
+                                passive_deletes=True)
+
+    @validates('network')
+    def validate_network(self, key, network):
+        self.set_range(ip_network(network))
+        first_host, last_host = host_bounds(ip_network(network))
+        self.capacity = last_host - first_host + 1
+        return network
+
+    @property
+    def percent_utilized(self) -> int:
+        """
+        Share of the subnet's hosts that have an address assigned
+        """
+        if not self.capacity:
+            return 0
+        return int(((self.used_count or 0) / self.capacity) * 100)
+
+
+@event.listens_for(AddressModel, "after_insert")
+def address_inserted(mapper, connection, target):
+    track_used_count(target, SubnetModel, target.subnet_id, 1)
+
+
+@event.listens_for(AddressModel, "after_delete")
+def address_deleted(mapper, connection, target):
+    track_used_count(target, SubnetModel, target.subnet_id, -1)
+
@@ -1,11 +1,12 @@
+from ipaddress import ip_network
 from core.db import db
-from sqlalchemy import Integer, String
-from sqlalchemy.orm import Mapped, mapped_column
-from models import IPNetworkType
+from sqlalchemy import Integer, String, event
+from sqlalchemy.orm import Mapped, mapped_column, validates
+from models import AddressCountType, IPNetworkType, NetworkRangeMixin, track_used_count
 from models.subnetmodel import SubnetModel
 
 
-class SupernetModel(db.Model):
+class SupernetModel(NetworkRangeMixin, db.Model):
     """
     SupernetModel - Used to handle large networks that are branched into subnets
 
@@ -17,9 +18,39 @@ class SupernetModel(db.Model):
     __tablename__ = "supernet"
     __table_args__ = (
         db.UniqueConstraint('network', 'vrf_id', name='_network_vrf_uc'),
+        db.Index('ix_supernet_vrf_start_end', 'vrf_id', 'start', 'end'),
     )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    vrf_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('vrf.id'))
+    vrf_id: Mapped[int] = mapped_column(Integer, db.ForeignKey('vrf.id', ondelete="CASCADE"))
     network: Mapped[IPNetworkType] = mapped_column(IPNetworkType)
     name: Mapped[str] = mapped_column(String, unique=True)
-    subnets = db.relationship("SubnetModel", backref="supernet", cascade="all, delete-orphan")
+    used_count: Mapped[int] = mapped_column(AddressCountType, default=0, server_default="0")
+    capacity: Mapped[int] = mapped_column(AddressCountType, default=0, server_default="0")
+    subnets = db.relationship("SubnetModel", backref="supernet", cascade="all, delete-orphan",
+                              passive_deletes=True)
+
+    @validates('network')
+    def validate_network(self, key, network):
+        self.set_range(ip_network(network))
+        self.capacity = ip_network(network).num_addresses
+        return network
+
+    @property
+    def percent_utilized(self) -> int:
+        """
+        Share of the supernet's address space that is carved into subnets
+        """
+        if not self.capacity:
+            return 0
+        return int(((self.used_count or 0) / self.capacity) * 100)
+
+
+@event.listens_for(SubnetModel, "after_insert")
+def subnet_inserted(mapper, connection, target):
+    track_used_count(target, SupernetModel, target.supernet_id, ip_network(target.network).num_addresses)
+
+
+@event.listens_for(SubnetModel, "after_delete")
+def subnet_deleted(mapper, connection, target):
+    track_used_count(target, SupernetModel, target.supernet_id, -ip_network(target.network).num_addresses)
+
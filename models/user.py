@@ -1,21 +1,35 @@
 from datetime import datetime, timezone
+from hashlib import sha256
+from hmac import compare_digest
+from secrets import token_hex, token_urlsafe
+from typing import Optional
 from core.db import db
 from sqlalchemy import Integer, String, Boolean
 from sqlalchemy.orm import Mapped, mapped_column, validates
 from sqlalchemy.types import DateTime
 
 
+def apikey_digest(apikey: str) -> str:
+    """
+    Returns the stored form of an apikey, apikeys are random so an unsalted sha256 is enough
+    """
+    return sha256(apikey.encode()).hexdigest()
+
+
 class User(db.Model):
     """
     User Model
 
     Used primarily by the core.authen module, creates and manages user creds and apikeys
+    Only the digest of an apikey is stored. apikeys are issued as <apikey_id>.<secret>,
+    the apikey_id finds the row, the digest of the whole apikey must then match
     """
     __tablename__ = "user"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String, unique=True)
     password_hash: Mapped[str] = mapped_column(String)
-    apikey: Mapped[str] = mapped_column(String, default="F"*16)
+    apikey_id: Mapped[Optional[str]] = mapped_column(String(16), unique=True, index=True)
+    apikey_digest: Mapped[Optional[str]] = mapped_column(String(64), unique=True, index=True)
     apikey_expiration: Mapped[DateTime] = mapped_column(
         DateTime, default=datetime(1970, 1, 1, tzinfo=timezone.utc))
     permission_level: Mapped[Integer] = mapped_column(Integer, default=0)
@@ -26,3 +40,28 @@ class User(db.Model):
         if not (0 <= permission_level <= 15):
             raise ValueError("Permission level must be between 0 and 15")
         return permission_level
+
+    def issue_apikey(self) -> str:
+        """
+        Replaces the user's apikey with a new one, returns it
+        the apikey itself is not kept, it can not be shown again
+        """
+        self.apikey_id = token_hex(8)
+        apikey = f"{self.apikey_id}.{token_urlsafe(16)}"
+        self.apikey_digest = apikey_digest(apikey)
+        return apikey
+
+    @classmethod
+    def by_apikey(cls, session, apikey: str) -> Optional["User"]:
+        """
+        Returns the user owning apikey, or None
+        apikeys issued before apikey ids existed are found by their digest alone
+        """
+        digest = apikey_digest(apikey)
+        apikey_id, separator, _ = apikey.partition(".")
+        if not separator:
+            return session.query(cls).filter_by(apikey_digest=digest).first()
+        user = session.query(cls).filter_by(apikey_id=apikey_id).first()
+        if user is None or not compare_digest(user.apikey_digest or "", digest):
+            return None
+        return user
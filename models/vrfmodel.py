@@ -18,6 +18,7 @@ class VRFModel(db.Model):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String, unique=True)
 
-    supernets = db.relationship("SupernetModel", backref="vrf", cascade="all, delete-orphan")
-    addresses = db.relationship("SubnetModel", backref="vrf")
-    subnets = db.relationship("AddressModel", backref="vrf")
+    supernets = db.relationship("SupernetModel", backref="vrf", cascade="all, delete-orphan",
+                                passive_deletes=True)
+    addresses = db.relationship("SubnetModel", backref="vrf", passive_deletes=True)
+    subnets = db.relationship("AddressModel", backref="vrf", passive_deletes=True)
@@ -7,11 +7,14 @@ from flask import jsonify, make_response
 from flask_restx import Api
 from sqlalchemy.exc import IntegrityError
 from sqlite3 import IntegrityError as SQLIE
+from core.serializers import register_representations
 from routes.vrf import api as vrf_ns
 from routes.supernet import api as supernet_ns
 from routes.subnet import api as subnet_ns
 from routes.address import api as address_ns
 from routes.rpc import api as rpc_ns
+from routes.bulk import api as bulk_ns
+from routes.export import api as export_ns
 
 authorizations = {
     'apikey': {
@@ -27,6 +30,7 @@ api = Api(
     authorizations=authorizations,
     doc="/docs"
 )
+register_representations(api)
 
 @api.errorhandler(AttributeError)
 @api.errorhandler(IntegrityError)
@@ -39,6 +43,8 @@ api.add_namespace(ns=supernet_ns)
 api.add_namespace(ns=subnet_ns)
 api.add_namespace(ns=address_ns)
 api.add_namespace(ns=rpc_ns)
+api.add_namespace(ns=bulk_ns)
+api.add_namespace(ns=export_ns)
 
 
 
@@ -2,11 +2,18 @@
 Author: James Duvall
 Purpose: RESTful API for creating and modifying addresses within the IPAM
 """
-from ipaddress import IPv4Address
+from ipaddress import ip_address
 from flask_restx import Namespace, Resource, fields, reqparse
 from flask import jsonify, make_response
+from sqlalchemy.orm import joinedload
 from core.authen import apikey_validate
 from core.db import db
+from core.serializers import marshal_with
+from core.streaming import STREAM_PARAMS, add_format_argument, stream_cost, stream_ndjson
+from core.pagination import PAGINATION_PARAMS, add_pagination_arguments, paginate
+from core.freespace import address_added, address_removed
+from core.revision import bump_revision, conditional_get
+from core.prefixtrie import get_prefix_trie
 from models.vrfmodel import VRFModel
 from models.subnetmodel import SubnetModel
 from models.addressmodel import AddressModel
@@ -29,21 +36,30 @@ class Address(Resource):
 
     post_request_parser = base_request_parser.copy()
     post_request_parser.add_argument(
-        "address", location="json", required=True, type=IPv4Address)
+        "address", location="json", required=True, type=ip_address)
     post_request_parser.add_argument("name", location="json", required=True)
     post_request_parser.add_argument("vrf", location="json", default="Global")
 
+    # Sort orders of the listing, each ends with a unique column for keyset paging
+    list_orders = {
+        "id": (AddressModel.id,),
+        "address": (AddressModel.start, AddressModel.id),
+    }
+
     get_request_parser = base_request_parser.copy()
     get_request_parser.add_argument("id", location="args")
     get_request_parser.add_argument("name", location="args")
     get_request_parser.add_argument("vrf", location="args")
+    add_pagination_arguments(get_request_parser, orders=tuple(list_orders))
+    add_format_argument(get_request_parser)
 
     delete_request_parser = base_request_parser.copy()
     delete_request_parser.add_argument("id", location="args")
     delete_request_parser.add_argument("name", location="args")
 
-    patch_request_parser = get_request_parser.copy()
-    patch_request_parser.remove_argument("vrf")
+    patch_request_parser = base_request_parser.copy()
+    patch_request_parser.add_argument("id", location="args")
+    patch_request_parser.add_argument("name", location="args")
     patch_request_parser.add_argument("mac_address", location="json")
     patch_request_parser.add_argument(
         "name", location="json", dest="target_name")
@@ -65,23 +81,31 @@ class Address(Resource):
         "subnet": fields.Nested(subnet_out_model, required=True, description="Assigned supernet")
     })
 
+    @staticmethod
+    def address_query():
+        """
+        Query of AddressModel that loads the vrf and subnet address_out_model
+        nests in the same SELECT, instead of one lazy load per row
+        """
+        return db.session.query(AddressModel).options(
+            joinedload(AddressModel.vrf), joinedload(AddressModel.subnet))
+
     @staticmethod
     def find_subnet(provided_address: str, provided_vrf: str) -> SubnetModel:
         """
-        Queries the db for all supernets in the provided vrf
-        finds the supernet that covers the requested subnet
-        returns that supernet
+        Looks the provided address up in the vrf's subnet trie
+        finds the subnet that covers the requested address
+        returns that subnet
         """
-        provided_address = IPv4Address(provided_address)
+        provided_address = ip_address(provided_address)
         vrf = db.session.query(VRFModel).filter_by(name=provided_vrf).first()
         if not vrf:
             return False
-        subnets = db.session.query(SubnetModel).filter_by(vrf=vrf).all()
-        for subnet in subnets:
-            if provided_address in subnet.network:
-                return subnet
+        subnet_id = get_prefix_trie(SubnetModel, vrf.id).longest_match(provided_address)
+        if subnet_id is None:
+            return False
 
-        return False
+        return db.session.get(SubnetModel, subnet_id) or False
 
     @api.doc(security='apikey')
     @api.expect(post_request_parser)
@@ -112,43 +136,55 @@ class Address(Resource):
         new_subnet = AddressModel(
             name=args.get("name"),
             vrf=vrf_instance,
-            address=str(IPv4Address(args.get("address")))
+            address=str(ip_address(args.get("address")))
         )
         new_subnet.subnet = subnet
         db.session.add(new_subnet)
         db.session.commit()
+        address_added(subnet.id, ip_address(args.get("address")))
+        bump_revision(vrf_instance.id)
         return make_response(jsonify({
             "status": "Success"
         }), 200)
 
     @api.doc(security='apikey')
     @api.expect(get_request_parser)
-    @api.marshal_with(address_out_model, envelope="data")
+    @marshal_with(api, address_out_model, envelope="data")
+    @api.doc(params=PAGINATION_PARAMS)
+    @api.doc(params=STREAM_PARAMS)
     @api.doc(params={"id": "id of the address you want to see details of", 
                      "name": "name of the address you want to see details", "vrf": "vrf you are wanting to see address info from"})
-    @apikey_validate(permission_level=5)
+    @apikey_validate(permission_level=5, cost=stream_cost)
     def get(self):
         """
         handles the GET method
-        Takes optional ID or name, without will return all addresses
+        Takes optional ID or name, without will return a page of all addresses
         """
         args = self.get_request_parser.parse_args()
+        target_vrf = None
+        if args.get("vrf") and not (args.get("id") or args.get("name")):
+            target_vrf = db.session.query(VRFModel).filter_by(
+                name=args.get("vrf")).first()
+        # A listing of one vrf only changes with that vrf's revision
+        not_modified, etag_headers = conditional_get(target_vrf.id if target_vrf else None)
+        if not_modified:
+            return not_modified
         if args.get("id"):
-            addr = db.session.query(AddressModel).filter_by(
+            addr = self.address_query().filter_by(
                 id=args.get("id")).first()
-            return addr
+            return addr, 200, etag_headers
         elif args.get("name"):
-            addr = db.session.query(AddressModel).filter_by(
+            addr = self.address_query().filter_by(
                 name=args.get("name")).first()
-            return addr
+            return addr, 200, etag_headers
+        all_addrs = self.address_query()
         if args.get("vrf"):
-            target_vrf = db.session.query(VRFModel).filter_by(
-                name=args.get("vrf")).first()
-            all_addrs = db.session.query(
-                AddressModel).filter_by(vrf=target_vrf).all()
-        else:
-            all_addrs = db.session.query(AddressModel).all()
-        return all_addrs
+            all_addrs = all_addrs.filter_by(vrf=target_vrf)
+        if args.get("format") == "ndjson":
+            return stream_ndjson(all_addrs.order_by(*self.list_orders[args.get("order")]),
+                                 self.address_out_model, headers=etag_headers)
+        all_addrs, headers = paginate(all_addrs, args, orders=self.list_orders)
+        return all_addrs, 200, {**headers, **etag_headers}
 
     @api.doc(security='apikey')
     @api.expect(delete_request_parser)
@@ -172,8 +208,11 @@ class Address(Resource):
                 "status": "Failed",
                 "errors": ["No address found with provided id or name"]
             }), 404)
+        subnet_id, vrf_id, removed_address = address.subnet_id, address.vrf_id, address.address
         db.session.delete(address)
         db.session.commit()
+        address_removed(subnet_id, removed_address)
+        bump_revision(vrf_id)
         return make_response(jsonify({
             "status": "Success"
         }))
@@ -208,6 +247,7 @@ class Address(Resource):
             address.name = args.get("target_name")
         db.session.add(address)
         db.session.commit()
+        bump_revision(address.vrf_id)
         return make_response(jsonify({
             "status": "Success",
         }))
@@ -0,0 +1,337 @@
+"""
+Author: James Duvall
+Purpose: Bulk import of supernets, subnets and addresses from JSON lines or CSV
+    Rows are read in chunks, parents and conflicts are resolved once per chunk
+    instead of once per row, and the whole import commits as one transaction
+"""
+import csv
+import json
+from ipaddress import ip_address, ip_network
+from collections import Counter
+from itertools import islice
+from typing import Iterator, Tuple
+from sqlalchemy import insert
+from flask_restx import Namespace, Resource
+from flask import current_app, jsonify, make_response, request
+from core.authen import apikey_validate
+from core.db import db
+from core.freespace import address_added, subnet_added
+from core.prefixtrie import PrefixTrie, drop_prefix_trie, get_prefix_trie
+from core.revision import bump_revision
+from models import add_used_counts
+from models.vrfmodel import VRFModel
+from models.supernetmodel import SupernetModel
+from models.subnetmodel import SubnetModel
+from models.addressmodel import AddressModel
+
+api = Namespace("api/v1/import",
+                description="Bulk import of supernets, subnets and addresses from JSON lines or CSV")
+
+# Rows resolved and flushed together, overridden by the IMPORT_CHUNK_SIZE config key
+IMPORT_CHUNK_SIZE = 5000
+# Most per-row errors returned in one response, the failed count is always exact
+IMPORT_ERROR_LIMIT = 1000
+# Rate limit tokens taken by an import, see core.ratelimit
+IMPORT_COST = 50
+CSV_MIMETYPE = "text/csv"
+
+IMPORT_DOC = ("Body is JSON lines (one object per line) or, with Content-Type text/csv, CSV with a header line. "
+              "Each row takes the same keys as the resource's POST, vrf defaults to Global. "
+              "Valid rows are imported in one transaction, rows that fail are returned in errors by line number")
+
+
+def read_rows(stream, mimetype: str) -> Iterator[Tuple[int, object]]:
+    """
+    Yields (line number, row dict) for each row of a JSON lines or CSV body
+    a line that doesn't parse is yielded with an error string in place of the dict
+    """
+    lines = (line.decode("utf-8-sig") for line in stream)
+    if mimetype == CSV_MIMETYPE:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, "line is not valid JSON"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, "line is not a JSON object"
+            continue
+        yield line_number, row
+
+
+class BulkImport(Resource):
+    """
+    Shared import loop, subclasses name the model and column they import
+    and resolve each chunk's parents and conflicts
+    Each chunk is written with one executemany INSERT, which skips the mapper
+    events, so parent used_counts are added per chunk by used_counts
+    """
+    model = None
+    column = None
+    parse = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vrf_ids = {}
+        # Networks imported so far, per vrf, to catch conflicts between rows of the same import
+        self.batch_tries = {}
+        self.batch_names = set()
+
+    def resolve_vrfs(self, names: set) -> None:
+        """
+        Looks every vrf of the chunk not seen yet up in one query
+        """
+        missing = names - set(self.vrf_ids)
+        if missing:
+            for vrf_id, name in db.session.query(VRFModel.id, VRFModel.name).filter(
+                    VRFModel.name.in_(missing)):
+                self.vrf_ids[name] = vrf_id
+
+    def existing_names(self, names: set) -> set:
+        """
+        Returns the names of the chunk that are already taken, in one query
+        """
+        return {name for name, in db.session.query(self.model.name).filter(self.model.name.in_(names))}
+
+    def batch_trie(self, vrf_id: int) -> PrefixTrie:
+        return self.batch_tries.setdefault(vrf_id, PrefixTrie())
+
+    def build_rows(self, chunk: list, errors: list) -> list:
+        """
+        Validates a chunk of (line number, row) and returns new models for the rows
+        that can be imported, appending the rest to errors
+        """
+        parsed, chunk_errors = [], []
+        for line_number, row in chunk:
+            if isinstance(row, str):
+                chunk_errors.append((line_number, row))
+                continue
+            try:
+                value = self.parse(row.get(self.column) or "")
+            except ValueError:
+                chunk_errors.append((line_number, f"{self.column} {row.get(self.column)!r} is not valid"))
+                continue
+            if not row.get("name"):
+                chunk_errors.append((line_number, "name is required"))
+                continue
+            parsed.append((line_number, row, value, row.get("vrf") or "Global"))
+
+        self.resolve_vrfs({vrf for _, _, _, vrf in parsed})
+        taken = self.existing_names({row.get("name") for _, row, _, _ in parsed})
+        new_rows = []
+        for line_number, row, value, vrf in parsed:
+            vrf_id = self.vrf_ids.get(vrf)
+            if vrf_id is None:
+                chunk_errors.append((line_number, f"VRF {vrf} not found"))
+                continue
+            if row.get("name") in taken or row.get("name") in self.batch_names:
+                chunk_errors.append((line_number, f"name {row.get('name')} already exists"))
+                continue
+            error, new_row = self.build_row(row, value, vrf_id)
+            if error:
+                chunk_errors.append((line_number, error))
+                continue
+            self.batch_names.add(row.get("name"))
+            new_rows.append(new_row)
+        errors.extend(f"line {line_number}: {error}" for line_number, error in sorted(chunk_errors))
+        return new_rows
+
+    def build_row(self, row: dict, value, vrf_id: int) -> tuple:
+        """
+        Returns (error, None) or (None, new model) for one validated row
+        the model is never added to the session, its validators fill in the derived columns
+        By default every row is accepted as is
+        """
+        return None, self.model(name=row.get("name"), vrf_id=vrf_id, **{self.column: value})
+
+    def prepare_chunk(self, rows: list) -> None:
+        """
+        Hook run before a chunk's rows are built, with the chunk's parsed row dicts
+        """
+
+    def used_counts(self, new_rows: list) -> tuple:
+        """
+        Returns the parent model and {parent id: used_count delta} for a chunk of new rows
+        """
+        return None, {}
+
+    def imported(self, new_row) -> tuple:
+        """
+        Returns what after_commit needs to know about an inserted row, its vrf id by default
+        """
+        return new_row.vrf_id,
+
+    @staticmethod
+    def column_values(new_row) -> dict:
+        """
+        Column values of a transient model, leaving unset columns to their defaults
+        """
+        values = {}
+        for column in new_row.__table__.columns:
+            value = getattr(new_row, column.key)
+            if value is not None:
+                values[column.key] = value
+        return values
+
+    def after_commit(self, imported: list) -> None:
+        """
+        Hook run after the import commits, with what imported returned for every row
+        brings the in-memory indexes up to date with the committed rows
+        """
+
+    @api.doc(security='apikey', description=IMPORT_DOC)
+    @api.response(200, "Success")
+    @api.response(400, "Empty body")
+    @api.response(409, "Conflict")
+    @apikey_validate(permission_level=10, cost=IMPORT_COST)
+    def post(self):
+        """
+        Handles the POST method, imports every row of the request body
+        """
+        chunk_size = current_app.config.get("IMPORT_CHUNK_SIZE", IMPORT_CHUNK_SIZE)
+        rows = read_rows(request.stream, request.mimetype)
+        errors, imported, row_count = [], [], 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            row_count += len(chunk)
+            self.prepare_chunk([row for _, row in chunk if isinstance(row, dict)])
+            new_rows = self.build_rows(chunk, errors)
+            if not new_rows:
+                continue
+            db.session.execute(insert(self.model), [self.column_values(new_row) for new_row in new_rows])
+            parent_model, deltas = self.used_counts(new_rows)
+            add_used_counts(db.session, parent_model, deltas)
+            imported.extend(self.imported(new_row) for new_row in new_rows)
+
+        if not row_count:
+            db.session.rollback()
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["No rows found in the request body"]
+            }), 400)
+        db.session.commit()
+        self.after_commit(imported)
+        bump_revision(*self.vrf_ids.values())
+
+        response = {
+            "status": "Failed" if errors else "Success",
+            "data": {"imported": len(imported), "failed": len(errors)},
+        }
+        if errors:
+            response["errors"] = errors[:IMPORT_ERROR_LIMIT]
+        return make_response(jsonify(response), 200)
+
+
+@api.route("/supernet", strict_slashes=False)
+class SupernetImport(BulkImport):
+    """
+    Handles the route /api/v1/import/supernet
+    methods: POST
+    """
+    model = SupernetModel
+    column = "network"
+    parse = staticmethod(ip_network)
+
+    def build_row(self, row: dict, value, vrf_id: int) -> tuple:
+        if get_prefix_trie(SupernetModel, vrf_id).overlaps(value) or self.batch_trie(vrf_id).overlaps(value):
+            return f"{value} overlaps another supernet", None
+        self.batch_trie(vrf_id).insert(value, True)
+        return None, SupernetModel(name=row.get("name"), network=value, vrf_id=vrf_id)
+
+    def after_commit(self, imported: list) -> None:
+        # The new rows' ids were never read back, the tries are rebuilt on next use instead
+        for vrf_id, in set(imported):
+            drop_prefix_trie(SupernetModel, vrf_id)
+
+
+@api.route("/subnet", strict_slashes=False)
+class SubnetImport(BulkImport):
+    """
+    Handles the route /api/v1/import/subnet
+    methods: POST
+    """
+    model = SubnetModel
+    column = "network"
+    parse = staticmethod(ip_network)
+
+    def build_row(self, row: dict, value, vrf_id: int) -> tuple:
+        if get_prefix_trie(SubnetModel, vrf_id).overlaps(value) or self.batch_trie(vrf_id).overlaps(value):
+            return f"{value} already exists, or overlaps another subnet", None
+        supernet_id = get_prefix_trie(SupernetModel, vrf_id).longest_match(value)
+        if supernet_id is None:
+            return f"no supernet covers {value}", None
+        self.batch_trie(vrf_id).insert(value, True)
+        return None, SubnetModel(name=row.get("name"), network=value, vrf_id=vrf_id, supernet_id=supernet_id)
+
+    def used_counts(self, new_rows: list) -> tuple:
+        deltas = Counter()
+        for new_row in new_rows:
+            deltas[new_row.supernet_id] += new_row.network.num_addresses
+        return SupernetModel, deltas
+
+    def imported(self, new_row) -> tuple:
+        return new_row.vrf_id, new_row.supernet_id, new_row.network
+
+    def after_commit(self, imported: list) -> None:
+        for vrf_id, supernet_id, network in imported:
+            subnet_added(supernet_id, network)
+        # The new rows' ids were never read back, the tries are rebuilt on next use instead
+        for vrf_id in {vrf_id for vrf_id, _, _ in imported}:
+            drop_prefix_trie(SubnetModel, vrf_id)
+
+
+@api.route("/address", strict_slashes=False)
+class AddressImport(BulkImport):
+    """
+    Handles the route /api/v1/import/address
+    methods: POST
+    """
+    model = AddressModel
+    column = "address"
+    parse = staticmethod(ip_address)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.taken_addresses = set()
+
+    def prepare_chunk(self, rows: list) -> None:
+        """
+        Loads which of the chunk's addresses already exist, in one query
+        """
+        values = set()
+        for row in rows:
+            try:
+                values.add(ip_address(row.get("address") or ""))
+            except ValueError:
+                continue
+        if values:
+            self.taken_addresses.update(db.session.query(AddressModel.vrf_id, AddressModel.address).filter(
+                AddressModel.address.in_(values)))
+
+    def build_row(self, row: dict, value, vrf_id: int) -> tuple:
+        if (vrf_id, value) in self.taken_addresses:
+            return f"{value} already exists in the vrf", None
+        subnet_id = get_prefix_trie(SubnetModel, vrf_id).longest_match(value)
+        if subnet_id is None:
+            return f"no subnet covers {value}", None
+        self.taken_addresses.add((vrf_id, value))
+        return None, AddressModel(name=row.get("name"), address=value, vrf_id=vrf_id, subnet_id=subnet_id,
+                                  mac_address=row.get("mac_address") or None)
+
+    def used_counts(self, new_rows: list) -> tuple:
+        return SubnetModel, Counter(new_row.subnet_id for new_row in new_rows)
+
+    def imported(self, new_row) -> tuple:
+        return new_row.subnet_id, new_row.address
+
+    def after_commit(self, imported: list) -> None:
+        for subnet_id, address in imported:
+            address_added(subnet_id, address)
@@ -0,0 +1,106 @@
+"""
+Author: James Duvall
+Purpose: Streamed export of the whole IPAM as NDJSON, for backups and DR
+    Every level is read inside one read transaction, so the export is a
+    consistent snapshot even while writes continue
+"""
+from flask_restx import Namespace, Resource, reqparse
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import select
+from core.authen import apikey_validate
+from core.db import db
+from core.compression import gzip_stream
+from core.streaming import NDJSON_MIMETYPE, STREAM_CHUNK_SIZE, ndjson_chunks
+from models.vrfmodel import VRFModel
+from models.supernetmodel import SupernetModel
+from models.subnetmodel import SubnetModel
+from models.addressmodel import AddressModel
+
+api = Namespace("api/v1/export",
+                description="Streamed NDJSON export of every vrf, supernet, subnet and address")
+
+# Rate limit tokens taken by an export, see core.ratelimit
+EXPORT_COST = 50
+
+# Exported levels, parents always come before their children
+EXPORT_LEVELS = (
+    ("vrf", (VRFModel.id, VRFModel.name)),
+    ("supernet", (SupernetModel.id, SupernetModel.vrf_id, SupernetModel.name, SupernetModel.network)),
+    ("subnet", (SubnetModel.id, SubnetModel.vrf_id, SubnetModel.supernet_id, SubnetModel.name,
+                SubnetModel.network)),
+    ("address", (AddressModel.id, AddressModel.vrf_id, AddressModel.subnet_id, AddressModel.name,
+                 AddressModel.address, AddressModel.mac_address)),
+)
+
+
+def begin_snapshot():
+    """
+    Starts a fresh transaction on the session that every following read sees the same data in
+    returns the session's connection
+    """
+    db.session.rollback()
+    if db.engine.dialect.name == "sqlite":
+        connection = db.session.connection()
+        # pysqlite only opens a transaction ahead of writes, without BEGIN each SELECT reads the latest data
+        connection.exec_driver_sql("BEGIN")
+        return connection
+    return db.session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+
+def export_rows(connection, chunk_size: int):
+    """
+    Yields one dict per row of every level, vrfs first and addresses last
+    rows name their vrf, and the keys match the bulk import routes
+    """
+    vrf_names = {}
+    for level, columns in EXPORT_LEVELS:
+        result = connection.execute(select(*columns).order_by(columns[0]).execution_options(
+            yield_per=chunk_size))
+        for row in result:
+            record = {"type": level}
+            for key, value in row._mapping.items():
+                record[key] = str(value) if key in ("network", "address") else value
+            if level == "vrf":
+                vrf_names[row.id] = row.name
+            else:
+                record["vrf"] = vrf_names.get(row.vrf_id)
+            yield record
+
+
+@api.route("/", strict_slashes=False)
+@api.doc(security='apikey')
+class Export(Resource):
+    """
+    Handles the route /api/v1/export
+    methods: GET
+    """
+    get_request_parser = reqparse.RequestParser()
+    get_request_parser.add_argument("compress", location="args", choices=("none", "gzip"), default="none")
+
+    @api.doc(security='apikey')
+    @api.expect(get_request_parser)
+    @api.doc(params={"compress": "gzip sends the stream with Content-Encoding: gzip"})
+    @api.response(200, "NDJSON stream, one {type, ...} object per line")
+    @apikey_validate(permission_level=5, cost=EXPORT_COST)
+    def get(self):
+        """
+        Handles the GET method
+        Streams every vrf, supernet, subnet and address, in that order, from one snapshot
+        """
+        args = self.get_request_parser.parse_args()
+        chunk_size = current_app.config.get("STREAM_CHUNK_SIZE", STREAM_CHUNK_SIZE)
+
+        def generate():
+            try:
+                connection = begin_snapshot()
+                chunks = ndjson_chunks(export_rows(connection, chunk_size), chunk_size)
+                if args.get("compress") == "gzip":
+                    chunks = gzip_stream(chunks)
+                yield from chunks
+            finally:
+                db.session.rollback()
+
+        response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+        if args.get("compress") == "gzip":
+            response.headers["Content-Encoding"] = "gzip"
+        return response
@@ -2,11 +2,19 @@
 Author: James Duvall
 Purpose: RPC-like action on the IPAM, like getting usable address, or utilization reports
 """
-from ipaddress import IPv4Network
-from flask_restx import Namespace, Resource, fields, reqparse
+from ipaddress import ip_address, ip_network
+from itertools import islice
+from flask_restx import Namespace, Resource, fields, inputs, marshal, reqparse
 from flask import jsonify, make_response
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
 from core.authen import apikey_validate
 from core.db import db
+from core.prefixtrie import prefix_added
+from core.revision import bump_revision
+from core.serializers import marshal_with
+from core.freespace import (address_added, allocation_lock, drop_address_index, drop_subnet_allocator,
+                            get_address_index, get_subnet_allocator)
 from models.vrfmodel import VRFModel
 from models.supernetmodel import SupernetModel
 from models.subnetmodel import SubnetModel
@@ -16,6 +24,60 @@ from models.addressmodel import AddressModel
 api = Namespace("api/v1/rpc",
                 description="RPC-like actions on the IPAM, like getting usable address, or utilization reports")
 
+# How many times the allocate RPCs retry before giving up on a contended subnet or supernet
+ALLOCATION_ATTEMPTS = 16
+# Most addresses or subnets the bulk allocate RPCs will create in one call
+BULK_ALLOCATION_LIMIT = 1024
+# Page size of the usable listings when no limit is given, a whole IPv4 /16.
+# Larger pools, like an IPv6 /64, are paged with next_cursor instead of enumerated
+USABLE_LISTING_LIMIT = 65536
+# Rate limit tokens taken by the RPCs that walk or change whole pools, see core.ratelimit
+LISTING_COST = 5
+ALLOCATION_COST = 5
+UTILIZATION_COST = 5
+
+
+def find_target(model, args: dict):
+    """
+    Finds the SubnetModel or SupernetModel an RPC targets from the shared
+    vrf+network, id or name arguments, returns None if nothing matches
+    """
+    if args.get("network") and args.get("vrf"):
+        target_vrf = db.session.query(VRFModel).filter_by(
+            name=args.get("vrf")).first()
+        return db.session.query(model).filter_by(
+            network=ip_network(args.get("network"))).filter_by(vrf=target_vrf).first()
+    if args.get("id"):
+        return db.session.query(model).filter_by(id=args.get("id")).first()
+    if args.get("name"):
+        return db.session.query(model).filter_by(name=args.get("name")).first()
+    return None
+
+
+def has_target(args: dict) -> bool:
+    """
+    Checks that enough arguments were provided for find_target
+    """
+    return bool((args.get("network") and args.get("vrf")) or args.get("id") or args.get("name"))
+
+
+def usable_subnet_cost(request) -> int:
+    """
+    Rate limit cost of getUsableSubnet, only listings walk the whole supernet
+    """
+    return LISTING_COST if request.args.get("all") or request.args.get("format") == "ranges" else 1
+
+
+def take_page(items, limit: int = None) -> tuple:
+    """
+    Takes up to limit items, USABLE_LISTING_LIMIT by default, from an iterator
+    returns the page and whether any items remain after it
+    """
+    if limit is None:
+        limit = USABLE_LISTING_LIMIT
+    page = list(islice(items, limit + 1))
+    return page[:limit], len(page) > limit
+
 
 @api.route("/getUsableAddresses", strict_slashes=False)
 @api.doc(security='apikey')
@@ -27,48 +89,61 @@ class GetUsableAddress(Resource):
     """
     get_request_parser = reqparse.RequestParser()
     get_request_parser.add_argument(
-        "network", location="args", type=IPv4Network)
+        "network", location="args", type=ip_network)
     get_request_parser.add_argument("vrf", location="args")
     get_request_parser.add_argument("name", location="args")
     get_request_parser.add_argument("id", location="args")
+    get_request_parser.add_argument(
+        "format", location="args", choices=("list", "ranges"), default="list")
+    get_request_parser.add_argument("limit", location="args", type=inputs.positive)
+    get_request_parser.add_argument("cursor", location="args", type=ip_address)
 
     usable_address_model = api.model(name="usable_model",
                              model={
                                  "first_usable": fields.String,
                                  "all_usable": fields.List(fields.String),
+                                 "usable_ranges": fields.List(fields.List(fields.String)),
+                                 "next_cursor": fields.String,
                                  "percent_utilized": fields.Integer,
                              }
                              )
 
     @staticmethod
-    def find_usable_addresses(target_subnet: SubnetModel) -> str:
+    def find_usable_addresses(target_subnet: SubnetModel, format_: str = "list",
+                              limit: int = None, cursor=None) -> dict:
         """
-        Takes in a SubnetModel object, and parses through the db to find an available address
+        Takes in a SubnetModel object, and uses the subnet's free-space index
+        to find the available addresses
+        format_ "list" returns every usable address, "ranges" returns [start, end] blocks
+        limit and cursor page through either format, cursor is the last address already seen
         """
-        used_addresses = [str(address.address) for address in db.session.query(
-            AddressModel).filter_by(subnet=target_subnet).all()]
+        index = get_address_index(target_subnet)
+        first_usable = index.first_usable()
+        after = int(cursor) if cursor is not None else None
 
         staging_data = {"first_usable": "",
-                        "percent_utilized": 0}
-        all_usable = []
-        for host in target_subnet.network.hosts():
-            host_str = str(host)
-            if host_str not in used_addresses:
-                if not staging_data.get("first_usable"):
-                    staging_data["first_usable"] = host_str
-                all_usable.append(host_str)
-        
-        total_addresses = len(list(target_subnet.network.hosts()))
-        used_count = len(used_addresses)
-        staging_data["percent_utilized"] = int((used_count / total_addresses) * 100) if total_addresses > 0 else 0
-
-        staging_data['all_usable'] = all_usable
+                        "percent_utilized": index.percent_utilized()}
+        if first_usable is not None:
+            staging_data["first_usable"] = str(index.to_address(first_usable))
+
+        if format_ == "ranges":
+            ranges, more = take_page(index.free_ranges(after=after), limit)
+            staging_data["usable_ranges"] = [
+                [str(index.to_address(start)), str(index.to_address(end))] for start, end in ranges]
+            last_seen = ranges[-1][1] if ranges else None
+        else:
+            hosts, more = take_page(index.iter_free(after=after), limit)
+            staging_data["all_usable"] = [str(index.to_address(host)) for host in hosts]
+            last_seen = hosts[-1] if hosts else None
+
+        if more:
+            staging_data["next_cursor"] = str(index.to_address(last_seen))
         return staging_data
 
     @api.doc(security='apikey')
     @api.expect(get_request_parser)
-    @api.marshal_with(usable_address_model, envelope="data")
-    @apikey_validate(permission_level=5)
+    @marshal_with(api, usable_address_model, envelope="data")
+    @apikey_validate(permission_level=5, cost=LISTING_COST)
     def get(self):
         """
         handles GET method
@@ -76,34 +151,22 @@ class GetUsableAddress(Resource):
         returns first usable Address
         """
         args = self.get_request_parser.parse_args()
-        if args.get("network") and args.get("vrf"):
-            target_vrf = db.session.query(VRFModel).filter_by(
-                name=args.get("vrf")).first()
-            target_subnet = db.session.query(SubnetModel).filter_by(
-                network=IPv4Network(args.get("network"))).filter_by(vrf=target_vrf).first()
-
-        elif args.get("id"):
-            target_subnet = db.session.query(
-                SubnetModel).filter_by(id=args.get("id")).first()
-
-        elif args.get("name"):
-            target_subnet = db.session.query(SubnetModel).filter_by(
-                name=args.get("name")).first()
-
-        else:
+        if not has_target(args):
             return make_response(jsonify({
                 "status": "Failed",
                 "errors": ["Not enough information provided to find subnet",
                            "Please provide subnet.network+subnet.vrf, subnet.name, or subnet.id"]
             }))
 
+        target_subnet = find_target(SubnetModel, args)
         if not target_subnet:
             return make_response(jsonify({
                 "status": "Failed",
                 "errors": ["Unable to find requested subnet"]
             }), 404)
         usable_addresses = self.find_usable_addresses(
-            target_subnet=target_subnet)
+            target_subnet=target_subnet, format_=args.get("format"),
+            limit=args.get("limit"), cursor=args.get("cursor"))
         if not usable_addresses:
             return make_response(jsonify({
                 "status": "Failed",
@@ -122,67 +185,549 @@ class GetUsableSubnet(Resource):
     get_request_parser = GetUsableAddress.get_request_parser.copy()
     get_request_parser.add_argument("cidr_length", type=int, required=True)
     get_request_parser.add_argument("all", type=bool)
+    get_request_parser.replace_argument("cursor", location="args", type=ip_network)
+    get_request_parser.add_argument(
+        "fit", location="args", choices=("first", "best"), default="first")
 
     usable_subnet_model = api.model("usable_subnets", model={
         "first_usable": fields.String(),
-        "all_usable": fields.List(fields.String)
+        "all_usable": fields.List(fields.String),
+        "usable_ranges": fields.List(fields.List(fields.String)),
+        "next_cursor": fields.String(),
     })
 
     @staticmethod
-    def find_usable_subnet(supernet: SupernetModel, cidr_length: int, all_: bool=False):
+    def find_usable_subnet(supernet: SupernetModel, cidr_length: int, all_: bool=False,
+                           format_: str = "list", limit: int = None, cursor=None,
+                           fit: str = "first"):
         """
         Takes in a supernet, cidr length, and optional all boolean
         finds the first available subnet of size cidr_length if all != True
         finds all available subnets of size cidr length is all == True
+        fit "best" picks first_usable from the smallest free block that holds it
+        format_ "ranges" returns [first, last] blocks of consecutive free subnets instead
+        limit and cursor page through the listing, cursor is the last subnet already seen
         """
-        staging_data = {"first_usable": None}
-        usable_subnets = []
-        subnets = [subnet.network for subnet in supernet.subnets]
-        for supernet_subnet in supernet.network.subnets(new_prefix=cidr_length):
-            if not any(supernet_subnet.overlaps(existing_subnet) for existing_subnet in subnets):
-                usable_subnets.append(str(supernet_subnet))
-        
-        if not usable_subnets:
+        allocator = get_subnet_allocator(supernet)
+        if fit == "best":
+            first_usable = allocator.best_fit(cidr_length)
+        else:
+            first_usable = allocator.first_fit(cidr_length)
+        if first_usable is None:
             return None
-        
-        if all_:
-            staging_data["all_usable"] = usable_subnets
 
-        staging_data["first_usable"] = str(usable_subnets[0])
+        staging_data = {"first_usable": str(first_usable)}
+        if format_ == "ranges":
+            ranges, more = take_page(
+                allocator.free_ranges(cidr_length, after=cursor), limit)
+            staging_data["usable_ranges"] = [[str(first), str(last)] for first, last in ranges]
+            last_seen = ranges[-1][1] if ranges else None
+        elif all_:
+            usable_subnets, more = take_page(
+                allocator.iter_free(cidr_length, after=cursor), limit)
+            staging_data["all_usable"] = [str(subnet) for subnet in usable_subnets]
+            last_seen = usable_subnets[-1] if usable_subnets else None
+        else:
+            return staging_data
 
+        if more:
+            staging_data["next_cursor"] = str(last_seen)
         return staging_data
 
     @api.expect(get_request_parser)
     @api.doc(security='apikey')
-    @api.marshal_with(usable_subnet_model, envelope="data")
-    @apikey_validate(permission_level=5)
+    @marshal_with(api, usable_subnet_model, envelope="data")
+    @apikey_validate(permission_level=5, cost=usable_subnet_cost)
     def get(self):
         """
         handles the GET method
         """
         args = self.get_request_parser.parse_args()
-        if args.get("network") and args.get("vrf"):
-            target_vrf = db.session.query(VRFModel).filter_by(
-                name=args.get("vrf")).first()
-            target_supernet = db.session.query(SupernetModel).filter_by(
-                network=IPv4Network(args.get("network"))).filter_by(vrf=target_vrf).first()
+        if not has_target(args):
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Not enough information provided to find supernet",
+                           "Please provide supernet.network+supernet.vrf, supernet.name, or supernet.id"]
+            }), 404)
+
+        target_supernet = find_target(SupernetModel, args)
+        if not target_supernet:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Unable to find requested supernet"]
+            }), 404)
+        usable_subnet = self.find_usable_subnet(target_supernet, int(args.get("cidr_length")), all_=args.get("all"),
+                                                format_=args.get("format"), limit=args.get("limit"),
+                                                cursor=args.get("cursor"), fit=args.get("fit"))
 
-        elif args.get("id"):
-            target_supernet = db.session.query(
-                SupernetModel).filter_by(id=args.get("id")).first()
+        return usable_subnet
 
-        elif args.get("name"):
-            target_supernet = db.session.query(SupernetModel).filter_by(
-                name=args.get("name")).first()
 
-        else:
+@api.route("/allocateAddress", strict_slashes=False)
+@api.doc(security='apikey')
+class AllocateAddress(Resource):
+    """
+    Handles the /api/v1/rpc/allocateAddress route
+    methods: POST
+    picks the next free host in a subnet and creates the address in one call
+    """
+    target_request_parser = reqparse.RequestParser()
+    target_request_parser.add_argument(
+        "network", location="args", type=ip_network)
+    target_request_parser.add_argument("vrf", location="args")
+    target_request_parser.add_argument("name", location="args")
+    target_request_parser.add_argument("id", location="args")
+
+    post_request_parser = target_request_parser.copy()
+    post_request_parser.add_argument(
+        "name", location="json", required=True, dest="address_name")
+    post_request_parser.add_argument("mac_address", location="json")
+
+    allocated_address_model = api.model(name="allocated_address_model", model={
+        "name": fields.String(required=True, description="Name assigned to the address"),
+        "address": fields.String(required=True, description="Address that was allocated"),
+        "id": fields.Integer(required=True, description="ID as assigned by DB"),
+        "mac_address": fields.String(description="MAC address associated with the address"),
+        "subnet": fields.String(attribute="subnet.network", description="Subnet the address was allocated from"),
+        "vrf": fields.String(attribute="vrf.name", description="VRF the address belongs to"),
+    })
+
+    @staticmethod
+    def allocate_address(target_subnet: SubnetModel, name: str, mac_address: str = None):
+        """
+        Inserts an AddressModel for the first free host of target_subnet
+        Allocations in the same subnet are serialized by the subnet's lock, and the
+        subnet row is locked for update on databases that support it. If another
+        process wins the race for a host, the index learns about it and the next
+        free host is tried, so callers never see the unique constraint conflict
+        returns the new AddressModel, or None when no host could be allocated
+        """
+        subnet_id = target_subnet.id
+        with allocation_lock("subnet", subnet_id):
+            for _ in range(ALLOCATION_ATTEMPTS):
+                target_subnet = db.session.query(SubnetModel).filter_by(
+                    id=subnet_id).with_for_update().first()
+                index = get_address_index(target_subnet)
+                candidate = index.first_usable()
+                if candidate is None:
+                    db.session.rollback()
+                    return None
+                candidate = index.to_address(candidate)
+                new_address = AddressModel(
+                    name=name,
+                    address=str(candidate),
+                    vrf_id=target_subnet.vrf_id,
+                    subnet=target_subnet
+                )
+                if mac_address:
+                    new_address.mac_address = mac_address
+                db.session.add(new_address)
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    db.session.rollback()
+                    taken = db.session.query(AddressModel.id).filter_by(
+                        address=str(candidate), vrf_id=target_subnet.vrf_id).first()
+                    if not taken:
+                        raise
+                    address_added(subnet_id, candidate)
+                    continue
+                address_added(subnet_id, candidate)
+                bump_revision(target_subnet.vrf_id)
+                return new_address
+        return None
+
+    @api.doc(security='apikey')
+    @api.expect(post_request_parser)
+    @api.response(200, "Success", allocated_address_model)
+    @apikey_validate(permission_level=10)
+    def post(self):
+        """
+        handles POST method
+        Takes a subnet by id, name, or vrf+network in the query string and
+        the new address' name and optional mac_address in the payload
+        returns the allocated Address
+        """
+        args = self.post_request_parser.parse_args()
+        if not has_target(args):
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Not enough information provided to find subnet",
+                           "Please provide subnet.network+subnet.vrf, subnet.name, or subnet.id"]
+            }), 400)
+
+        target_subnet = find_target(SubnetModel, args)
+        if not target_subnet:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Unable to find requested subnet"]
+            }), 404)
+
+        new_address = self.allocate_address(target_subnet, name=args.get("address_name"),
+                                            mac_address=args.get("mac_address"))
+        if not new_address:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Pool for target subnet is depleted, no address could be allocated"]
+            }), 409)
+        return make_response(jsonify({
+            "status": "Success",
+            "data": marshal(new_address, self.allocated_address_model)
+        }), 200)
+
+
+@api.route("/allocateAddresses", strict_slashes=False)
+@api.doc(security='apikey')
+class AllocateAddresses(Resource):
+    """
+    Handles the /api/v1/rpc/allocateAddresses route
+    methods: POST
+    allocates a batch of addresses in a subnet with a single transaction
+    """
+    post_request_parser = AllocateAddress.target_request_parser.copy()
+    post_request_parser.add_argument("names", location="json", type=list)
+    post_request_parser.add_argument("count", location="json", type=inputs.positive)
+    post_request_parser.add_argument("name_prefix", location="json")
+    post_request_parser.add_argument("contiguous", location="json", type=bool, default=False)
+
+    allocated_addresses_model = api.model(name="allocated_addresses_model", model={
+        "allocated": fields.List(fields.Nested(AllocateAddress.allocated_address_model))
+    })
+
+    @staticmethod
+    def allocate_addresses(target_subnet: SubnetModel, count: int, names: list = None,
+                           name_prefix: str = None, contiguous: bool = False) -> list:
+        """
+        Reserves count hosts from target_subnet's free-space index and inserts
+        every AddressModel in one commit, which SQLAlchemy sends as a single
+        executemany-style flush. Retries with a rebuilt index if another writer
+        took one of the hosts first
+        Without names, each address is named <name_prefix>-<address>
+        returns the new AddressModels, or [] if the hosts don't fit
+        """
+        subnet_id = target_subnet.id
+        with allocation_lock("subnet", subnet_id):
+            for _ in range(ALLOCATION_ATTEMPTS):
+                target_subnet = db.session.query(SubnetModel).filter_by(
+                    id=subnet_id).with_for_update().first()
+                index = get_address_index(target_subnet)
+                hosts = [index.to_address(host) for host in index.reserve(count, contiguous=contiguous)]
+                if not hosts:
+                    db.session.rollback()
+                    return []
+                new_addresses = [
+                    AddressModel(name=name, address=str(host),
+                                 vrf_id=target_subnet.vrf_id, subnet=target_subnet)
+                    for name, host in zip(names or [f"{name_prefix}-{host}" for host in hosts], hosts)
+                ]
+                db.session.add_all(new_addresses)
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    db.session.rollback()
+                    taken = db.session.query(AddressModel.id).filter(
+                        AddressModel.vrf_id == target_subnet.vrf_id,
+                        AddressModel.address.in_([str(host) for host in hosts])).first()
+                    if not taken:
+                        raise
+                    drop_address_index(subnet_id)
+                    continue
+                for host in hosts:
+                    address_added(subnet_id, host)
+                bump_revision(target_subnet.vrf_id)
+                return new_addresses
+        return []
+
+    @api.doc(security='apikey')
+    @api.expect(post_request_parser)
+    @api.response(200, "Success", allocated_addresses_model)
+    @apikey_validate(permission_level=10, cost=ALLOCATION_COST)
+    def post(self):
+        """
+        handles POST method
+        Takes a subnet by id, name, or vrf+network in the query string and either
+        a list of names, or a count and name_prefix in the payload
+        returns every allocated Address
+        """
+        args = self.post_request_parser.parse_args()
+        if not has_target(args):
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Not enough information provided to find subnet",
+                           "Please provide subnet.network+subnet.vrf, subnet.name, or subnet.id"]
+            }), 400)
+        if not args.get("names") and not (args.get("count") and args.get("name_prefix")):
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Please provide a list of names, or a count and name_prefix"]
+            }), 400)
+        count = len(args.get("names")) if args.get("names") else args.get("count")
+        if count > BULK_ALLOCATION_LIMIT:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": [f"At most {BULK_ALLOCATION_LIMIT} addresses can be allocated per call"]
+            }), 400)
+
+        target_subnet = find_target(SubnetModel, args)
+        if not target_subnet:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Unable to find requested subnet"]
+            }), 404)
+
+        new_addresses = self.allocate_addresses(target_subnet, count, names=args.get("names"),
+                                                name_prefix=args.get("name_prefix"),
+                                                contiguous=args.get("contiguous"))
+        if not new_addresses:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": [f"Target subnet does not have {count} free addresses to allocate"]
+            }), 409)
+        return make_response(jsonify({
+            "status": "Success",
+            "data": marshal({"allocated": new_addresses}, self.allocated_addresses_model)
+        }), 200)
+
+
+@api.route("/allocateSubnets", strict_slashes=False)
+@api.doc(security='apikey')
+class AllocateSubnets(Resource):
+    """
+    Handles the /api/v1/rpc/allocateSubnets route
+    methods: POST
+    allocates a batch of subnets of size cidr_length in a supernet with a single transaction
+    """
+    post_request_parser = AllocateAddresses.post_request_parser.copy()
+    post_request_parser.add_argument("cidr_length", location="json", type=int, required=True)
+    post_request_parser.add_argument(
+        "fit", location="json", choices=("first", "best"), default="first")
+
+    allocated_subnet_model = api.model(name="allocated_subnet_model", model={
+        "name": fields.String(required=True, description="Name assigned to the network"),
+        "network": fields.String(required=True, description="Network in CIDR format"),
+        "id": fields.Integer(required=True, description="ID as assigned by DB"),
+        "supernet": fields.String(attribute="supernet.network", description="Supernet the subnet was allocated from"),
+        "vrf": fields.String(attribute="vrf.name", description="VRF the subnet belongs to"),
+    })
+    allocated_subnets_model = api.model(name="allocated_subnets_model", model={
+        "allocated": fields.List(fields.Nested(allocated_subnet_model))
+    })
+
+    @staticmethod
+    def allocate_subnets(target_supernet: SupernetModel, cidr_length: int, count: int, names: list = None,
+                         name_prefix: str = None, contiguous: bool = False, fit: str = "first") -> list:
+        """
+        Reserves count subnets in target_supernet's allocator and inserts every
+        SubnetModel in one commit. The reservation is undone if the commit fails,
+        and retried with a rebuilt allocator if another writer took one of the subnets
+        Without names, each subnet is named <name_prefix>-<network>
+        returns the new SubnetModels, or [] if the subnets don't fit
+        """
+        supernet_id = target_supernet.id
+        with allocation_lock("supernet", supernet_id):
+            for _ in range(ALLOCATION_ATTEMPTS):
+                target_supernet = db.session.query(SupernetModel).filter_by(
+                    id=supernet_id).with_for_update().first()
+                allocator = get_subnet_allocator(target_supernet)
+                networks = allocator.reserve(cidr_length, count, contiguous=contiguous, fit=fit)
+                if not networks:
+                    db.session.rollback()
+                    return []
+                new_subnets = [
+                    SubnetModel(name=name, network=str(network),
+                                vrf_id=target_supernet.vrf_id, supernet=target_supernet)
+                    for name, network in zip(names or [f"{name_prefix}-{network}" for network in networks], networks)
+                ]
+                db.session.add_all(new_subnets)
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    db.session.rollback()
+                    for network in networks:
+                        allocator.release(network)
+                    taken = db.session.query(SubnetModel.id).filter(
+                        SubnetModel.vrf_id == target_supernet.vrf_id,
+                        SubnetModel.network.in_([str(network) for network in networks])).first()
+                    if not taken:
+                        raise
+                    drop_subnet_allocator(supernet_id)
+                    continue
+                for new_subnet in new_subnets:
+                    prefix_added(SubnetModel, new_subnet.vrf_id, ip_network(new_subnet.network), new_subnet.id)
+                bump_revision(target_supernet.vrf_id)
+                return new_subnets
+        return []
+
+    @api.doc(security='apikey')
+    @api.expect(post_request_parser)
+    @api.response(200, "Success", allocated_subnets_model)
+    @apikey_validate(permission_level=10, cost=ALLOCATION_COST)
+    def post(self):
+        """
+        handles POST method
+        Takes a supernet by id, name, or vrf+network in the query string, and
+        cidr_length plus either a list of names, or a count and name_prefix in the payload
+        returns every allocated Subnet
+        """
+        args = self.post_request_parser.parse_args()
+        if not has_target(args):
             return make_response(jsonify({
                 "status": "Failed",
                 "errors": ["Not enough information provided to find supernet",
                            "Please provide supernet.network+supernet.vrf, supernet.name, or supernet.id"]
+            }), 400)
+        if not args.get("names") and not (args.get("count") and args.get("name_prefix")):
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Please provide a list of names, or a count and name_prefix"]
+            }), 400)
+        count = len(args.get("names")) if args.get("names") else args.get("count")
+        if count > BULK_ALLOCATION_LIMIT:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": [f"At most {BULK_ALLOCATION_LIMIT} subnets can be allocated per call"]
+            }), 400)
+
+        target_supernet = find_target(SupernetModel, args)
+        if not target_supernet:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": ["Unable to find requested supernet"]
             }), 404)
-        
-        usable_subnet = self.find_usable_subnet(target_supernet, int(args.get("cidr_length")), all_=args.get("all"))
 
-        return usable_subnet
+        new_subnets = self.allocate_subnets(target_supernet, args.get("cidr_length"), count,
+                                            names=args.get("names"), name_prefix=args.get("name_prefix"),
+                                            contiguous=args.get("contiguous"), fit=args.get("fit"))
+        if not new_subnets:
+            return make_response(jsonify({
+                "status": "Failed",
+                "errors": [f"Target supernet does not have room for {count} /{args.get('cidr_length')} subnets"]
+            }), 409)
+        return make_response(jsonify({
+            "status": "Success",
+            "data": marshal({"allocated": new_subnets}, self.allocated_subnets_model)
+        }), 200)
+
+
+@api.route("/utilization", strict_slashes=False)
+@api.doc(security='apikey')
+class Utilization(Resource):
+    """
+    Handles the /api/v1/rpc/utilization route
+    methods: GET
+    reports address utilization per vrf, supernet and subnet using grouped SQL aggregates
+    """
+    get_request_parser = reqparse.RequestParser()
+    get_request_parser.add_argument(
+        "level", location="args", choices=("vrf", "supernet", "subnet"), action="append")
+    get_request_parser.add_argument("vrf", location="args")
+    get_request_parser.add_argument("min_percent", location="args", type=float)
+    get_request_parser.add_argument("max_percent", location="args", type=float)
+    get_request_parser.add_argument(
+        "sort", location="args", choices=("percent_utilized", "used", "capacity", "name"),
+        default="percent_utilized")
+    get_request_parser.add_argument(
+        "order", location="args", choices=("asc", "desc"), default="desc")
+    get_request_parser.add_argument("limit", location="args", type=inputs.positive)
+
+    utilization_row_model = api.model(name="utilization_row_model", model={
+        "id": fields.Integer(description="ID as assigned by DB"),
+        "name": fields.String(description="Name of the vrf, supernet or subnet"),
+        "network": fields.String(description="Network in CIDR format, not set for vrfs"),
+        "vrf": fields.String(description="VRF the network belongs to, not set for vrfs"),
+        "subnet_count": fields.Integer(description="Number of subnets, not set for subnets"),
+        "used": fields.Integer(description="Number of addresses assigned"),
+        "capacity": fields.Integer(description="Number of usable hosts in the subnets"),
+        "percent_utilized": fields.Integer(description="Percent of usable hosts assigned"),
+    })
+    utilization_model = api.model(name="utilization_model", model={
+        "vrfs": fields.List(fields.Nested(utilization_row_model, skip_none=True)),
+        "supernets": fields.List(fields.Nested(utilization_row_model, skip_none=True)),
+        "subnets": fields.List(fields.Nested(utilization_row_model, skip_none=True)),
+    })
+
+    @staticmethod
+    def level_query(level: str):
+        """
+        Builds the grouped aggregate query for one level of the report
+        address counts are grouped per subnet once, then rolled up to
+        supernets and vrfs alongside the subnets' capacity
+        """
+        address_counts = select(
+            AddressModel.subnet_id, func.count(AddressModel.id).label("used")
+        ).group_by(AddressModel.subnet_id).subquery()
+        used = func.coalesce(address_counts.c.used, 0)
+
+        if level == "subnet":
+            capacity = func.coalesce(SubnetModel.capacity, 0)
+            query = select(
+                SubnetModel.id, SubnetModel.name, SubnetModel.network,
+                VRFModel.name.label("vrf"), used.label("used"), capacity.label("capacity")
+            ).join(VRFModel, SubnetModel.vrf_id == VRFModel.id).outerjoin(
+                address_counts, address_counts.c.subnet_id == SubnetModel.id)
+            name_column = SubnetModel.name
+        else:
+            used = func.sum(used)
+            capacity = func.coalesce(func.sum(SubnetModel.capacity), 0)
+            subnet_count = func.count(SubnetModel.id).label("subnet_count")
+            if level == "supernet":
+                query = select(
+                    SupernetModel.id, SupernetModel.name, SupernetModel.network,
+                    VRFModel.name.label("vrf"), subnet_count
+                ).join(VRFModel, SupernetModel.vrf_id == VRFModel.id).outerjoin(
+                    SubnetModel, SubnetModel.supernet_id == SupernetModel.id)
+                name_column = SupernetModel.name
+                group_by = SupernetModel.id
+            else:
+                query = select(VRFModel.id, VRFModel.name, subnet_count).outerjoin(
+                    SubnetModel, SubnetModel.vrf_id == VRFModel.id)
+                name_column = VRFModel.name
+                group_by = VRFModel.id
+            query = query.outerjoin(
+                address_counts, address_counts.c.subnet_id == SubnetModel.id
+            ).add_columns(
+                func.coalesce(used, 0).label("used"), capacity.label("capacity")
+            ).group_by(group_by)
+        percent = case((capacity > 0, 100.0 * used / capacity), else_=0)
+        return query.add_columns(percent.label("percent_utilized")), name_column, percent, used, capacity
+
+    @classmethod
+    def build_report(cls, level: str, args: dict) -> list:
+        """
+        Runs the aggregate query for one level with the requested filters and sorting
+        """
+        query, name_column, percent, used, capacity = cls.level_query(level)
+        if args.get("vrf"):
+            query = query.where(VRFModel.name == args.get("vrf"))
+        conditions = []
+        if args.get("min_percent") is not None:
+            conditions.append(percent >= args.get("min_percent"))
+        if args.get("max_percent") is not None:
+            conditions.append(percent <= args.get("max_percent"))
+        if conditions:
+            # subnet rows are not grouped, the rolled up levels filter on their aggregates
+            query = query.where(*conditions) if level == "subnet" else query.having(*conditions)
+        sort_column = {"percent_utilized": percent, "used": used,
+                       "capacity": capacity, "name": name_column}[args.get("sort")]
+        sort_column = sort_column.asc() if args.get("order") == "asc" else sort_column.desc()
+        query = query.order_by(sort_column, name_column)
+        if args.get("limit"):
+            query = query.limit(args.get("limit"))
+        return [row._asdict() for row in db.session.execute(query)]
+
+    @api.doc(security='apikey')
+    @api.expect(get_request_parser)
+    @marshal_with(api, utilization_model, envelope="data")
+    @api.doc(params={"level": "vrf, supernet or subnet, repeat for several levels, all levels by default",
+                     "min_percent": "only report rows at or above this utilization, ex. 90",
+                     "max_percent": "only report rows at or below this utilization"})
+    @apikey_validate(permission_level=5, cost=UTILIZATION_COST)
+    def get(self):
+        """
+        handles GET method
+        returns utilization rows for each requested level, sorted and filtered
+        """
+        args = self.get_request_parser.parse_args()
+        levels = args.get("level") or ["vrf", "supernet", "subnet"]
+        return {f"{level}s": self.build_report(level, args) for level in levels}
 
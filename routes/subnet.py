@@ -2,11 +2,18 @@
 Author: James Duvall
 Purpose: RESTful API for creating and modifying subnets within the IPAM
 """
-from ipaddress import IPv4Network
+from ipaddress import ip_network
 from flask_restx import Namespace, Resource, fields, reqparse
 from flask import jsonify, make_response
+from sqlalchemy.orm import joinedload
 from core.authen import apikey_validate
 from core.db import db
+from core.serializers import marshal_with
+from core.streaming import STREAM_PARAMS, add_format_argument, stream_cost, stream_ndjson
+from core.pagination import PAGINATION_PARAMS, add_pagination_arguments, paginate
+from core.freespace import drop_address_index, subnet_added, subnet_removed
+from core.prefixtrie import get_prefix_trie, prefix_added, prefix_removed
+from core.revision import bump_revision, conditional_get
 from models.vrfmodel import VRFModel
 from models.supernetmodel import SupernetModel
 from models.subnetmodel import SubnetModel
@@ -28,13 +35,21 @@ class Subnet(Resource):
     base_request_parser = reqparse.RequestParser()
 
     post_request_parser = base_request_parser.copy()
-    post_request_parser.add_argument("network", location="json", required=True, type=IPv4Network)
+    post_request_parser.add_argument("network", location="json", required=True, type=ip_network)
     post_request_parser.add_argument("name", location="json", required=True)
     post_request_parser.add_argument("vrf", location="json", default="Global")
 
+    # Sort orders of the listing, each ends with a unique column for keyset paging
+    list_orders = {
+        "id": (SubnetModel.id,),
+        "network": (SubnetModel.start, SubnetModel.prefixlen, SubnetModel.id),
+    }
+
     get_request_parser = base_request_parser.copy()
     get_request_parser.add_argument("id", location="args")
     get_request_parser.add_argument("name", location="args")
+    add_pagination_arguments(get_request_parser, orders=tuple(list_orders))
+    add_format_argument(get_request_parser)
 
     delete_request_parser = base_request_parser.copy()
     delete_request_parser.add_argument("id", location="args")
@@ -54,69 +69,84 @@ class Subnet(Resource):
         "name": fields.String(required=True, description="Name assigned to the network"),
         "network": fields.String(required=True, description="Network in CIDR format"),
         "id": fields.Integer(required=True, description="ID as assigned by DB"),
+        "used_count": fields.Integer(description="Number of addresses assigned in the subnet"),
+        "capacity": fields.Integer(description="Number of usable hosts in the subnet"),
+        "percent_utilized": fields.Integer(description="Percent of usable hosts assigned"),
         "vrf": fields.Nested(vrf_out_model, required=True, description="VRF assigned"),
         "supernet": fields.Nested(supernet_out_model, required=True, description="Assigned supernet")
     })
 
+    @staticmethod
+    def subnet_query():
+        """
+        Query of SubnetModel that loads the vrf and supernet subnet_out_model
+        nests in the same SELECT, instead of one lazy load per row
+        """
+        return db.session.query(SubnetModel).options(
+            joinedload(SubnetModel.vrf), joinedload(SubnetModel.supernet))
+
     @staticmethod
     def find_supernet(provided_network: str, provided_vrf: str) -> SupernetModel:
         """
-        Queries the db for all supernets in the provided vrf
+        Looks the provided network up in the vrf's supernet trie
         finds the supernet that covers the requested subnet
         returns that supernet
         """
-        provided_network = IPv4Network(provided_network)
+        provided_network = ip_network(provided_network)
         vrf = db.session.query(VRFModel).filter_by(name=provided_vrf).first()
         if not vrf:
             return False
-        supernets = db.session.query(SupernetModel).filter_by(vrf=vrf).all()
-        for supernet in supernets:
-            if provided_network.subnet_of(supernet.network):
-                return supernet
+        supernet_id = get_prefix_trie(SupernetModel, vrf.id).longest_match(provided_network)
+        if supernet_id is None:
+            return False
 
-        return False
+        return db.session.get(SupernetModel, supernet_id) or False
 
     @staticmethod
     def check_for_network_conflict(provided_network: str, provided_vrf: str) -> bool:
         """
-        Converts the provided str network into an IPv4 network and checks if
+        Converts the provided str network into an IPv4 or IPv6 network and checks if
         the provided network is already a part of an existing supernet or encompasses any existing network.
+        Runs as a range query on the (vrf_id, start, end) index
         """
-        provided_network = IPv4Network(provided_network)
+        provided_network = ip_network(provided_network)
         provided_vrf_model = db.session.query(
             VRFModel).filter_by(name=provided_vrf).first()
-        all_networks = [
-            IPv4Network(network.network) for network in db.session.query(SubnetModel).filter_by(vrf=provided_vrf_model).all()
-        ]
-
-        conflict = any(
-            net.subnet_of(provided_network) or
-            net.supernet_of(provided_network) or
-            net == provided_network
-            for net in all_networks
-        )
+        if not provided_vrf_model:
+            return False
+
+        conflict = SubnetModel.overlapping(
+            db.session, provided_vrf_model.id, provided_network).first() is not None
 
         return conflict
     
     @api.doc(security='apikey')
     @api.expect(get_request_parser)
     @api.doc(params={"id": "id of the network you wish to get"})
-    @api.marshal_with(subnet_out_model, envelope="data")
-    @apikey_validate(permission_level=5)
+    @marshal_with(api, subnet_out_model, envelope="data")
+    @api.doc(params=PAGINATION_PARAMS)
+    @api.doc(params=STREAM_PARAMS)
+    @apikey_validate(permission_level=5, cost=stream_cost)
     def get(self):
         """
         Handles the GET method
         returns subnets and subordinate addresses based on provided name or id
         """
         args = self.get_request_parser.parse_args()
+        not_modified, etag_headers = conditional_get()
+        if not_modified:
+            return not_modified
         if args.get("id"):
-            subnet = db.session.query(SubnetModel).filter_by(id=args.get("id")).first()
-            return subnet
+            subnet = self.subnet_query().filter_by(id=args.get("id")).first()
+            return subnet, 200, etag_headers
         elif args.get("name"):
-            subnet = db.session.query(SubnetModel).filter_by(name=args.get("name")).first()
-            return subnet
-        subnets = db.session.query(SubnetModel).all()
-        return subnets
+            subnet = self.subnet_query().filter_by(name=args.get("name")).first()
+            return subnet, 200, etag_headers
+        if args.get("format") == "ndjson":
+            return stream_ndjson(self.subnet_query().order_by(*self.list_orders[args.get("order")]),
+                                 self.subnet_out_model, headers=etag_headers)
+        subnets, headers = paginate(self.subnet_query(), args, orders=self.list_orders)
+        return subnets, 200, {**headers, **etag_headers}
 
     @api.doc(security='apikey')
     @api.expect(post_request_parser)
@@ -152,11 +182,14 @@ class Subnet(Resource):
         new_subnet = SubnetModel(
             name=args.get("name"),
             vrf=vrf_instance,
-            network=str(IPv4Network(args.get("network")))
+            network=str(ip_network(args.get("network")))
         )
         new_subnet.supernet = supernet
         db.session.add(new_subnet)
         db.session.commit()
+        subnet_added(supernet.id, ip_network(args.get("network")))
+        prefix_added(SubnetModel, vrf_instance.id, ip_network(args.get("network")), new_subnet.id)
+        bump_revision(vrf_instance.id)
         return make_response(jsonify({
             "status": "Success"
         }), 200)
@@ -181,8 +214,13 @@ class Subnet(Resource):
                 "status": "Failed",
                 "errors": ["No subnet found with provided id or name"]
             }), 404)
+        subnet_id, supernet_id, vrf_id, network = subnet.id, subnet.supernet_id, subnet.vrf_id, subnet.network
         db.session.delete(subnet)
         db.session.commit()
+        drop_address_index(subnet_id)
+        subnet_removed(supernet_id, network)
+        prefix_removed(SubnetModel, vrf_id, network)
+        bump_revision(vrf_id)
         return make_response(jsonify({
             "status": "Success"
         }))
@@ -2,13 +2,21 @@
 Author: James Duvall
 Purpose: RESTful API for creating and modifying supernets within the IPAM
 """
-from ipaddress import IPv4Network
+from ipaddress import ip_network
 from flask_restx import Namespace, Resource, fields, reqparse
 from flask import jsonify, make_response
+from sqlalchemy.orm import joinedload, selectinload
 from core.authen import apikey_validate
 from core.db import db
+from core.serializers import marshal_with
+from core.streaming import STREAM_PARAMS, add_format_argument, stream_cost, stream_ndjson
+from core.pagination import PAGINATION_PARAMS, add_pagination_arguments, paginate
+from core.freespace import drop_address_index, drop_subnet_allocator
+from core.prefixtrie import drop_prefix_trie, prefix_added, prefix_removed
+from core.revision import bump_revision, conditional_get
 from models.vrfmodel import VRFModel
 from models.supernetmodel import SupernetModel
+from models.subnetmodel import SubnetModel
 
 
 api = Namespace("api/v1/supernet",
@@ -27,13 +35,21 @@ class Supernet(Resource):
     base_request_parser = reqparse.RequestParser()
 
     post_request_parser = base_request_parser.copy()
-    post_request_parser.add_argument("network", location="json", required=True, type=IPv4Network)
+    post_request_parser.add_argument("network", location="json", required=True, type=ip_network)
     post_request_parser.add_argument("name", location="json", required=True)
     post_request_parser.add_argument("vrf", location="json", default="Global")
 
+    # Sort orders of the listing, each ends with a unique column for keyset paging
+    list_orders = {
+        "id": (SupernetModel.id,),
+        "network": (SupernetModel.start, SupernetModel.prefixlen, SupernetModel.id),
+    }
+
     get_request_parser = base_request_parser.copy()
     get_request_parser.add_argument("id", location="args")
     get_request_parser.add_argument("name", location="args")
+    add_pagination_arguments(get_request_parser, orders=tuple(list_orders))
+    add_format_argument(get_request_parser)
 
     delete_request_parser = base_request_parser.copy()
     delete_request_parser.add_argument("id", location="args")
@@ -54,51 +70,68 @@ class Supernet(Resource):
         "name": fields.String(required=True, description="Name assigned to the network"),
         "network": fields.String(required=True, description="Network in CIDR format"),
         "id": fields.Integer(required=True, description="ID as assigned by DB"),
+        "used_count": fields.Integer(description="Number of addresses carved into subnets"),
+        "capacity": fields.Integer(description="Number of addresses in the supernet"),
+        "percent_utilized": fields.Integer(description="Percent of the supernet carved into subnets"),
         "vrf": fields.Nested(vrf_out_model, required=True, description="VRF name associated to supernet"),
         "subnets": fields.Nested(subnet_out_model, required=True, description="All subnets associated to this supernet")
     })
 
+    @staticmethod
+    def supernet_query():
+        """
+        Query of SupernetModel that loads what supernet_out_model nests up front,
+        the vrf in the same SELECT and every row's subnets in one extra SELECT
+        """
+        return db.session.query(SupernetModel).options(
+            joinedload(SupernetModel.vrf), selectinload(SupernetModel.subnets))
+
     @staticmethod
     def check_for_network_conflict(provided_network: str, provided_vrf: str) -> bool:
         """
-        Converts the provided str network into an IPv4 network and checks if
+        Converts the provided str network into an IPv4 or IPv6 network and checks if
         the provided network is already a part of an existing supernet or encompasses any existing network.
+        Runs as a range query on the (vrf_id, start, end) index
         """
-        provided_network = IPv4Network(provided_network)
-        provided_vrf_model = db.session.query(VRFModel).filter_by(name=provided_vrf).first()
-        all_networks = [
-            IPv4Network(network.network) for network in db.session.query(SupernetModel).filter_by(vrf=provided_vrf_model).all()
-        ]
-
-        conflict = any(
-            net.subnet_of(provided_network) or 
-            net.supernet_of(provided_network) or 
-            net == provided_network
-            for net in all_networks
-        )
+        provided_network = ip_network(provided_network)
+        provided_vrf_model = db.session.query(
+            VRFModel).filter_by(name=provided_vrf).first()
+        if not provided_vrf_model:
+            return False
+
+        conflict = SupernetModel.overlapping(
+            db.session, provided_vrf_model.id, provided_network).first() is not None
 
         return conflict
         
     @api.doc(security='apikey')
     @api.expect(get_request_parser)
-    @api.marshal_with(supernet_out_model, envelope="data")
-    @apikey_validate(permission_level=5)
+    @marshal_with(api, supernet_out_model, envelope="data")
+    @api.doc(params=PAGINATION_PARAMS)
+    @api.doc(params=STREAM_PARAMS)
+    @apikey_validate(permission_level=5, cost=stream_cost)
     def get(self):
         """
         Handles the GET method, provides specific supernet object details, 
         or specific through the id query param
         """
         args = self.get_request_parser.parse_args()
+        not_modified, etag_headers = conditional_get()
+        if not_modified:
+            return not_modified
         if args.get("id"):
-            net = db.session.query(SupernetModel).filter_by(
+            net = self.supernet_query().filter_by(
                 id=args.get("id")).first()
-            return net
+            return net, 200, etag_headers
         elif args.get("name"):
-            net = db.session.query(SupernetModel).filter_by(
+            net = self.supernet_query().filter_by(
                 name=args.get("name")).first()
-            return net
-        all_nets = db.session.query(SupernetModel).all()
-        return all_nets
+            return net, 200, etag_headers
+        if args.get("format") == "ndjson":
+            return stream_ndjson(self.supernet_query().order_by(*self.list_orders[args.get("order")]),
+                                 self.supernet_out_model, headers=etag_headers)
+        all_nets, headers = paginate(self.supernet_query(), args, orders=self.list_orders)
+        return all_nets, 200, {**headers, **etag_headers}
 
     @api.doc(security='apikey')
     @api.expect(post_request_parser)
@@ -129,6 +162,8 @@ class Supernet(Resource):
         new_supernet.vrf = associated_vrf
         db.session.add(new_supernet)
         db.session.commit()
+        prefix_added(SupernetModel, associated_vrf.id, ip_network(args.get("network")), new_supernet.id)
+        bump_revision(associated_vrf.id)
         return make_response(jsonify({
             "status": "Success"
         }))
@@ -151,8 +186,14 @@ class Supernet(Resource):
                 "status": "Failed",
                 "errors": ["Provided subnet id does not exist"]
             })
+        supernet_id, vrf_id, network = target_supernet.id, target_supernet.vrf_id, target_supernet.network
         db.session.delete(target_supernet)
         db.session.commit()
+        drop_address_index()
+        drop_subnet_allocator(supernet_id)
+        prefix_removed(SupernetModel, vrf_id, network)
+        drop_prefix_trie(SubnetModel, vrf_id)
+        bump_revision(vrf_id)
         return jsonify({
             "status": "Success"
         })
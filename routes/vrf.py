@@ -4,8 +4,15 @@ Purpose: RESTful API for creating and modifying vrfs within the IPAM
 """
 from flask_restx import Namespace, Resource, fields, reqparse
 from flask import jsonify, make_response
+from sqlalchemy.orm import selectinload
 from core.authen import apikey_validate
 from core.db import db
+from core.serializers import marshal_with
+from core.streaming import STREAM_PARAMS, add_format_argument, stream_cost, stream_ndjson
+from core.pagination import PAGINATION_PARAMS, add_pagination_arguments, paginate
+from core.freespace import drop_address_index, drop_subnet_allocator
+from core.prefixtrie import drop_prefix_trie
+from core.revision import bump_revision, conditional_get
 from models.vrfmodel import VRFModel
 
 
@@ -29,9 +36,17 @@ class VRF(Resource):
     post_request_parser = base_request_parser.copy()
     post_request_parser.add_argument("name", location="json", required=True)
 
+    # Sort orders of the listing, each ends with a unique column for keyset paging
+    list_orders = {
+        "id": (VRFModel.id,),
+        "name": (VRFModel.name,),
+    }
+
     get_request_parser = base_request_parser.copy()
     get_request_parser.add_argument("id", location="args")
     get_request_parser.add_argument("name", location="args")
+    add_pagination_arguments(get_request_parser, orders=tuple(list_orders))
+    add_format_argument(get_request_parser)
 
     delete_request_parser = base_request_parser.copy()
     delete_request_parser.add_argument("id", location="args")
@@ -50,26 +65,41 @@ class VRF(Resource):
         "id": fields.Integer(required=True, description="VRF DB Primary key"),
         "supernets": fields.Nested(supernet_out_model, required=True, description="The VRF's attached supernets")
     })
+
+    @staticmethod
+    def vrf_query():
+        """
+        Query of VRFModel that loads every row's supernets, which vrf_out_model
+        nests, in one extra SELECT instead of one per vrf
+        """
+        return db.session.query(VRFModel).options(selectinload(VRFModel.supernets))
+
     @api.doc(security='apikey')
     @api.expect(get_request_parser)
-    @api.marshal_with(vrf_out_model, envelope="data")
-    @apikey_validate(permission_level=5)
+    @marshal_with(api, vrf_out_model, envelope="data")
+    @api.doc(params=PAGINATION_PARAMS)
+    @api.doc(params=STREAM_PARAMS)
+    @apikey_validate(permission_level=5, cost=stream_cost)
     def get(self):
         # TODO - Find some way to limit output based on params, right now all subnet/supernets displayed
         """
         Handles the GET method, displays single more multiple vrfs
         """
         args = self.get_request_parser.parse_args()
+        not_modified, etag_headers = conditional_get()
+        if not_modified:
+            return not_modified
         if args.get("id"):
-            target_vrf = db.session.query(
-                VRFModel).filter_by(id=args.get("id")).first()
-            return target_vrf
+            target_vrf = self.vrf_query().filter_by(id=args.get("id")).first()
+            return target_vrf, 200, etag_headers
         elif args.get("name"):
-            target_vrf = db.session.query(
-                VRFModel).filter_by(name=args.get("name")).first()
-            return target_vrf
-        vrfs = db.session.query(VRFModel).all()
-        return vrfs
+            target_vrf = self.vrf_query().filter_by(name=args.get("name")).first()
+            return target_vrf, 200, etag_headers
+        if args.get("format") == "ndjson":
+            return stream_ndjson(self.vrf_query().order_by(*self.list_orders[args.get("order")]),
+                                 self.vrf_out_model, headers=etag_headers)
+        vrfs, headers = paginate(self.vrf_query(), args, orders=self.list_orders)
+        return vrfs, 200, {**headers, **etag_headers}
 
     @api.doc(security='apikey')
     @api.expect(post_request_parser)
@@ -82,6 +112,7 @@ class VRF(Resource):
         new_vrf = VRFModel(name=args.get("name"))
         db.session.add(new_vrf)
         db.session.commit()
+        bump_revision(new_vrf.id)
         return make_response(jsonify({
             "status": "Success"
         }))
@@ -105,8 +136,13 @@ class VRF(Resource):
                 "status": "Failed",
                 "errors": ["No id or name provided for the vrf"]
             }))
+        vrf_id = target_vrf.id
         db.session.delete(target_vrf)
         db.session.commit()
+        drop_address_index()
+        drop_subnet_allocator()
+        drop_prefix_trie(vrf_id=vrf_id)
+        bump_revision(vrf_id)
         return make_response(jsonify({
             "status": "Success"
         }), 200)
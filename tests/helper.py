@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash
 from sqlalchemy.exc import IntegrityError
 from models.user import User
@@ -108,3 +110,23 @@ def login(client, headers, username: str, password: str) -> str:
 
 
 
+
+
+@contextmanager
+def count_queries(app):
+    """
+    Helper context manager that records every SQL statement the app's engine
+    executes inside the block, yields the list of statements
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
@@ -1,6 +1,12 @@
-from tests.helper import create_subnet, create_address
+import gzip
+import json
+from ipaddress import ip_address, ip_network
+from sqlalchemy import text
+from tests.helper import count_queries, create_subnet, create_address
 from models.addressmodel import AddressModel
 from core.db import db
+from core.pagination import encode_cursor
+from routes.address import Address
 
 
 def test_create_address(app, client, admin_headers):
@@ -128,3 +134,174 @@ def test_patch_address(app, client, admin_headers):
         changed_address = db.session.query(AddressModel).filter_by(name="new_name").first()
         assert changed_address
         assert changed_address.mac_address == "d34db33fd34d"
+
+
+def test_create_address_follows_subnet_changes(app, client, admin_headers):
+    """
+    tests POST method of /api/v1/address
+    subnet lookups must follow subnets created and deleted through the api
+    """
+    create_subnet(app, name="test_subnet", network="192.168.1.0/24", supernet_network="192.168.0.0/16", vrfname="Global")
+    path = "/api/v1/address"
+    response = client.post(path, headers=admin_headers,
+                           json={"address": "192.168.2.1", "name": "lookup1", "vrf": "Global"})
+    assert response.status_code == 400
+
+    client.post("/api/v1/subnet", headers=admin_headers,
+                json={"name": "lookup_subnet", "network": "192.168.2.0/24", "vrf": "Global"})
+    response = client.post(path, headers=admin_headers,
+                           json={"address": "192.168.2.1", "name": "lookup1", "vrf": "Global"})
+    assert response.status_code == 200
+    with app.app_context():
+        assert db.session.query(AddressModel).filter_by(name="lookup1").first().subnet.name == "lookup_subnet"
+
+    client.delete("/api/v1/subnet?name=lookup_subnet", headers=admin_headers)
+    response = client.post(path, headers=admin_headers,
+                           json={"address": "192.168.2.2", "name": "lookup2", "vrf": "Global"})
+    assert response.status_code == 400
+
+
+def test_address_packed_storage(app, client, admin_headers):
+    """
+    addresses and networks are stored packed and decoded back into ipaddress objects
+    """
+    create_address(app, address="192.168.0.10", name="packed_v4")
+    create_address(app, address="2001:db8::10", name="packed_v6", subnet_network="2001:db8::/64",
+                   supernet_network="2001:db8::/48", subnet_name="packed_subnet")
+    with app.app_context():
+        stored = db.session.execute(text("SELECT name, address FROM address ORDER BY id")).all()
+        assert [(name, len(address)) for name, address in stored] == [("packed_v4", 4), ("packed_v6", 16)]
+        address = db.session.query(AddressModel).filter_by(address="2001:db8::10").first()
+        assert address.address == ip_address("2001:db8::10")
+        assert address.subnet.network == ip_network("2001:db8::/64")
+
+    response = client.get("/api/v1/address?name=packed_v6", headers=admin_headers)
+    assert response.json.get("data").get("address") == "2001:db8::10"
+    assert response.json.get("data").get("subnet").get("network") == "2001:db8::/64"
+
+
+def test_get_address_query_count(app, client, admin_headers):
+    """
+    GET /api/v1/address loads nested vrf and subnet without a query per row
+    the apikey is cached by the warm up request, one query loads the addresses
+    """
+    for host in range(1, 11):
+        create_address(app, address=f"192.168.0.{host}", name=f"query_count{host}",
+                       subnet_network="192.168.0.0/24")
+    client.get("/api/v1/address", headers=admin_headers)
+    for path in ["/api/v1/address", "/api/v1/address?vrf=Global", "/api/v1/address?id=1"]:
+        with count_queries(app) as statements:
+            response = client.get(path, headers=admin_headers)
+        assert response.status_code == 200
+        assert len(statements) == (2 if "vrf=" in path else 1)
+
+
+def test_get_address_pages(app, client, admin_headers):
+    """
+    tests limit, after, order and count on GET /api/v1/address
+    """
+    for host in [5, 1, 4, 2, 3]:
+        create_address(app, address=f"192.168.0.{host}", name=f"page{host}", subnet_network="192.168.0.0/24")
+    path = "/api/v1/address?order=address&limit=2"
+    response = client.get(f"{path}&count=true", headers=admin_headers)
+    assert response.headers.get("X-Total-Count") == "5"
+    seen = [address.get("address") for address in response.json.get("data")]
+    while response.headers.get("X-Next-Cursor"):
+        response = client.get(f"{path}&after={response.headers.get('X-Next-Cursor')}", headers=admin_headers)
+        assert len(response.json.get("data")) <= 2
+        seen += [address.get("address") for address in response.json.get("data")]
+    assert seen == [f"192.168.0.{host}" for host in range(1, 6)]
+
+    response = client.get("/api/v1/address?limit=3", headers=admin_headers)
+    assert [address.get("name") for address in response.json.get("data")] == ["page5", "page1", "page4"]
+    response = client.get("/api/v1/address?after=notacursor", headers=admin_headers)
+    assert response.status_code == 400
+    for key in (["x", 1], [-1, 1], [2 ** 200, 1], [True, 1], [[1], 1]):
+        response = client.get(f"/api/v1/address?after={encode_cursor('address', key)}", headers=admin_headers)
+        assert response.status_code == 400
+
+
+def test_patch_address_parser():
+    """
+    PATCH /api/v1/address takes no pagination or format arguments
+    """
+    patch_arguments = {argument.name for argument in Address.patch_request_parser.args}
+    assert patch_arguments == {"id", "name", "mac_address"}
+
+
+def test_get_address_ndjson_stream(app, client, admin_headers):
+    """
+    tests format=ndjson on GET /api/v1/address streams every row, a chunk at a time
+    """
+    app.config["STREAM_CHUNK_SIZE"] = 2
+    for host in range(1, 6):
+        create_address(app, address=f"192.168.0.{host}", name=f"stream{host}", subnet_network="192.168.0.0/24")
+    response = client.get("/api/v1/address?format=ndjson&order=address", headers=admin_headers, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    chunks = list(response.response)
+    assert len(chunks) == 3
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert [row.get("address") for row in rows] == [f"192.168.0.{host}" for host in range(1, 6)]
+    assert rows[0].get("subnet").get("network") == "192.168.0.0/24"
+
+
+def test_get_address_etag(app, client, admin_headers):
+    """
+    tests ETag / If-None-Match on GET /api/v1/address
+    an unchanged listing answers 304 without touching the database, the apikey is already cached
+    """
+    create_address(app, address="192.168.0.1", name="etag1", subnet_network="192.168.0.0/24")
+    create_address(app, address="10.0.0.1", name="etag2", subnet_network="10.0.0.0/24",
+                   supernet_network="10.0.0.0/16", vrfname="etag_vrf", subnet_name="etag_subnet")
+    response = client.get("/api/v1/address", headers=admin_headers)
+    etag = response.headers["ETag"]
+    vrf_etag = client.get("/api/v1/address?vrf=etag_vrf", headers=admin_headers).headers["ETag"]
+    assert etag.startswith('W/"') and vrf_etag != etag
+
+    with count_queries(app) as statements:
+        response = client.get("/api/v1/address", headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert len(statements) == 0
+    assert not response.get_data()
+
+    response = client.post("/api/v1/address", headers=admin_headers,
+                           json={"address": "192.168.0.2", "name": "etag3", "vrf": "Global"})
+    assert response.status_code == 200
+    response = client.get("/api/v1/address", headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    # The write was in the Global vrf, etag_vrf's listing is unchanged
+    response = client.get("/api/v1/address?vrf=etag_vrf", headers={**admin_headers, "If-None-Match": vrf_etag})
+    assert response.status_code == 304
+
+
+def test_get_address_gzip(app, client, admin_headers):
+    """
+    tests gzip negotiation through Accept-Encoding on GET /api/v1/address
+    listings pass the size threshold, streams are compressed chunk by chunk
+    """
+    for host in range(1, 21):
+        create_address(app, address=f"192.168.0.{host}", name=f"gzip{host}", subnet_network="192.168.0.0/24")
+    plain = client.get("/api/v1/address", headers=admin_headers)
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    gzip_headers = {**admin_headers, "Accept-Encoding": "gzip"}
+    response = client.get("/api/v1/address", headers=gzip_headers)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(response.get_data()) < len(plain.get_data())
+    assert json.loads(gzip.decompress(response.get_data())) == plain.json
+
+    response = client.get("/api/v1/address?id=1", headers=gzip_headers)
+    assert "Content-Encoding" not in response.headers
+    assert response.json.get("data").get("name") == "gzip1"
+
+    app.config["STREAM_CHUNK_SIZE"] = 5
+    response = client.get("/api/v1/address?format=ndjson", headers=gzip_headers, buffered=False)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    chunks = list(response.response)
+    assert len(chunks) == 5
+    rows = [json.loads(line) for line in gzip.decompress(b"".join(chunks)).splitlines()]
+    assert [row.get("name") for row in rows] == [f"gzip{host}" for host in range(1, 21)]
@@ -1,5 +1,10 @@
+from threading import Event, Thread
+from time import sleep
 import pytest
-from tests.helper import create_user, login
+from tests.helper import count_queries, create_user, login
+from models.user import User, apikey_digest
+from core.db import db
+from core.kdf import kdf_limiter
 
 
 def test_default_admin(app, client, headers):
@@ -75,3 +80,188 @@ def test_user_deletion(app, client, headers) -> None:
     user_status_response = client.get(
         user_status_path, headers=deletion_headers)
     assert user_status_response.status_code != 200
+
+
+def test_apikey_cache(app, client, headers) -> None:
+    """
+    Tests verified apikeys are served from the cache, and that changing
+    a user through /auth drops its cached apikeys
+    """
+    create_user(app, username="adminaccount", password="adminaccount",
+                permission_level=15, user_active=True)
+    admin_headers = {**headers, "X-Ipam-Apikey": login(client, headers, "adminaccount", "adminaccount")}
+    create_user(app, username="test_user", password="test_user", permission_level=5, user_active=True)
+    user_headers = {**headers, "X-Ipam-Apikey": login(client, headers, "test_user", "test_user")}
+
+    with count_queries(app) as statements:
+        for _ in range(3):
+            assert client.get("/api/v1/vrf?id=1", headers=user_headers).status_code == 200
+    assert sum("FROM user" in statement for statement in statements) == 1
+    stats = client.get("/auth/stats", headers=admin_headers).json["data"]["apikey_cache"]
+    assert stats == {"hits": 2, "misses": 2, "size": 2}
+
+    assert client.post("/api/v1/vrf", json={"name": "cache_vrf"}, headers=user_headers).status_code == 403
+    client.post("/auth/authorize", json={"username": "test_user", "permission_level": 10}, headers=admin_headers)
+    assert client.post("/api/v1/vrf", json={"name": "cache_vrf"}, headers=user_headers).status_code == 200
+
+    new_headers = {**headers, "X-Ipam-Apikey": login(client, headers, "test_user", "test_user")}
+    assert client.get("/api/v1/vrf?id=1", headers=user_headers).status_code == 401
+    assert client.get("/api/v1/vrf?id=1", headers=new_headers).status_code == 200
+
+    client.post("/auth/delete", json={"username": "test_user"}, headers=admin_headers)
+    assert client.get("/api/v1/vrf?id=1", headers=new_headers).status_code == 401
+
+
+def test_hashed_apikey(app, client, headers) -> None:
+    """
+    Tests only the digest of an apikey is stored, and that an apikey is
+    found through its apikey id, or through its digest when it has none
+    """
+    create_user(app, username="test_user", password="test_user", permission_level=5, user_active=True)
+    apikey = login(client, headers, "test_user", "test_user")
+    apikey_id, _, secret = apikey.partition(".")
+    with app.app_context():
+        user = db.session.query(User).filter_by(username="test_user").first()
+        assert user.apikey_id == apikey_id
+        assert user.apikey_digest == apikey_digest(apikey)
+        assert secret not in (user.apikey_id, user.apikey_digest)
+
+    assert client.get("/api/v1/vrf?id=1", headers={**headers, "X-Ipam-Apikey": apikey}).status_code == 200
+    forged = f"{apikey_id}.{secret[::-1]}"
+    assert client.get("/api/v1/vrf?id=1", headers={**headers, "X-Ipam-Apikey": forged}).status_code == 401
+
+    with app.app_context():
+        user = db.session.query(User).filter_by(username="test_user").first()
+        user.apikey_id, user.apikey_digest = None, apikey_digest("legacyapikey")
+        db.session.commit()
+    assert client.get("/api/v1/vrf?id=1", headers={**headers, "X-Ipam-Apikey": "legacyapikey"}).status_code == 200
+
+
+def test_signed_token(app, client, headers) -> None:
+    """
+    Tests signed tokens are only issued with a TOKEN_SECRET_KEY, authenticate
+    without the database, and that /auth/authorize and /auth/delete revoke them
+    """
+    create_user(app, username="adminaccount", password="adminaccount",
+                permission_level=15, user_active=True)
+    admin_headers = {**headers, "X-Ipam-Apikey": login(client, headers, "adminaccount", "adminaccount")}
+    create_user(app, username="test_user", password="test_user", permission_level=5, user_active=True)
+    response = client.post("/auth/login", headers=headers,
+                           json={"username": "test_user", "password": "test_user", "token_type": "signed"})
+    assert response.status_code == 400
+
+    app.config["TOKEN_SECRET_KEY"] = "test_token_secret"
+    response = client.post("/auth/login", headers=headers,
+                           json={"username": "test_user", "password": "test_user", "token_type": "signed"})
+    assert response.status_code == 200
+    token = response.json["data"]["X-Ipam-Apikey"]
+    token_headers = {**headers, "X-Ipam-Apikey": token}
+
+    with count_queries(app) as statements:
+        response = client.get("/api/v1/vrf?id=1", headers=token_headers)
+    assert response.status_code == 200
+    assert not any("FROM user" in statement for statement in statements)
+    assert client.post("/api/v1/vrf", json={"name": "signed_vrf"}, headers=token_headers).status_code == 403
+
+    signed, _, signature = token.rpartition(".")
+    forged = {**headers, "X-Ipam-Apikey": f"{signed}.{signature[::-1]}"}
+    assert client.get("/api/v1/vrf?id=1", headers=forged).status_code == 401
+    app.config["SIGNED_TOKEN_TTL"] = -1
+    response = client.post("/auth/login", headers=headers,
+                           json={"username": "test_user", "password": "test_user", "token_type": "signed"})
+    expired = {**headers, "X-Ipam-Apikey": response.json["data"]["X-Ipam-Apikey"]}
+    assert client.get("/api/v1/vrf?id=1", headers=expired).status_code == 400
+    app.config["SIGNED_TOKEN_TTL"] = 900
+
+    client.post("/auth/authorize", json={"username": "test_user", "permission_level": 10}, headers=admin_headers)
+    assert client.get("/api/v1/vrf?id=1", headers=token_headers).status_code == 401
+    response = client.post("/auth/login", headers=headers,
+                           json={"username": "test_user", "password": "test_user", "token_type": "signed"})
+    token_headers = {**headers, "X-Ipam-Apikey": response.json["data"]["X-Ipam-Apikey"]}
+    assert client.post("/api/v1/vrf", json={"name": "signed_vrf"}, headers=token_headers).status_code == 200
+
+    client.post("/auth/delete", json={"username": "test_user"}, headers=admin_headers)
+    assert client.get("/api/v1/vrf?id=1", headers=token_headers).status_code == 401
+    assert client.get("/auth/stats", headers=admin_headers).json["data"]["signed_token_revocations"] == 1
+
+
+def test_kdf_limiter(app, client, headers) -> None:
+    """
+    Tests password hashes use the configured method, that logins wait for
+    a free KDF slot, and get a 503 once they waited KDF_WAIT_TIMEOUT seconds
+    """
+    app.config.update(KDF_CONCURRENCY=1, KDF_WAIT_TIMEOUT=5, PASSWORD_HASH_METHOD="pbkdf2:sha256:1000")
+    credentials = {"username": "test_user", "password": "test_user"}
+    assert client.post("/auth/register", json=credentials, headers=headers).status_code == 200
+    with app.app_context():
+        user = db.session.query(User).filter_by(username="test_user").first()
+        assert user.password_hash.startswith("pbkdf2:sha256:1000$")
+        user.user_active = True
+        db.session.commit()
+        limiter = kdf_limiter()
+
+    release = Event()
+    blocker = Thread(target=limiter.run, args=(release.wait,))
+    blocker.start()
+    responses = []
+    waiter = Thread(target=lambda: responses.append(
+        app.test_client().post("/auth/login", json=credentials, headers=headers)))
+    waiter.start()
+    try:
+        while limiter.stats()["waiting"] == 0:
+            sleep(0.01)
+        assert limiter.stats()["running"] == 1
+    finally:
+        release.set()
+        blocker.join()
+        waiter.join()
+    assert responses[0].status_code == 200
+
+    limiter.timeout = 0.05
+    release.clear()
+    blocker = Thread(target=limiter.run, args=(release.wait,))
+    blocker.start()
+    try:
+        while limiter.stats()["running"] == 0:
+            sleep(0.01)
+        response = client.post("/auth/login", json=credentials, headers=headers)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        release.set()
+        blocker.join()
+    assert limiter.stats() == {"concurrency": 1, "max_waiting": 2, "running": 0, "waiting": 0, "completed": 4,
+                               "timed_out": 1, "rejected": 0}
+
+
+def test_kdf_queue_full(app, client, admin_headers) -> None:
+    """
+    Tests the api keeps answering while every KDF slot and the wait queue are taken,
+    and that a login finding the queue full gets a 503 straight away
+    """
+    app.config.update(KDF_CONCURRENCY=1, KDF_MAX_WAITING=1)
+    credentials = {"username": "test_admin", "password": "test_admin"}
+    with app.app_context():
+        limiter = kdf_limiter()
+
+    release = Event()
+    blocker = Thread(target=limiter.run, args=(release.wait,))
+    blocker.start()
+    responses = []
+    waiter = Thread(target=lambda: responses.append(
+        app.test_client().post("/auth/login", json=credentials, headers={"Content-Type": "application/json"})))
+    waiter.start()
+    try:
+        while limiter.stats()["waiting"] == 0:
+            sleep(0.01)
+        assert client.get("/api/v1/vrf", headers=admin_headers).status_code == 200
+        response = client.post("/auth/login", json=credentials, headers=admin_headers)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert limiter.stats()["waiting"] == 1
+    finally:
+        release.set()
+        blocker.join()
+        waiter.join()
+    assert responses[0].status_code == 200
+    assert limiter.stats()["rejected"] == 1
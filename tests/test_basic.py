@@ -1,6 +1,28 @@
+from sqlalchemy import text
+from core.db import db, initialize_db, schema_is_current
+
+
 def test_health(client):
     """
     Ensures the /health_check route is working
     """
     response = client.get("/health_check")
-    assert response.text == "Healthy!"
\ No newline at end of file
+    assert response.text == "Healthy!"
+
+def test_initialize_unmigrated_db(app):
+    """
+    Ensures startup skips the default admin and vrf on a database that still
+    needs flask db upgrade, instead of failing on the missing columns
+    """
+    with app.app_context():
+        db.drop_all()
+        db.session.execute(text("CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR, "
+                                "password_hash VARCHAR, apikey VARCHAR, apikey_expiration DATETIME, "
+                                "permission_level INTEGER, user_active BOOLEAN)"))
+        db.session.commit()
+        assert not schema_is_current()
+    assert initialize_db(app, admin_pw="test_key") == "Fail"
+    with app.app_context():
+        assert db.session.execute(text("SELECT count(*) FROM user")).scalar() == 0
+        db.session.execute(text("DROP TABLE user"))
+        db.session.commit()
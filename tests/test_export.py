@@ -0,0 +1,83 @@
+import gzip
+import json
+from threading import Thread
+from app import create_app
+from core.db import db
+from tests.helper import count_queries, create_user, create_vrf, login
+
+
+def test_export(app, client, admin_headers):
+    """
+    tests GET /api/v1/export, plain and gzip compressed
+    """
+    create_vrf(app, "Global")
+    create_vrf(app, "v6")
+    imports = {
+        "supernet": [{"network": "192.168.0.0/16", "name": "pool4"},
+                     {"network": "2001:db8::/32", "name": "pool6", "vrf": "v6"}],
+        "subnet": [{"network": "192.168.0.0/24", "name": "subnet4"},
+                   {"network": "2001:db8::/64", "name": "subnet6", "vrf": "v6"}],
+        "address": [{"address": "192.168.0.1", "name": "host1"},
+                    {"address": "192.168.0.2", "name": "host2"},
+                    {"address": "2001:db8::1", "name": "host3", "vrf": "v6"}],
+    }
+    for kind, rows in imports.items():
+        response = client.post(f"/api/v1/import/{kind}", headers=admin_headers,
+                               data="\n".join(json.dumps(row) for row in rows))
+        assert response.json.get("status") == "Success"
+
+    with count_queries(app) as statements:
+        response = client.get("/api/v1/export", headers=admin_headers)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    # One query per level, plus the snapshot's BEGIN, the apikey was cached by the imports
+    assert len(statements) == 5
+    assert [line["type"] for line in lines] == ["vrf"] * 2 + ["supernet"] * 2 + ["subnet"] * 2 + ["address"] * 3
+    assert lines[-1] == {"type": "address", "id": 3, "vrf_id": 2, "subnet_id": 2, "name": "host3",
+                         "address": "2001:db8::1", "mac_address": "FFFFFFFFFFFF", "vrf": "v6"}
+    assert lines[4] == {"type": "subnet", "id": 1, "vrf_id": 1, "supernet_id": 1, "name": "subnet4",
+                        "network": "192.168.0.0/24", "vrf": "Global"}
+
+    response = client.get("/api/v1/export?compress=gzip", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert [json.loads(line) for line in gzip.decompress(response.get_data()).splitlines()] == lines
+
+
+def test_export_does_not_block_writes(tmp_path, headers):
+    """
+    tests writes go through while an export stream holds its snapshot open
+    """
+    app = create_app(environment="test", config={
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'ipam.db'}",
+        "SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 1}},
+        "STREAM_CHUNK_SIZE": 1,
+    })
+    with app.app_context():
+        db.create_all()
+    for vrfname in ["vrf_a", "vrf_b", "vrf_c"]:
+        create_vrf(app, vrfname)
+    create_user(app, username="test_admin", permission_level=15, user_active=True)
+    client = app.test_client()
+    headers["X-Ipam-Apikey"] = login(client, headers, username="test_admin", password="test_admin")
+
+    export = client.get("/api/v1/export", headers=headers, buffered=False)
+    chunks = iter(export.response)
+    assert json.loads(next(chunks))["name"] == "Global"
+
+    # from another thread, like another worker, the stream's context is still current on this one
+    responses = []
+    writer = Thread(target=lambda: responses.append(
+        app.test_client().post("/api/v1/vrf", headers=headers, json={"name": "vrf_d"})))
+    writer.start()
+    writer.join()
+    assert responses[0].status_code == 200
+
+    # the export keeps reading its snapshot, without the vrf created since
+    lines = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    export.close()
+    assert [line["name"] for line in lines] == ["vrf_a", "vrf_b", "vrf_c"]
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
@@ -1,6 +1,8 @@
 from tests.helper import create_address, create_subnet, create_supernet, create_vrf
 from core.db import db
 from models.addressmodel import AddressModel
+from models.user import User
+from core.ratelimit import rate_limiter
 
 
 def test_usable_address(app, client, admin_headers):
@@ -69,4 +71,293 @@ def test_usable_subnet(app, client, admin_headers):
                  "/api/v1/rpc/getUsableSubnet?network=192.168.0.0/16&vrf=Global&cidr_length=25&all=true"]:
         response = client.get(path, headers=admin_headers)
         #508 /25 subnets available in the original /16
-        assert len(response.json.get("data").get("all_usable")) == 508
\ No newline at end of file
+        assert len(response.json.get("data").get("all_usable")) == 508
+
+    response = client.get("/api/v1/rpc/getUsableSubnet?name=no_such_supernet&cidr_length=24", headers=admin_headers)
+    assert response.status_code == 404
+    assert response.json.get("errors") == ["Unable to find requested supernet"]
+
+def test_usable_address_index_updates(app, client, admin_headers):
+    """
+    tests that /api/v1/rpc/getUsableAddresses tracks addresses created and
+    deleted through /api/v1/address after the subnet has been indexed
+    """
+    create_subnet(app, name="test_index_updates", network="192.168.0.0/29")
+    path = "/api/v1/rpc/getUsableAddresses?name=test_index_updates"
+    response = client.get(path, headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "192.168.0.1"
+    assert response.json.get("data").get("percent_utilized") == 0
+
+    client.post("/api/v1/address", headers=admin_headers,
+                json={"address": "192.168.0.1", "name": "index1", "vrf": "Global"})
+    client.post("/api/v1/address", headers=admin_headers,
+                json={"address": "192.168.0.3", "name": "index3", "vrf": "Global"})
+    response = client.get(path, headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "192.168.0.2"
+    assert response.json.get("data").get("all_usable") == [
+        "192.168.0.2", "192.168.0.4", "192.168.0.5", "192.168.0.6"]
+    assert response.json.get("data").get("percent_utilized") == 33
+
+    client.delete("/api/v1/address?name=index1", headers=admin_headers)
+    response = client.get(path, headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "192.168.0.1"
+    assert len(response.json.get("data").get("all_usable")) == 5
+
+
+def test_usable_address_ranges_and_paging(app, client, admin_headers):
+    """
+    tests format=ranges, limit and cursor on /api/v1/rpc/getUsableAddresses
+    """
+    create_address(app, address="192.168.0.3", name="test_ranges_address1")
+    create_address(app, address="192.168.0.10", name="test_ranges_address2")
+    path = "/api/v1/rpc/getUsableAddresses?name=test_subnet"
+    response = client.get(f"{path}&format=ranges", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json.get("data").get("usable_ranges") == [
+        ["192.168.0.1", "192.168.0.2"],
+        ["192.168.0.4", "192.168.0.9"],
+        ["192.168.0.11", "192.168.0.254"]]
+    assert not response.json.get("data").get("all_usable")
+
+    response = client.get(f"{path}&format=ranges&limit=1&cursor=192.168.0.5", headers=admin_headers)
+    assert response.json.get("data").get("usable_ranges") == [["192.168.0.6", "192.168.0.9"]]
+    assert response.json.get("data").get("next_cursor") == "192.168.0.9"
+
+    response = client.get(f"{path}&limit=3", headers=admin_headers)
+    assert response.json.get("data").get("all_usable") == ["192.168.0.1", "192.168.0.2", "192.168.0.4"]
+    cursor = response.json.get("data").get("next_cursor")
+    response = client.get(f"{path}&limit=3&cursor={cursor}", headers=admin_headers)
+    assert response.json.get("data").get("all_usable") == ["192.168.0.5", "192.168.0.6", "192.168.0.7"]
+
+
+def test_usable_subnet_ranges_and_paging(app, client, admin_headers):
+    """
+    tests format=ranges, limit and cursor on /api/v1/rpc/getUsableSubnet
+    """
+    create_subnet(app, name="test_ranges_subnet1", supernet_name="test_ranges_subnet",
+                  network="192.168.1.0/24", supernet_network="192.168.0.0/16")
+    path = "/api/v1/rpc/getUsableSubnet?name=test_ranges_subnet&cidr_length=24"
+    response = client.get(f"{path}&format=ranges", headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "192.168.0.0/24"
+    assert response.json.get("data").get("usable_ranges") == [
+        ["192.168.0.0/24", "192.168.0.0/24"],
+        ["192.168.2.0/24", "192.168.255.0/24"]]
+
+    response = client.get(f"{path}&all=true&limit=2&cursor=192.168.0.0/24", headers=admin_headers)
+    assert response.json.get("data").get("all_usable") == ["192.168.2.0/24", "192.168.3.0/24"]
+    assert response.json.get("data").get("next_cursor") == "192.168.3.0/24"
+
+
+def test_usable_subnet_fit_and_updates(app, client, admin_headers):
+    """
+    tests first/best fit on /api/v1/rpc/getUsableSubnet and that the
+    allocator tracks subnets created and deleted through /api/v1/subnet
+    """
+    create_subnet(app, name="test_fit_subnet1", supernet_name="test_fit_subnet",
+                  network="10.0.0.0/26", supernet_network="10.0.0.0/24")
+    create_subnet(app, name="test_fit_subnet2", supernet_name="test_fit_subnet",
+                  network="10.0.0.128/25", supernet_network="10.0.0.0/24")
+    create_subnet(app, name="test_fit_subnet3", supernet_name="test_fit_subnet",
+                  network="10.0.0.96/28", supernet_network="10.0.0.0/24")
+    path = "/api/v1/rpc/getUsableSubnet?name=test_fit_subnet&cidr_length=28"
+    response = client.get(path, headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "10.0.0.64/28"
+    response = client.get(f"{path}&fit=best", headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "10.0.0.112/28"
+
+    client.post("/api/v1/subnet", headers=admin_headers,
+                json={"name": "test_fit_subnet4", "network": "10.0.0.64/27", "vrf": "Global"})
+    response = client.get(path, headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "10.0.0.112/28"
+
+    client.delete("/api/v1/subnet?name=test_fit_subnet1", headers=admin_headers)
+    response = client.get(path, headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "10.0.0.0/28"
+
+
+def test_allocate_address(app, client, admin_headers):
+    """
+    tests the POST method of /api/v1/rpc/allocateAddress
+    Should create the next free address and fail once the subnet is depleted
+    """
+    create_address(app, address="192.168.0.1", name="test_allocate_address1",
+                   subnet_network="192.168.0.0/29")
+    path = "/api/v1/rpc/allocateAddress?name=test_subnet"
+    response = client.post(path, headers=admin_headers,
+                           json={"name": "allocated1", "mac_address": "d34db33fd34d"})
+    assert response.status_code == 200
+    assert response.json.get("data").get("address") == "192.168.0.2"
+    assert response.json.get("data").get("subnet") == "192.168.0.0/29"
+    assert response.json.get("data").get("mac_address") == "d34db33fd34d"
+
+    # Address taken behind the index's back, allocation should skip it
+    create_address(app, address="192.168.0.3", name="test_allocate_address3",
+                   subnet_network="192.168.0.0/29")
+    response = client.post(path, headers=admin_headers, json={"name": "allocated2"})
+    assert response.json.get("data").get("address") == "192.168.0.4"
+
+    response = client.post(path, headers=admin_headers, json={"name": "allocated2"})
+    assert response.status_code == 409
+
+    for name in ["allocated3", "allocated4"]:
+        response = client.post(path, headers=admin_headers, json={"name": name})
+        assert response.status_code == 200
+    response = client.post(path, headers=admin_headers, json={"name": "allocated5"})
+    assert response.status_code == 409
+    assert response.json.get("status") == "Failed"
+
+
+def test_allocate_addresses(app, client, admin_headers):
+    """
+    tests the POST method of /api/v1/rpc/allocateAddresses
+    """
+    create_address(app, address="192.168.0.2", name="test_allocate_addresses1")
+    path = "/api/v1/rpc/allocateAddresses?name=test_subnet"
+    response = client.post(path, headers=admin_headers, json={"names": ["bulk1", "bulk2", "bulk3"]})
+    assert response.status_code == 200
+    allocated = response.json.get("data").get("allocated")
+    assert [address.get("address") for address in allocated] == ["192.168.0.1", "192.168.0.3", "192.168.0.4"]
+    assert [address.get("name") for address in allocated] == ["bulk1", "bulk2", "bulk3"]
+
+    create_address(app, address="192.168.0.6", name="test_allocate_addresses2")
+    response = client.post(path, headers=admin_headers,
+                           json={"count": 3, "name_prefix": "rack1", "contiguous": True})
+    allocated = response.json.get("data").get("allocated")
+    assert [address.get("address") for address in allocated] == ["192.168.0.7", "192.168.0.8", "192.168.0.9"]
+    assert allocated[0].get("name") == "rack1-192.168.0.7"
+
+    response = client.post(path, headers=admin_headers, json={"count": 300, "name_prefix": "toomany"})
+    assert response.status_code == 409
+
+
+def test_allocate_subnets(app, client, admin_headers):
+    """
+    tests the POST method of /api/v1/rpc/allocateSubnets
+    """
+    create_subnet(app, name="test_allocate_subnets1", supernet_name="test_allocate_subnets",
+                  network="10.0.0.0/31", supernet_network="10.0.0.0/24")
+    path = "/api/v1/rpc/allocateSubnets?name=test_allocate_subnets"
+    response = client.post(path, headers=admin_headers,
+                           json={"cidr_length": 31, "count": 2, "name_prefix": "p2p"})
+    assert response.status_code == 200
+    allocated = response.json.get("data").get("allocated")
+    assert [subnet.get("network") for subnet in allocated] == ["10.0.0.2/31", "10.0.0.4/31"]
+    assert allocated[0].get("name") == "p2p-10.0.0.2/31"
+
+    response = client.post(path, headers=admin_headers,
+                           json={"cidr_length": 31, "names": ["a", "b", "c"], "contiguous": True})
+    allocated = response.json.get("data").get("allocated")
+    assert [subnet.get("network") for subnet in allocated] == ["10.0.0.8/31", "10.0.0.10/31", "10.0.0.12/31"]
+
+    response = client.get("/api/v1/rpc/getUsableSubnet?name=test_allocate_subnets&cidr_length=31",
+                          headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "10.0.0.6/31"
+
+
+def test_utilization_report(app, client, admin_headers):
+    """
+    tests the GET method of /api/v1/rpc/utilization
+    """
+    create_address(app, address="192.168.0.1", name="test_utilization1", subnet_network="192.168.0.0/30")
+    create_address(app, address="192.168.0.2", name="test_utilization2", subnet_network="192.168.0.0/30")
+    create_subnet(app, name="test_utilization_subnet", network="192.168.1.0/24")
+    create_address(app, address="192.168.1.1", name="test_utilization3",
+                   subnet_network="192.168.1.0/24", subnet_name="test_utilization_subnet")
+
+    response = client.get("/api/v1/rpc/utilization", headers=admin_headers)
+    assert response.status_code == 200
+    data = response.json.get("data")
+    assert [subnet.get("percent_utilized") for subnet in data.get("subnets")] == [100, 0]
+    assert data.get("subnets")[0].get("network") == "192.168.0.0/30"
+    assert data.get("supernets")[0].get("used") == 3
+    assert data.get("supernets")[0].get("capacity") == 256
+    assert data.get("supernets")[0].get("subnet_count") == 2
+    assert data.get("vrfs")[0].get("name") == "Global"
+    assert data.get("vrfs")[0].get("used") == 3
+
+    response = client.get("/api/v1/rpc/utilization?level=subnet&min_percent=90", headers=admin_headers)
+    data = response.json.get("data")
+    assert [subnet.get("name") for subnet in data.get("subnets")] == ["test_subnet"]
+    assert data.get("vrfs") is None
+
+    response = client.get("/api/v1/rpc/utilization?level=subnet&sort=name&order=asc&vrf=Global",
+                          headers=admin_headers)
+    assert [subnet.get("name") for subnet in response.json.get("data").get("subnets")] == [
+        "test_subnet", "test_utilization_subnet"]
+
+
+def test_ipv6_allocation(app, client, admin_headers):
+    """
+    tests the RPCs against an IPv6 /32 supernet and /64 subnet, alongside IPv4 in the same vrf
+    """
+    create_address(app, address="10.0.0.1", name="test_ipv6_v4", subnet_network="10.0.0.0/24",
+                   supernet_network="10.0.0.0/16")
+    create_subnet(app, name="test_ipv6_subnet", supernet_name="test_ipv6_supernet",
+                  network="2001:db8::/64", supernet_network="2001:db8::/32")
+    response = client.post("/api/v1/address", headers=admin_headers,
+                           json={"address": "2001:db8::1", "name": "test_ipv6_address1", "vrf": "Global"})
+    assert response.status_code == 200
+
+    path = "/api/v1/rpc/getUsableAddresses?name=test_ipv6_subnet"
+    response = client.get(f"{path}&limit=2", headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "2001:db8::2"
+    assert response.json.get("data").get("all_usable") == ["2001:db8::2", "2001:db8::3"]
+    assert response.json.get("data").get("next_cursor") == "2001:db8::3"
+    response = client.get(f"{path}&format=ranges", headers=admin_headers)
+    assert response.json.get("data").get("usable_ranges") == [["2001:db8::2", "2001:db8::ffff:ffff:ffff:ffff"]]
+
+    response = client.post("/api/v1/rpc/allocateAddress?name=test_ipv6_subnet", headers=admin_headers,
+                           json={"name": "test_ipv6_address2"})
+    assert response.json.get("data").get("address") == "2001:db8::2"
+
+    response = client.get("/api/v1/rpc/getUsableSubnet?name=test_ipv6_supernet&cidr_length=64&all=true&limit=2",
+                          headers=admin_headers)
+    assert response.json.get("data").get("first_usable") == "2001:db8:0:1::/64"
+    assert response.json.get("data").get("all_usable") == ["2001:db8:0:1::/64", "2001:db8:0:2::/64"]
+    response = client.post("/api/v1/rpc/allocateSubnets?name=test_ipv6_supernet", headers=admin_headers,
+                           json={"cidr_length": 48, "count": 2, "name_prefix": "site"})
+    allocated = response.json.get("data").get("allocated")
+    assert [subnet.get("network") for subnet in allocated] == ["2001:db8:1::/48", "2001:db8:2::/48"]
+
+    response = client.post("/api/v1/subnet", headers=admin_headers,
+                           json={"name": "test_ipv6_overlap", "network": "2001:db8::/56", "vrf": "Global"})
+    assert response.status_code == 409
+    response = client.get("/api/v1/subnet?name=test_ipv6_subnet", headers=admin_headers)
+    assert response.json.get("data").get("used_count") == 2
+    # past BigInteger, and only approximate on SQLite
+    assert response.json.get("data").get("capacity") > 2 ** 63
+
+
+def test_rate_limits(app, client, admin_headers):
+    """
+    tests expensive RPCs take their cost from the caller's token bucket, and that
+    callers over their opt-in rate or concurrency limit get a 429 with Retry-After
+    """
+    create_supernet(app, name="test_rate_limit", network="192.168.0.0/16")
+    app.config["RATE_LIMITS"] = {0: (0.5, 10)}
+    path = "/api/v1/rpc/getUsableSubnet?name=test_rate_limit&cidr_length=24"
+    assert client.get(f"{path}&all=true", headers=admin_headers).status_code == 200
+    assert client.get(f"{path}&all=true", headers=admin_headers).status_code == 200
+    response = client.get(f"{path}&all=true", headers=admin_headers)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 9
+
+    app.config["RATE_LIMITS"] = {}
+    app.config["CONCURRENCY_LIMITS"] = {0: 1}
+    with app.app_context():
+        user_id = db.session.query(User).filter_by(username="test_admin").first().id
+        limiter = rate_limiter()
+        assert limiter.acquire(user_id, 15, 1, app.config) is None
+    assert client.get(path, headers=admin_headers).status_code == 429
+    limiter.release(user_id)
+    assert client.get(path, headers=admin_headers).status_code == 200
+    assert limiter.stats() == {"active": 0, "rate_limited": 1, "concurrency_limited": 1}
+
+    # A stream holds its slot until it is closed, not just until the view returns
+    stream = client.get("/api/v1/supernet?format=ndjson", headers=admin_headers, buffered=False)
+    assert stream.status_code == 200
+    assert client.get(path, headers=admin_headers).status_code == 429
+    assert b"test_rate_limit" in b"".join(stream.response)
+    stream.close()
+    assert limiter.stats()["active"] == 0
+    assert client.get(path, headers=admin_headers).status_code == 200
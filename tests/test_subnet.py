@@ -1,6 +1,9 @@
-from tests.helper import create_supernet, create_subnet
+from flask_restx import marshal
+from tests.helper import count_queries, create_supernet, create_subnet
 from core.db import db
+from core.serializers import compile_serializer
 from models.subnetmodel import SubnetModel
+from routes.subnet import Subnet
 
 def test_subnet_creation(app, client, admin_headers):
     """
@@ -108,3 +111,71 @@ def test_delete_subnet_name(app, client, admin_headers):
     assert response.json.get("status") == "Success"
     with app.app_context():
         assert not db.session.query(SubnetModel).filter_by(name="test_delete_subnet_name").first()
+
+def test_subnet_utilization_counters(app, client, admin_headers):
+    """
+    tests that used_count and capacity on subnets and supernets follow
+    address and subnet creation and deletion
+    """
+    create_supernet(app, name="test_counters_supernet", network="10.2.0.0/16")
+    client.post("/api/v1/subnet", headers=admin_headers,
+                json={"name": "test_counters", "vrf": "Global", "network": "10.2.0.0/24"})
+    for host in range(1, 4):
+        client.post("/api/v1/address", headers=admin_headers,
+                    json={"name": f"test_counters{host}", "vrf": "Global", "address": f"10.2.0.{host}"})
+    client.delete("/api/v1/address?name=test_counters3", headers=admin_headers)
+
+    response = client.get("/api/v1/subnet?name=test_counters", headers=admin_headers)
+    assert response.json.get("data").get("used_count") == 2
+    assert response.json.get("data").get("capacity") == 254
+    assert response.json.get("data").get("percent_utilized") == 0
+
+    response = client.get("/api/v1/supernet?name=test_counters_supernet", headers=admin_headers)
+    assert response.json.get("data").get("used_count") == 256
+    assert response.json.get("data").get("capacity") == 65536
+
+    client.delete("/api/v1/subnet?name=test_counters", headers=admin_headers)
+    response = client.get("/api/v1/supernet?name=test_counters_supernet", headers=admin_headers)
+    assert response.json.get("data").get("used_count") == 0
+
+
+def test_get_subnet_query_count(app, client, admin_headers):
+    """
+    GET /api/v1/subnet loads nested vrf and supernet without a query per row
+    the apikey is cached by the warm up request, one query loads the subnets
+    """
+    for octet in range(10):
+        create_subnet(app, name=f"query_count{octet}", network=f"10.{octet}.0.0/24",
+                      supernet_network=f"10.{octet}.0.0/16", supernet_name=f"query_count_supernet{octet}")
+    client.get("/api/v1/subnet", headers=admin_headers)
+    for path in ["/api/v1/subnet", "/api/v1/subnet?id=1", "/api/v1/subnet?name=query_count1"]:
+        with count_queries(app) as statements:
+            response = client.get(path, headers=admin_headers)
+        assert response.status_code == 200
+        assert len(statements) == 1
+
+
+def test_subnet_compiled_serializer(app, client, admin_headers):
+    """
+    the compiled serializer behind GET /api/v1/subnet gives the same output as marshal
+    and error replies are not marshalled into the model
+    """
+    create_subnet(app, name="serialized4", network="10.0.0.0/24", supernet_network="10.0.0.0/16")
+    create_subnet(app, name="serialized6", network="2001:db8::/64", supernet_network="2001:db8::/32",
+                  supernet_name="serialized_supernet6")
+    serialize = compile_serializer(Subnet.subnet_out_model)
+    with app.app_context():
+        for subnet in db.session.query(SubnetModel).all() + [None]:
+            assert serialize(subnet) == marshal(subnet, Subnet.subnet_out_model)
+
+    response = client.get("/api/v1/subnet", headers=admin_headers)
+    assert response.status_code == 200
+    # Past 64 bits, which orjson can't encode
+    assert response.json.get("data")[1].get("capacity") > 2**63
+
+    response = client.get("/api/v1/subnet", headers={"X-Ipam-Apikey": "not a key"})
+    assert response.status_code == 401
+    assert response.json.get("errors")
+
+    response = client.get("/swagger.json")
+    assert "application/json" in response.json.get("produces")
@@ -1,4 +1,5 @@
-from tests.helper import create_vrf, create_supernet
+import json
+from tests.helper import count_queries, create_vrf, create_supernet, create_subnet
 from models.supernetmodel import SupernetModel
 from core.db import db
 
@@ -95,4 +96,33 @@ def test_delete_supernet(app, client, admin_headers):
     assert response.status_code == 200
     assert response.json.get("status") == "Success"
     with app.app_context():
-        assert not db.session.query(SupernetModel).filter_by(name="get_supernet_test2").first()
\ No newline at end of file
+        assert not db.session.query(SupernetModel).filter_by(name="get_supernet_test2").first()
+
+def test_get_supernet_query_count(app, client, admin_headers):
+    """
+    GET /api/v1/supernet loads nested vrf and subnets without a query per row
+    the apikey is cached by the warm up request, one query loads the supernets and vrfs, one loads every subnet
+    """
+    for octet in range(10):
+        create_subnet(app, name=f"query_count{octet}", network=f"10.{octet}.0.0/24",
+                      supernet_network=f"10.{octet}.0.0/16", supernet_name=f"query_count_supernet{octet}")
+    client.get("/api/v1/supernet", headers=admin_headers)
+    for path in ["/api/v1/supernet", "/api/v1/supernet?id=1", "/api/v1/supernet?name=query_count_supernet1"]:
+        with count_queries(app) as statements:
+            response = client.get(path, headers=admin_headers)
+        assert response.status_code == 200
+        assert len(statements) == 2
+
+
+def test_get_supernet_ndjson_stream(app, client, admin_headers):
+    """
+    tests format=ndjson on GET /api/v1/supernet, subnets are still nested per row
+    """
+    for octet in range(3):
+        create_subnet(app, name=f"stream{octet}", network=f"10.{octet}.0.0/24",
+                      supernet_network=f"10.{octet}.0.0/16", supernet_name=f"stream_supernet{octet}")
+    response = client.get("/api/v1/supernet?format=ndjson", headers=admin_headers)
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row.get("name") for row in rows] == [f"stream_supernet{octet}" for octet in range(3)]
+    assert [subnet.get("name") for subnet in rows[2].get("subnets")] == ["stream2"]
@@ -1,6 +1,8 @@
 from models.vrfmodel import VRFModel
 from models.supernetmodel import SupernetModel
-from tests.helper import create_user, login, create_vrf, create_supernet
+from models.subnetmodel import SubnetModel
+from models.addressmodel import AddressModel
+from tests.helper import count_queries, create_user, login, create_vrf, create_supernet, create_subnet
 from core.db import db
 
 
@@ -115,3 +117,60 @@ def test_supernet_relationship(app, client, admin_headers):
         assert db.session.query(SupernetModel).filter_by(network="192.168.1.0/24").first()
         response = client.delete(f"{path}?id=2", headers=admin_headers)
         assert not db.session.query(SupernetModel).filter_by(network="192.168.1.0/24").first()
+
+
+def test_get_vrf_query_count(app, client, admin_headers):
+    """
+    GET /api/v1/vrf loads nested supernets without a query per vrf
+    the apikey is cached by the warm up request, one query loads the vrfs, one loads every supernet
+    """
+    for octet in range(10):
+        create_supernet(app, name=f"query_count{octet}", network=f"10.{octet}.0.0/16",
+                        vrfname=f"query_count_vrf{octet}")
+    client.get("/api/v1/vrf", headers=admin_headers)
+    for path in ["/api/v1/vrf", "/api/v1/vrf?id=1", "/api/v1/vrf?name=Global"]:
+        with count_queries(app) as statements:
+            response = client.get(path, headers=admin_headers)
+        assert response.status_code == 200
+        assert len(statements) == 2
+
+
+def test_delete_vrf_cascade(app, client, admin_headers):
+    """
+    DELETE /api/v1/vrf removes the vrf's supernets, subnets and addresses in the db
+    with a fixed number of statements, however many rows hang off the vrf
+    """
+    create_subnet(app, name="cascade_subnet", network="10.0.0.0/24",
+                  supernet_network="10.0.0.0/16", vrfname="cascade_vrf")
+    with app.app_context():
+        subnet = db.session.query(SubnetModel).filter_by(name="cascade_subnet").first()
+        vrf_id = subnet.vrf_id
+        db.session.add_all([AddressModel(name=f"cascade{host}", address=f"10.0.0.{host}",
+                                         vrf_id=vrf_id, subnet_id=subnet.id) for host in range(1, 201)])
+        db.session.commit()
+    with count_queries(app) as statements:
+        response = client.delete("/api/v1/vrf?name=cascade_vrf", headers=admin_headers)
+    assert response.status_code == 200
+    assert len(statements) == 3
+    with app.app_context():
+        assert not db.session.query(SupernetModel).filter_by(vrf_id=vrf_id).count()
+        assert not db.session.query(SubnetModel).filter_by(vrf_id=vrf_id).count()
+        assert not db.session.query(AddressModel).filter_by(vrf_id=vrf_id).count()
+
+
+def test_get_vrf_pages(app, client, admin_headers):
+    """
+    tests keyset pages of GET /api/v1/vrf ordered by name
+    """
+    for vrfname in ["vrf_c", "vrf_a", "vrf_b"]:
+        create_vrf(app, vrfname=vrfname)
+    response = client.get("/api/v1/vrf?order=name&limit=2", headers=admin_headers)
+    assert [vrf.get("name") for vrf in response.json.get("data")] == ["Global", "vrf_a"]
+    cursor = response.headers.get("X-Next-Cursor")
+    response = client.get(f"/api/v1/vrf?limit=2&after={cursor}", headers=admin_headers)
+    assert [vrf.get("name") for vrf in response.json.get("data")] == ["vrf_b", "vrf_c"]
+    assert not response.headers.get("X-Next-Cursor")
+
+    # a cursor's order must be one the endpoint supports, subnets can not be ordered by name
+    response = client.get(f"/api/v1/subnet?after={cursor}", headers=admin_headers)
+    assert response.status_code == 400